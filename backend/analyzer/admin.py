@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import NutritionCacheEntry, Recipe
+
+
+@admin.register(NutritionCacheEntry)
+class NutritionCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('food_name', 'found', 'created_at', 'last_used_at')
+    search_fields = ('food_name',)
+
+
+@admin.register(Recipe)
+class RecipeAdmin(admin.ModelAdmin):
+    list_display = ('title', 'category', 'created_at')
+    list_filter = ('category',)
+    search_fields = ('title', 'description')
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AnalyzerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analyzer'
+
+    def ready(self):
+        # Web workers opt in, so management commands and tests never load the model.
+        if settings.ANALYZER_WARMUP_ON_STARTUP:
+            from .classifier import image_classifier_loader
+
+            image_classifier_loader.start_background_warm_up()
@@ -0,0 +1,89 @@
+import re
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+
+from .models import Recipe
+
+RECIPE_SEARCH_TABLE = "analyzer_recipe_fts"
+
+
+def recipe_to_dict(recipe):
+    """Same shape the LLM returns and the frontend renders."""
+    return {"id": recipe.pk, "title": recipe.title, "description": recipe.description, "image": recipe.image}
+
+
+def catalog_recipes(category):
+    """Returns the catalogued recipes for a normalized category (empty if never seen)."""
+    return [recipe_to_dict(recipe) for recipe in Recipe.objects.filter(category=category)]
+
+
+def catalog_entry(category):
+    """Returns (recipes, Unix time they were generated) for a normalized category, or None if never seen."""
+    recipes = list(Recipe.objects.filter(category=category))
+    if not recipes:
+        return None
+    return [recipe_to_dict(recipe) for recipe in recipes], min(recipe.created_at for recipe in recipes).timestamp()
+
+
+def save_catalog_recipes(category, recipes):
+    """Replaces the catalog entries of a normalized category with freshly generated recipes."""
+    with transaction.atomic():
+        Recipe.objects.filter(category=category).delete()
+        Recipe.objects.bulk_create([
+            Recipe(
+                category=category,
+                title=str(recipe.get("title", ""))[:255],
+                description=str(recipe.get("description", "")),
+                image=str(recipe.get("image") or recipe.get("image_url") or recipe.get("imageUrl") or "")[:1000],
+            )
+            for recipe in recipes
+            if isinstance(recipe, dict) and recipe.get("title")
+        ])
+
+
+def _fts_query(query):
+    # Quote every word so user input cannot inject FTS syntax; `*` allows prefix matches.
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+
+
+def search_recipes(query="", category=None, limit=50):
+    """
+    Full-text search over title and description, optionally within one category.
+    Uses the FTS5 index on SQLite (best matches first, weighting title matches
+    over description matches) and icontains elsewhere.
+    """
+    recipes = Recipe.objects.all()
+    if category:
+        recipes = recipes.filter(category=category)
+    match = _fts_query(query or "")
+    if not match:
+        return list(recipes[:limit])
+
+    if connection.vendor == 'sqlite':
+        sql = (
+            f"SELECT r.id FROM {RECIPE_SEARCH_TABLE} f JOIN {Recipe._meta.db_table} r ON r.id = f.rowid "
+            f"WHERE {RECIPE_SEARCH_TABLE} MATCH %s"
+        )
+        params = [match]
+        if category:
+            sql += " AND r.category = %s"
+            params.append(category)
+        # Title matches weigh ten times as much as description matches.
+        sql += f" ORDER BY bm25({RECIPE_SEARCH_TABLE}, 10.0, 1.0) LIMIT %s"
+        params.append(limit)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                ranked_ids = [row[0] for row in cursor.fetchall()]
+        except DatabaseError:
+            ranked_ids = None  # FTS5 unavailable; use the portable filter below.
+        if ranked_ids is not None:
+            by_id = Recipe.objects.in_bulk(ranked_ids)
+            return [by_id[pk] for pk in ranked_ids]
+
+    words = re.findall(r"\w+", query)
+    condition = Q()
+    for word in words:
+        condition &= Q(title__icontains=word) | Q(description__icontains=word)
+    return list(recipes.filter(condition)[:limit])
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def build_image_classifier():
+    """Builds the classifier for the configured backend ("pytorch", "onnx" or "remote")."""
+    backend = settings.ANALYZER_INFERENCE_BACKEND
+    if backend == "remote":
+        from .inference_server import RemoteImageClassifier
+
+        return RemoteImageClassifier.from_settings()
+    if backend == "onnx":
+        from .onnx_backend import OnnxImageClassifier
+
+        return OnnxImageClassifier.from_pretrained(settings.ANALYZER_ONNX_MODEL_PATH, settings.ANALYZER_MODEL_NAME)
+    if backend != "pytorch":
+        raise ValueError(f"Unknown ANALYZER_INFERENCE_BACKEND '{backend}'.")
+
+    # transformers is imported here so that importing the app (migrations,
+    # management commands, tests) does not pay for it.
+    from transformers import pipeline
+
+    return pipeline("image-classification", model=settings.ANALYZER_MODEL_NAME)
+
+
+class ClassifierLoader:
+    """
+    Loads the image classifier on first use instead of at import time.
+    `warm_up` can be run in the background at startup so the first request
+    does not pay for loading the model and its first forward pass.
+
+    After a failed load, `get` returns None without calling the factory again
+    until `retry_after` seconds have passed, so requests do not queue up
+    behind repeated load attempts.
+    """
+
+    def __init__(self, factory, retry_after=30):
+        self.factory = factory
+        self.retry_after = retry_after
+        self.error = None
+        self._model = None
+        self._failed_at = None
+        self._warmed_up = False
+        self._lock = threading.Lock()
+        self._warm_up_thread = None
+
+    @property
+    def is_loaded(self):
+        return self._model is not None
+
+    @property
+    def is_ready(self):
+        # While a background warm-up runs, wait for its dummy pass as well.
+        if self._warmed_up:
+            return True
+        if self._warm_up_thread is not None and self._warm_up_thread.is_alive():
+            return False
+        return self._model is not None
+
+    def _recently_failed(self):
+        return self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_after
+
+    def get(self):
+        """Returns the loaded model, loading it if needed, or None if loading failed."""
+        if self._model is not None:
+            return self._model
+        if self._recently_failed():
+            return None
+        with self._lock:
+            if self._model is None and not self._recently_failed():
+                try:
+                    self._model = self.factory()
+                    self.error = self._failed_at = None
+                    logger.info("Image classifier model loaded.")
+                except Exception as e:
+                    self.error = str(e)
+                    self._failed_at = time.monotonic()
+                    logger.error(f"Failed to load image classifier model: {e}")
+        return self._model
+
+    def warm_up(self):
+        """Loads the model and runs one dummy forward pass to initialise kernels and caches."""
+        model = self.get()
+        if model is None:
+            return False
+        try:
+            model(Image.new("RGB", (224, 224)))
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"Image classifier warm-up pass failed: {e}")
+            return False
+        self._warmed_up = True
+        self.error = None
+        logger.info("Image classifier warmed up.")
+        return True
+
+    def start_background_warm_up(self):
+        """Starts a warm-up thread unless one is running or has already succeeded."""
+        with self._lock:
+            if self._warmed_up or (self._warm_up_thread is not None and self._warm_up_thread.is_alive()):
+                return self._warm_up_thread
+            self._warm_up_thread = threading.Thread(target=self.warm_up, name="image-classifier-warm-up", daemon=True)
+            self._warm_up_thread.start()
+            return self._warm_up_thread
+
+    def status(self):
+        return {"loaded": self.is_loaded, "ready": self.is_ready, "error": self.error}
+
+
+image_classifier_loader = ClassifierLoader(build_image_classifier)
@@ -0,0 +1,86 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+
+def file_digest(uploaded_file):
+    """SHA-256 of the uploaded bytes, read in chunks. Leaves the file rewound."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image, hash_size=8):
+    """
+    Difference hash (dHash): compares neighbouring pixels of a tiny grayscale
+    thumbnail. Re-encoded or resized copies of a photo land within a few bits.
+    """
+    thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = thumbnail.tobytes()
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class AnalysisCache:
+    """
+    Bounded, thread-safe LRU of analysis payloads keyed by the exact file digest,
+    with a fallback match on perceptual hash within `max_distance` bits.
+    """
+
+    def __init__(self, max_entries=512, max_distance=5):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # digest -> (phash, payload)
+        self._lock = threading.Lock()
+
+    def get_exact(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            self._entries.move_to_end(digest)
+            return entry[1]
+
+    def get_similar(self, phash):
+        """Returns the payload of the closest cached image within the threshold, if any."""
+        if self.max_distance < 0:
+            return None
+        with self._lock:
+            best_digest, best_distance = None, self.max_distance + 1
+            for digest, (cached_phash, _) in self._entries.items():
+                distance = hamming_distance(phash, cached_phash)
+                if distance < best_distance:
+                    best_digest, best_distance = digest, distance
+            if best_digest is None:
+                return None
+            self._entries.move_to_end(best_digest)
+            return self._entries[best_digest][1]
+
+    def put(self, digest, phash, payload):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = (phash, payload)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
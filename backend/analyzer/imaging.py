@@ -0,0 +1,52 @@
+from django.conf import settings
+from PIL import Image
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured byte or pixel-count limits."""
+
+
+def load_image(image_file, target_size=None):
+    """
+    Decodes an upload close to `target_size` instead of at full resolution.
+
+    Limits are checked from the file size and the image header before any
+    pixel data is decoded. JPEGs use draft mode, which lets libjpeg scale by
+    1/2, 1/4 or 1/8 while decoding; anything still much larger than the
+    target is shrunk with `reduce`, which is far cheaper than a resample of
+    the full image.
+    """
+    if image_file.size is not None and image_file.size > settings.ANALYZER_MAX_UPLOAD_BYTES:
+        raise ImageTooLargeError(
+            f"Image is {image_file.size} bytes; the limit is {settings.ANALYZER_MAX_UPLOAD_BYTES}."
+        )
+
+    try:
+        image = Image.open(image_file)  # Only reads the header.
+    except Image.DecompressionBombError as e:
+        # Pillow's own guard fires before ours for images far above Image.MAX_IMAGE_PIXELS.
+        raise ImageTooLargeError(str(e)) from e
+    width, height = image.size
+    if width * height > settings.ANALYZER_MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(
+            f"Image is {width}x{height} pixels; the limit is {settings.ANALYZER_MAX_IMAGE_PIXELS} pixels."
+        )
+
+    target_size = target_size or settings.ANALYZER_DECODE_SIZE
+    if image.format == "JPEG":
+        image.draft("RGB", (target_size, target_size))
+
+    factor = min(image.width // target_size, image.height // target_size)
+    if factor >= 2:
+        size = (image.width // factor, image.height // factor)
+        if image.mode in ("P", "PA"):
+            # Palette indices cannot be averaged; pick pixels before expanding the palette to RGB.
+            image = image.resize(size, Image.NEAREST)
+        else:
+            if image.mode == "1":
+                image = image.convert("L")  # Same one byte per pixel, but reduce() supports it.
+            elif image.mode not in ("L", "LA", "RGB", "RGBA", "CMYK", "YCbCr", "I", "F"):
+                # reduce() does not support 16-bit images.
+                image = image.convert("RGB")
+            image = image.reduce(factor)
+    return image.convert("RGB")
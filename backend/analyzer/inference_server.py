@@ -0,0 +1,248 @@
+"""
+Out-of-process inference for the food classifier.
+
+One `InferenceServer` process owns the model and listens on a Unix socket
+(`manage.py run_inference_server`). Web workers use `RemoteImageClassifier`,
+which preprocesses images locally, places the pixel tensor in a shared-memory
+block and sends only its name, shape and dtype over the socket. The server
+maps the block without copying, batches concurrent requests into one forward
+pass and answers with pipeline-style predictions. Model memory is then paid
+once per box instead of once per web worker.
+
+Messages are single JSON lines in both directions:
+    {"op": "ping"}                                       -> {"ok": true}
+    {"op": "classify", "shm": ..., "shape": [...],
+     "dtype": "float32", "top_k": 5}                     -> {"predictions": [[...], ...]}
+Any failure is answered with {"error": "..."}.
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from pants_backend.batching import MicroBatcher
+from .onnx_backend import top_k_predictions
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceServerError(RuntimeError):
+    """Raised on the client when the inference server is unreachable or reports an error."""
+
+
+def attach_shared_memory(name):
+    """Attaches to a block created by a client without taking ownership of it."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    # Before 3.13 attaching registers the block with this process's resource
+    # tracker, which would unlink it on exit. The client owns and unlinks it.
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# --- Server ---
+class TorchPixelClassifier:
+    """Runs the PyTorch model directly on preprocessed pixel tensors."""
+
+    def __init__(self, model_name, top_k=5):
+        import torch
+        from transformers import AutoModelForImageClassification
+
+        self.torch = torch
+        self.model = AutoModelForImageClassification.from_pretrained(model_name).eval()
+        self.id2label = self.model.config.id2label
+        self.top_k = top_k
+
+    def predict(self, pixel_values, top_k=None):
+        with self.torch.inference_mode():
+            logits = self.model(pixel_values=self.torch.from_numpy(pixel_values)).logits.numpy()
+        return top_k_predictions(logits, self.id2label, top_k or self.top_k)
+
+
+def build_pixel_classifier(backend, model_name, onnx_model_path=None):
+    """Builds a model exposing `predict(pixel_values, top_k)` for the server."""
+    if backend == "onnx":
+        from .onnx_backend import OnnxImageClassifier
+
+        return OnnxImageClassifier.from_pretrained(onnx_model_path, model_name)
+    if backend == "pytorch":
+        return TorchPixelClassifier(model_name)
+    raise ValueError(f"Unknown inference server backend '{backend}'.")
+
+
+class InferenceRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.handle_message(json.loads(line))
+            except Exception as e:
+                logger.error(f"Inference request failed: {e}")
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, classifier, max_batch_size=8, max_wait=0.01):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # Stale socket from a previous run.
+        super().__init__(socket_path, InferenceRequestHandler)
+        self.socket_path = socket_path
+        self.classifier = classifier
+        # Requests from different web workers arrive on different connections;
+        # the batcher merges them into one forward pass.
+        self.batcher = MicroBatcher(
+            self.predict_batch, max_batch_size=max_batch_size, max_wait=max_wait, name="inference-server-batcher"
+        )
+
+    def predict_batch(self, items):
+        arrays = [pixel_values for pixel_values, _ in items]
+        top_k = max(k for _, k in items)
+        batch = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+        predictions = self.classifier.predict(batch, top_k=top_k)
+        results, offset = [], 0
+        for pixel_values, k in items:
+            results.append([row[:k] for row in predictions[offset:offset + len(pixel_values)]])
+            offset += len(pixel_values)
+        return results
+
+    def handle_message(self, message):
+        op = message.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op != "classify":
+            return {"error": f"Unknown op '{op}'."}
+        shm = attach_shared_memory(message["shm"])
+        try:
+            # The view is handed straight to the batcher so this frame holds no
+            # reference to it once the prediction is back and the block is closed.
+            predictions = self.batcher((
+                np.ndarray(tuple(message["shape"]), dtype=np.dtype(message["dtype"]), buffer=shm.buf),
+                int(message.get("top_k", 5)),
+            ))
+        finally:
+            try:
+                shm.close()
+            except BufferError:
+                # A failed batch can keep the view alive through its traceback;
+                # the mapping is released once that is garbage collected.
+                logger.warning(f"Shared memory block {message['shm']} still referenced; deferring close.")
+        return {"predictions": predictions}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+# --- Client ---
+class RemoteImageClassifier:
+    """
+    Pipeline-compatible classifier backed by the inference server. Only the
+    image processor is loaded in the web worker.
+    """
+
+    def __init__(self, socket_path, image_processor, timeout=30.0, top_k=5):
+        self.socket_path = socket_path
+        self.image_processor = image_processor
+        self.timeout = timeout
+        self.top_k = top_k
+        self._local = threading.local()
+
+    @classmethod
+    def from_settings(cls):
+        from django.conf import settings
+        from transformers import AutoImageProcessor
+
+        client = cls(
+            settings.ANALYZER_INFERENCE_SOCKET,
+            AutoImageProcessor.from_pretrained(settings.ANALYZER_MODEL_NAME),
+            timeout=settings.ANALYZER_INFERENCE_TIMEOUT,
+        )
+        client.ping()
+        return client
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            conn = (sock, sock.makefile("rwb"))
+            self._local.conn = conn
+        return conn
+
+    def _close_connection(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()  # Flushes any unsent bytes, which fails on a dead connection.
+            except OSError:
+                pass
+            conn[0].close()
+
+    def _request(self, message):
+        payload = json.dumps(message).encode() + b"\n"
+        for attempt in range(2):
+            try:
+                _, stream = self._connection()
+                stream.write(payload)
+                stream.flush()
+                break
+            except (ConnectionRefusedError, FileNotFoundError, BrokenPipeError, ConnectionResetError) as e:
+                # The request never reached the server (it may have restarted); reconnect once before giving up.
+                self._close_connection()
+                if attempt:
+                    raise InferenceServerError(f"Inference server at {self.socket_path} unavailable: {e}") from e
+            except OSError as e:
+                self._close_connection()
+                raise InferenceServerError(f"Inference server at {self.socket_path} unavailable: {e}") from e
+        try:
+            # Not retried: the server already has the request, so a retry would run the batch twice.
+            line = stream.readline()
+        except OSError as e:
+            self._close_connection()
+            raise InferenceServerError(f"No reply from the inference server at {self.socket_path}: {e}") from e
+        if not line:
+            self._close_connection()
+            raise InferenceServerError(f"Inference server at {self.socket_path} closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise InferenceServerError(response["error"])
+        return response
+
+    def ping(self):
+        return self._request({"op": "ping"})
+
+    def __call__(self, images, batch_size=None, top_k=None):
+        single = not isinstance(images, (list, tuple))
+        batch = [images] if single else list(images)
+        pixel_values = np.ascontiguousarray(
+            self.image_processor(images=batch, return_tensors="np")["pixel_values"], dtype=np.float32
+        )
+        shm = shared_memory.SharedMemory(create=True, size=pixel_values.nbytes)
+        try:
+            np.ndarray(pixel_values.shape, dtype=pixel_values.dtype, buffer=shm.buf)[:] = pixel_values
+            response = self._request({
+                "op": "classify",
+                "shm": shm.name,
+                "shape": list(pixel_values.shape),
+                "dtype": pixel_values.dtype.str,
+                "top_k": top_k or self.top_k,
+            })
+        finally:
+            shm.close()
+            shm.unlink()
+        predictions = response["predictions"]
+        return predictions[0] if single else predictions
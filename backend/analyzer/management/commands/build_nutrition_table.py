@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analyzer.nutrition import (
+    NutritionLookupError,
+    classifier_labels,
+    fetch_usda_nutrition,
+    normalize_food_name,
+    write_nutrition_table,
+)
+
+
+class Command(BaseCommand):
+    help = "Resolves every classifier label against USDA once and writes the offline nutrition table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help="Where to write the table. Defaults to NUTRITION_TABLE_PATH.")
+
+    def handle(self, *args, **options):
+        if not settings.USDA_API_KEY:
+            raise CommandError("USDA_API_KEY is not configured.")
+        try:
+            labels = classifier_labels()
+        except Exception as e:
+            raise CommandError(f"Could not load classifier labels: {e}")
+
+        table = {}
+        for label in labels:
+            key = normalize_food_name(label)
+            try:
+                table[key] = fetch_usda_nutrition(key)
+            except NutritionLookupError as e:
+                # Leave the label out so it falls back to a live lookup at request time.
+                self.stderr.write(str(e))
+                continue
+            if table[key] is None:
+                self.stdout.write(f"No USDA match for '{key}'")
+
+        output = options['output'] or settings.NUTRITION_TABLE_PATH
+        write_nutrition_table(table, output)
+        resolved = sum(1 for nutrients in table.values() if nutrients)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(table)} labels ({resolved} with nutrients) to {output}."
+        ))
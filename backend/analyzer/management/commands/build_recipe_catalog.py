@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analyzer.catalog import catalog_recipes
+from analyzer.recipes import generate_recipes, normalize_category, store_recipes
+
+# The categories offered by the recipes page.
+DEFAULT_CATEGORIES = ['popular global dishes', 'italian', 'mexican', 'indian', 'japanese', 'vegan']
+
+
+class Command(BaseCommand):
+    help = "Generates recipes for the given categories ahead of time and stores them in the local catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('categories', nargs='*', help="Categories to build. Defaults to the recipes page categories.")
+        parser.add_argument('--refresh', action='store_true', help="Regenerate categories that are already catalogued.")
+
+    def handle(self, *args, **options):
+        if not settings.GEMINI_API_KEY:
+            raise CommandError("GEMINI_API_KEY is not configured.")
+        categories = options['categories'] or DEFAULT_CATEGORIES
+        for category in categories:
+            if not options['refresh'] and catalog_recipes(normalize_category(category)):
+                self.stdout.write(f"Skipping '{category}': already catalogued.")
+                continue
+            try:
+                recipes = generate_recipes(category)
+            except Exception as e:
+                self.stderr.write(f"Could not generate recipes for '{category}': {e}")
+                continue
+            store_recipes(category, recipes)
+            self.stdout.write(f"Catalogued {len(recipes)} recipes for '{category}'.")
+        self.stdout.write(self.style.SUCCESS("Recipe catalog is up to date."))
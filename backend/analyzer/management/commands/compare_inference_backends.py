@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def current_rss_mb():
+    """Resident set size of this process; falls back to the peak RSS off Linux."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_backend(name, model_name, onnx_path):
+    if name == "pytorch":
+        from transformers import pipeline
+
+        return pipeline("image-classification", model=model_name)
+    from analyzer.onnx_backend import OnnxImageClassifier
+
+    return OnnxImageClassifier.from_pretrained(onnx_path, model_name)
+
+
+def run_backend(name, model_name, onnx_path, paths):
+    """
+    Loads one backend and classifies every image, in a fresh process so its
+    memory numbers do not include the other backend's libraries and weights.
+    """
+    images = [Image.open(path).convert("RGB") for path in paths]
+    rss_before = current_rss_mb()
+    classifier = build_backend(name, model_name, onnx_path)
+    classifier(images[0])  # Warm-up pass, not timed.
+    rss_loaded = current_rss_mb()
+
+    latencies, labels = [], []
+    for image in images:
+        start = time.perf_counter()
+        predictions = classifier(image)
+        latencies.append((time.perf_counter() - start) * 1000)
+        labels.append(predictions[0]['label'])
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "labels": labels, "latencies": latencies, "model_rss": rss_loaded - rss_before,
+        "rss": current_rss_mb(), "peak_rss": peak_rss,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the PyTorch pipeline and the quantized ONNX model over a directory of images "
+        "and reports top-1 agreement, latency and memory for both. Each backend runs in its own process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('image_dir', help="Directory of local food photos.")
+        parser.add_argument('--limit', type=int, default=200, help="Maximum number of images to use.")
+
+    def handle(self, *args, **options):
+        paths = sorted(
+            os.path.join(options['image_dir'], name)
+            for name in os.listdir(options['image_dir'])
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )[:options['limit']]
+        if not paths:
+            raise CommandError(f"No images found in {options['image_dir']}.")
+
+        top1 = {}
+        # "spawn" rather than fork, so a child never inherits libraries loaded by this process.
+        context = multiprocessing.get_context("spawn")
+        for name in ("pytorch", "onnx-int8"):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                future = executor.submit(
+                    run_backend, name, settings.ANALYZER_MODEL_NAME, settings.ANALYZER_ONNX_MODEL_PATH, paths,
+                )
+                try:
+                    result = future.result()
+                except ImportError as e:
+                    raise CommandError(f"Comparison needs torch, transformers and onnxruntime installed: {e}")
+            top1[name] = result["labels"]
+
+            latencies = sorted(result["latencies"])
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(
+                f"{name:>10}: mean {statistics.mean(latencies):.1f} ms, p50 {statistics.median(latencies):.1f} ms, "
+                f"p95 {p95:.1f} ms, model RSS +{result['model_rss']:.0f} MB, "
+                f"process RSS {result['rss']:.0f} MB (peak {result['peak_rss']:.0f} MB)"
+            )
+
+        agreement = sum(a == b for a, b in zip(top1["pytorch"], top1["onnx-int8"])) / len(paths)
+        self.stdout.write(self.style.SUCCESS(f"Top-1 agreement over {len(paths)} images: {agreement:.1%}"))
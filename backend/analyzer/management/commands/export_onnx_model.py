@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analyzer.onnx_backend import export_quantized_model
+
+
+class Command(BaseCommand):
+    help = "Exports the food classifier to ONNX with dynamic int8 quantization."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help="Where to write the model. Defaults to ANALYZER_ONNX_MODEL_PATH.")
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.ANALYZER_ONNX_MODEL_PATH
+        try:
+            export_quantized_model(settings.ANALYZER_MODEL_NAME, output)
+        except ImportError as e:
+            raise CommandError(f"ONNX export needs torch, onnx and onnxruntime installed: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Wrote quantized ONNX model to {output}."))
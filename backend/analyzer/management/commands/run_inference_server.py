@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analyzer.inference_server import InferenceServer, build_pixel_classifier
+
+
+class Command(BaseCommand):
+    help = "Runs the shared inference server that owns the food classifier for all web workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=None, help="Unix socket path. Defaults to ANALYZER_INFERENCE_SOCKET.")
+        parser.add_argument('--backend', choices=['pytorch', 'onnx'], default='pytorch', help="Model backend to serve.")
+
+    def handle(self, *args, **options):
+        socket_path = options['socket'] or settings.ANALYZER_INFERENCE_SOCKET
+        try:
+            classifier = build_pixel_classifier(
+                options['backend'], settings.ANALYZER_MODEL_NAME, settings.ANALYZER_ONNX_MODEL_PATH
+            )
+        except Exception as e:
+            raise CommandError(f"Could not load the {options['backend']} model: {e}")
+
+        server = InferenceServer(
+            socket_path,
+            classifier,
+            max_batch_size=settings.ANALYZER_BATCH_MAX_SIZE,
+            max_wait=settings.ANALYZER_BATCH_MAX_WAIT_MS / 1000.0,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Inference server ({options['backend']}) listening on {socket_path}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analyzer.nutrition import classifier_labels, get_usda_nutrition
+
+
+class Command(BaseCommand):
+    help = "Pre-fills the USDA nutrition cache for the classifier's labels (or the given food names)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('food_names', nargs='*', help="Food names to warm. Defaults to every classifier label.")
+        parser.add_argument('--refresh', action='store_true', help="Re-fetch entries that are already cached.")
+
+    def handle(self, *args, **options):
+        food_names = options['food_names']
+        if not food_names:
+            try:
+                food_names = classifier_labels()
+            except Exception as e:
+                raise CommandError(f"Could not load classifier labels: {e}")
+
+        found = 0
+        for name in food_names:
+            nutrients = get_usda_nutrition(name, refresh=options['refresh'])
+            if nutrients:
+                found += 1
+            else:
+                self.stdout.write(f"No nutrition data for '{name}'")
+        self.stdout.write(self.style.SUCCESS(f"Warmed nutrition cache: {found}/{len(food_names)} foods found."))
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NutritionCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('food_name', models.CharField(max_length=255, unique=True)),
+                ('nutrients', models.JSONField(default=dict)),
+                ('found', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+
+# SQLite FTS5 index over Recipe.title and Recipe.description, kept in sync by
+# triggers. Other databases fall back to icontains filtering in catalog.search_recipes.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE analyzer_recipe_fts USING fts5(
+        title, description, content='analyzer_recipe', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER analyzer_recipe_fts_insert AFTER INSERT ON analyzer_recipe BEGIN
+        INSERT INTO analyzer_recipe_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER analyzer_recipe_fts_delete AFTER DELETE ON analyzer_recipe BEGIN
+        INSERT INTO analyzer_recipe_fts(analyzer_recipe_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER analyzer_recipe_fts_update AFTER UPDATE ON analyzer_recipe BEGIN
+        INSERT INTO analyzer_recipe_fts(analyzer_recipe_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO analyzer_recipe_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO analyzer_recipe_fts(analyzer_recipe_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS analyzer_recipe_fts_update",
+    "DROP TRIGGER IF EXISTS analyzer_recipe_fts_delete",
+    "DROP TRIGGER IF EXISTS analyzer_recipe_fts_insert",
+    "DROP TABLE IF EXISTS analyzer_recipe_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0002_recipe'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
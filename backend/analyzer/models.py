@@ -1,3 +1,30 @@
 from django.db import models
 
-# Create your models here.
+
+class NutritionCacheEntry(models.Model):
+    # One row per normalized food name. Rows with found=False record that USDA
+    # had no match, so repeat misses do not hit the network either.
+    food_name = models.CharField(max_length=255, unique=True)
+    nutrients = models.JSONField(default=dict)
+    found = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.food_name if self.found else f'{self.food_name} (not found)'
+
+
+class Recipe(models.Model):
+    # Local recipe catalog, filled ahead of time by `manage.py build_recipe_catalog`
+    # and by every LLM generation. `category` holds the normalized category name.
+    category = models.CharField(max_length=255, db_index=True)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    image = models.URLField(max_length=1000, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.category}: {self.title}'
@@ -0,0 +1,302 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.db import DatabaseError
+from django.utils import timezone
+from pants_backend.aio import LoopClients
+
+from .models import NutritionCacheEntry
+
+logger = logging.getLogger(__name__)
+
+USDA_SEARCH_URL = "https://api.nal.usda.gov/fdc/v1/foods/search"
+USDA_DETAILS_URL = "https://api.nal.usda.gov/fdc/v1/food/{fdc_id}"
+
+
+class NutritionLookupError(Exception):
+    """Raised when USDA could not be reached or returned something unparseable."""
+
+
+def normalize_food_name(food_name: str) -> str:
+    """Maps classifier labels and display names ("Apple_Pie", "apple pie ") to one cache key."""
+    return " ".join(food_name.replace("_", " ").lower().split())
+
+
+# --- USDA FoodData Central ---
+@lru_cache(maxsize=1)
+def get_usda_session():
+    """
+    One keep-alive Session per process. Connection-level failures and 429/5xx
+    responses are retried a bounded number of times with backoff.
+    """
+    retry = Retry(
+        total=settings.USDA_MAX_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.USDA_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+
+@lru_cache(maxsize=1)
+def get_usda_executor():
+    return ThreadPoolExecutor(max_workers=settings.USDA_POOL_SIZE, thread_name_prefix="usda")
+
+
+def parse_usda_nutrients(details_data):
+    nutrients = {"calories": 0, "proteins": 0, "fats": 0, "carbs": 0}
+    for nutrient in details_data.get('foodNutrients', []):
+        num = nutrient.get("nutrient", {}).get("number")
+        if num == "208": nutrients['calories'] = nutrient.get('amount', 0)
+        elif num == "203": nutrients['proteins'] = nutrient.get('amount', 0)
+        elif num == "204": nutrients['fats'] = nutrient.get('amount', 0)
+        elif num == "205": nutrients['carbs'] = nutrient.get('amount', 0)
+    return nutrients
+
+
+def fetch_usda_nutrition(food_name: str):
+    """
+    Looks `food_name` up on USDA (search, then details).
+    Returns the nutrient dict, or None if USDA has no match.
+    Raises NutritionLookupError on network or parsing errors.
+    """
+    api_key = settings.USDA_API_KEY
+    session = get_usda_session()
+    timeout = (settings.USDA_CONNECT_TIMEOUT, settings.USDA_READ_TIMEOUT)
+    try:
+        search_params = {"query": food_name, "api_key": api_key, "pageSize": 1}
+        search_response = session.get(USDA_SEARCH_URL, params=search_params, timeout=timeout)
+        search_response.raise_for_status()
+        search_data = search_response.json()
+        if not search_data.get('foods'):
+            logger.info(f"No food found for '{food_name}' in USDA database.")
+            return None
+        fdc_id = search_data['foods'][0]['fdcId']
+        details_response = session.get(
+            USDA_DETAILS_URL.format(fdc_id=fdc_id), params={"api_key": api_key}, timeout=timeout
+        )
+        details_response.raise_for_status()
+        return parse_usda_nutrients(details_response.json())
+    except requests.exceptions.RequestException as e:
+        raise NutritionLookupError(f"Error fetching USDA data for '{food_name}': {e}") from e
+    except (KeyError, IndexError, ValueError) as e:
+        raise NutritionLookupError(f"Error parsing USDA data for '{food_name}': {e}") from e
+
+
+# --- Async USDA client (used by the ASGI analysis path) ---
+def build_async_usda_client():
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.USDA_READ_TIMEOUT, connect=settings.USDA_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=settings.USDA_POOL_SIZE, max_keepalive_connections=settings.USDA_POOL_SIZE),
+        # Retries connection failures only; HTTP errors surface as NutritionLookupError.
+        transport=httpx.AsyncHTTPTransport(retries=settings.USDA_MAX_RETRIES),
+    )
+
+
+# httpx clients are bound to the event loop they were created on, so keep one per loop.
+async_usda_clients = LoopClients(build_async_usda_client)
+
+
+async def get_async_usda_client():
+    return await async_usda_clients.get()
+
+
+async def afetch_usda_nutrition(food_name: str):
+    """Async counterpart of fetch_usda_nutrition."""
+    api_key = settings.USDA_API_KEY
+    client = await get_async_usda_client()
+    try:
+        search_params = {"query": food_name, "api_key": api_key, "pageSize": 1}
+        search_response = await client.get(USDA_SEARCH_URL, params=search_params)
+        search_response.raise_for_status()
+        search_data = search_response.json()
+        if not search_data.get('foods'):
+            logger.info(f"No food found for '{food_name}' in USDA database.")
+            return None
+        fdc_id = search_data['foods'][0]['fdcId']
+        details_response = await client.get(USDA_DETAILS_URL.format(fdc_id=fdc_id), params={"api_key": api_key})
+        details_response.raise_for_status()
+        return parse_usda_nutrients(details_response.json())
+    except httpx.HTTPError as e:
+        raise NutritionLookupError(f"Error fetching USDA data for '{food_name}': {e}") from e
+    except (KeyError, IndexError, ValueError) as e:
+        raise NutritionLookupError(f"Error parsing USDA data for '{food_name}': {e}") from e
+
+
+# --- Offline lookup table ---
+# Built once by `manage.py build_nutrition_table` for the classifier's full label set.
+# Maps normalized food names to nutrient dicts; null marks a label USDA has no match for.
+@lru_cache(maxsize=1)
+def load_nutrition_table(path=None):
+    path = path or settings.NUTRITION_TABLE_PATH
+    if not os.path.exists(path):
+        logger.info(f"Nutrition table not found at {path}; falling back to live USDA lookups.")
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read nutrition table at {path}: {e}")
+        return {}
+
+
+def write_nutrition_table(table, path=None):
+    """Writes the table atomically so running workers never see a half-written file."""
+    path = path or settings.NUTRITION_TABLE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(table, f, separators=(',', ':'), sort_keys=True)
+    os.replace(tmp_path, path)
+    load_nutrition_table.cache_clear()
+
+
+# --- Persistent cache ---
+# Entries live in the project database so every worker process shares them.
+def get_cached_nutrition(key: str):
+    """Returns (hit, nutrients) for a normalized food name. Expired entries count as misses."""
+    try:
+        entry = NutritionCacheEntry.objects.filter(food_name=key).first()
+        if entry is None:
+            return False, None
+        ttl = settings.NUTRITION_CACHE_TTL if entry.found else settings.NUTRITION_CACHE_NEGATIVE_TTL
+        now = timezone.now()
+        if entry.created_at + timedelta(seconds=ttl) < now:
+            entry.delete()
+            return False, None
+        NutritionCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=now)
+        return True, entry.nutrients if entry.found else {}
+    except DatabaseError as e:
+        logger.error(f"Nutrition cache read failed for '{key}': {e}")
+        return False, None
+
+
+def store_nutrition(key: str, nutrients):
+    """Caches a lookup result; `nutrients=None` records a negative result."""
+    now = timezone.now()
+    try:
+        NutritionCacheEntry.objects.update_or_create(
+            food_name=key,
+            defaults={
+                "nutrients": nutrients or {},
+                "found": nutrients is not None,
+                "created_at": now,
+                "last_used_at": now,
+            },
+        )
+        evict_nutrition_cache()
+    except DatabaseError as e:
+        logger.error(f"Nutrition cache write failed for '{key}': {e}")
+
+
+def evict_nutrition_cache(max_entries=None):
+    """Drops the least recently used entries beyond the configured size limit."""
+    max_entries = settings.NUTRITION_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    stale_ids = NutritionCacheEntry.objects.order_by('-last_used_at').values_list('pk', flat=True)[max_entries:]
+    stale_ids = list(stale_ids)
+    if stale_ids:
+        NutritionCacheEntry.objects.filter(pk__in=stale_ids).delete()
+
+
+def lookup_local_nutrition(key: str):
+    """Returns (hit, nutrients) from the offline table or the shared cache, without touching the network."""
+    table = load_nutrition_table()
+    if key in table:
+        return True, table[key] or {}
+    return get_cached_nutrition(key)
+
+
+def _split_local_hits(food_names, refresh):
+    """Returns (keys, results, missing): local hits by key, and the names that need USDA."""
+    keys = [normalize_food_name(name) for name in food_names]
+    results = {}
+    missing = {}
+    for name, key in zip(food_names, keys):
+        if key in results or key in missing:
+            continue
+        hit, nutrients = (False, None) if refresh else lookup_local_nutrition(key)
+        if hit:
+            results[key] = nutrients
+        else:
+            missing[key] = name
+
+    if missing and not settings.USDA_API_KEY:
+        logger.warning("USDA_API_KEY not found in settings.")
+        results.update({key: {} for key in missing})
+        missing = {}
+    return keys, results, missing
+
+
+def _record_fetch(results, key, nutrients=None, error=None):
+    if error is not None:
+        # Transient failures are not cached, so the next request retries.
+        logger.error(error)
+        results[key] = {}
+        return
+    store_nutrition(key, nutrients)
+    results[key] = nutrients or {}
+
+
+def get_nutrition_for_candidates(food_names, refresh: bool = False):
+    """
+    Returns one nutrient dict per name in `food_names`, in order.
+    Names that are not available locally are fetched from USDA concurrently,
+    so looking up several candidates costs about as much as the slowest one.
+    """
+    keys, results, missing = _split_local_hits(food_names, refresh)
+    futures = {key: get_usda_executor().submit(fetch_usda_nutrition, name) for key, name in missing.items()}
+    for key, future in futures.items():
+        try:
+            nutrients = future.result()
+        except NutritionLookupError as e:
+            _record_fetch(results, key, error=e)
+            continue
+        # Cache writes stay on the calling thread so they use the request's DB connection.
+        _record_fetch(results, key, nutrients)
+    return [results[key] for key in keys]
+
+
+async def aget_nutrition_for_candidates(food_names, refresh: bool = False):
+    """Async counterpart of get_nutrition_for_candidates: USDA calls share the event loop."""
+    keys, results, missing = await sync_to_async(_split_local_hits)(food_names, refresh)
+    fetched = await asyncio.gather(
+        *(afetch_usda_nutrition(name) for name in missing.values()), return_exceptions=True
+    )
+    for key, outcome in zip(missing, fetched):
+        if isinstance(outcome, NutritionLookupError):
+            await sync_to_async(_record_fetch)(results, key, error=outcome)
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            await sync_to_async(_record_fetch)(results, key, outcome)
+    return [results[key] for key in keys]
+
+
+def get_usda_nutrition(food_name: str, refresh: bool = False):
+    """
+    Returns the nutrient profile for `food_name`. The offline table is checked first,
+    then the shared cache; only names found in neither go to USDA.
+    """
+    return get_nutrition_for_candidates([food_name], refresh=refresh)[0]
+
+
+def classifier_labels():
+    """Returns the closed label vocabulary of the configured image classifier."""
+    from transformers import AutoConfig
+
+    config = AutoConfig.from_pretrained(settings.ANALYZER_MODEL_NAME)
+    return [config.id2label[i] for i in sorted(config.id2label)]
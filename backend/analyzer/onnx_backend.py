@@ -0,0 +1,108 @@
+"""
+ONNX Runtime backend for the food classifier.
+
+The model is exported once with `manage.py export_onnx_model` and its linear
+layers are quantized to int8 with ONNX Runtime's dynamic quantization.
+`OnnxImageClassifier` is a drop-in replacement for the transformers
+image-classification pipeline: it returns the same `[{'label', 'score'}]`
+lists. onnx, onnxruntime and torch are only needed for this backend, so they
+are imported lazily.
+"""
+import logging
+import os
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def export_quantized_model(model_name, output_path):
+    """Exports `model_name` to ONNX and writes an int8 dynamically-quantized copy to `output_path`."""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+    model = AutoModelForImageClassification.from_pretrained(model_name)
+    model.eval()
+    processor = AutoImageProcessor.from_pretrained(model_name)
+    dummy = processor(images=Image.new("RGB", (224, 224)), return_tensors="pt")["pixel_values"]
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    fp32_path = f"{os.path.splitext(output_path)[0]}-fp32.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy,),
+            fp32_path,
+            input_names=["pixel_values"],
+            output_names=["logits"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=14,
+        )
+    quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    return output_path
+
+
+def softmax(logits):
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def top_k_predictions(logits, id2label, top_k):
+    """Turns a batch of logits into one pipeline-style `[{'label', 'score'}]` list per row."""
+    probabilities = softmax(logits.astype(np.float32))
+    results = []
+    for row in probabilities:
+        best = np.argsort(row)[::-1][:top_k]
+        results.append([{"label": id2label[int(i)], "score": float(row[i])} for i in best])
+    return results
+
+
+class OnnxImageClassifier:
+    def __init__(self, session, image_processor, id2label, top_k=5):
+        self.session = session
+        self.image_processor = image_processor
+        self.id2label = id2label
+        self.top_k = top_k
+        self.input_name = session.get_inputs()[0].name
+
+    @classmethod
+    def from_pretrained(cls, model_path, model_name, top_k=5):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoImageProcessor
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at {model_path}. Run `manage.py export_onnx_model` first."
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        config = AutoConfig.from_pretrained(model_name)
+        image_processor = AutoImageProcessor.from_pretrained(model_name)
+        return cls(session, image_processor, config.id2label, top_k=top_k)
+
+    def preprocess(self, images):
+        """Resizes and normalizes images into a float32 NCHW batch."""
+        pixel_values = self.image_processor(images=images, return_tensors="np")["pixel_values"]
+        return np.ascontiguousarray(pixel_values, dtype=np.float32)
+
+    def predict(self, pixel_values, top_k=None):
+        """Runs a preprocessed batch; returns one `[{'label', 'score'}]` list per image."""
+        top_k = top_k or self.top_k
+        logits = self.session.run(None, {self.input_name: pixel_values})[0]
+        return top_k_predictions(logits, self.id2label, top_k)
+
+    def __call__(self, images, batch_size=None, top_k=None):
+        # Mirrors the pipeline: one image in, one prediction list out; a list in, a list of lists out.
+        single = not isinstance(images, (list, tuple))
+        batch = [images] if single else list(images)
+        batch_size = batch_size or len(batch)
+        results = []
+        for start in range(0, len(batch), batch_size):
+            chunk = batch[start:start + batch_size]
+            results.extend(self.predict(self.preprocess(chunk), top_k=top_k))
+        return results[0] if single else results
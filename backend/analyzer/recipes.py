@@ -0,0 +1,185 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from pants_backend.llm import gemini_generate, gemini_stream
+from pants_backend.singleflight import fingerprint, llm_requests
+
+from .catalog import catalog_entry, catalog_recipes, save_catalog_recipes
+
+logger = logging.getLogger(__name__)
+
+RECIPE_PROMPT = """
+            Generate a list of 12 diverse and authentic recipes for the theme: "{category}".
+            For each recipe, provide: a unique id, a creative title, a short description (15-20 words), and a high-quality, royalty-free image URL from Unsplash or Pexels.
+            Return the response as a valid JSON array only.
+            """
+
+
+def normalize_category(category: str) -> str:
+    return " ".join(category.lower().split())
+
+
+def parse_recipes(text):
+    cleaned_response = text.strip().lstrip("```json").rstrip("```")
+    return json.loads(cleaned_response)
+
+
+def generate_recipes(category):
+    """
+    Calls Gemini for `category` and returns the parsed recipe list. Concurrent
+    calls for the same category, in any worker, share one generation.
+    """
+    key = fingerprint("recipes", settings.GEMINI_RECIPE_MODEL, normalize_category(category))
+    return llm_requests.do(key, lambda: _generate_recipes(category))
+
+
+def _generate_recipes(category):
+    return parse_recipes(gemini_generate(settings.GEMINI_RECIPE_MODEL, RECIPE_PROMPT.format(category=category)))
+
+
+def iter_json_objects(chunks):
+    """
+    Incrementally parses streamed model output and yields each top-level JSON
+    object as soon as its closing brace arrives. Anything outside objects
+    (code fences, the enclosing array brackets, commas) is skipped.
+    """
+    buffer = []
+    depth = 0
+    in_string = escaped = False
+    for chunk in chunks:
+        for char in chunk:
+            if depth == 0:
+                if char == "{":
+                    buffer = [char]
+                    depth = 1
+                continue
+            buffer.append(char)
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    yield json.loads("".join(buffer))
+
+
+def stream_recipes(category):
+    """
+    Yields recipes for `category` one at a time. Cached or catalogued recipes
+    are replayed at once; otherwise Gemini output is streamed and each recipe is yielded as
+    soon as it has been fully generated, then the whole list is stored.
+    """
+    recipes = cached_recipes(category)
+    if recipes is not None:
+        yield from recipes
+        return
+
+    # Streaming responses are not coalesced: each client needs its own token stream.
+    chunks = gemini_stream(settings.GEMINI_RECIPE_MODEL, RECIPE_PROMPT.format(category=category))
+    recipes = []
+    for recipe in iter_json_objects(chunks):
+        recipes.append(recipe)
+        yield recipe
+    if recipes:
+        store_recipes(category, recipes)
+
+
+# --- Cache with stale-while-revalidate ---
+# The local catalog is shared by every worker and its timestamps decide freshness:
+# recipes are fresh for RECIPE_CACHE_TTL seconds, after which they are still served
+# immediately while a background refresh runs. The Django cache only mirrors catalog
+# entries for RECIPE_CACHE_MIRROR_TTL seconds so hot categories skip the database.
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def recipe_cache_key(category):
+    return "recipes:" + hashlib.sha1(normalize_category(category).encode()).hexdigest()
+
+
+def is_stale(entry):
+    return time.time() - entry["generated_at"] >= settings.RECIPE_CACHE_TTL
+
+
+def mirror_catalog_entry(category):
+    """Copies the catalog entry for `category` into the cache and returns it; None if never generated."""
+    catalogued = catalog_entry(normalize_category(category))
+    if catalogued is None:
+        return None
+    entry = {"recipes": catalogued[0], "generated_at": catalogued[1]}
+    cache.set(recipe_cache_key(category), entry, timeout=settings.RECIPE_CACHE_MIRROR_TTL)
+    return entry
+
+
+def store_recipes(category, recipes):
+    """
+    Records generated recipes in the catalog and caches the catalogued copies,
+    so recipe ids are the same whichever store serves them. Returns what was cached.
+    """
+    save_catalog_recipes(normalize_category(category), recipes)
+    entry = mirror_catalog_entry(category)
+    return entry["recipes"] if entry else recipes
+
+
+def cached_recipes(category):
+    """
+    Returns the stored recipes for `category` from the cache or, failing that,
+    the local catalog; None if the category has never been generated. Recipes
+    older than RECIPE_CACHE_TTL are returned while a background refresh runs.
+    """
+    entry = cache.get(recipe_cache_key(category)) or mirror_catalog_entry(category)
+    if entry is None:
+        return None
+    if is_stale(entry) and settings.GEMINI_API_KEY:
+        schedule_refresh(category)
+    return entry["recipes"]
+
+
+def _refresh(category):
+    try:
+        # Another worker may have refreshed the category since this one's mirror
+        # was filled; concurrent refreshes already share one generation.
+        entry = mirror_catalog_entry(category)
+        if entry is None or is_stale(entry):
+            store_recipes(category, generate_recipes(category))
+    except Exception as e:
+        logger.error(f"Background recipe refresh failed for '{category}': {e}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(normalize_category(category))
+        close_old_connections()
+
+
+def schedule_refresh(category):
+    """Starts a background refresh unless one is already running for this category in this process."""
+    key = normalize_category(category)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return None
+        _refreshing.add(key)
+    thread = threading.Thread(target=_refresh, args=(category,), name="recipe-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_recipes(category):
+    """Returns recipes for `category` from the cache or the catalog, generating them on a miss."""
+    recipes = cached_recipes(category)
+    if recipes is not None:
+        return recipes
+    return store_recipes(category, generate_recipes(category))
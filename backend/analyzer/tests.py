@@ -1,3 +1,1034 @@
-from django.test import TestCase
+import io
+import json
+import os
+import socket
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from concurrent.futures import Future
+from unittest.mock import AsyncMock, MagicMock, patch
 
-# Create your tests here.
+import httpx
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from google import genai
+from google.genai import types
+from PIL import Image
+
+from .catalog import save_catalog_recipes, search_recipes
+from .classifier import ClassifierLoader
+from .image_cache import AnalysisCache, hamming_distance, perceptual_hash
+from .imaging import ImageTooLargeError, load_image
+from .inference_server import InferenceServer, InferenceServerError, RemoteImageClassifier
+from .onnx_backend import OnnxImageClassifier
+from .recipes import _refresh, get_recipes, iter_json_objects, recipe_cache_key, schedule_refresh
+from .models import NutritionCacheEntry, Recipe
+from .nutrition import (
+    NutritionLookupError,
+    aget_nutrition_for_candidates,
+    get_nutrition_for_candidates,
+    get_usda_nutrition,
+    load_nutrition_table,
+    write_nutrition_table,
+)
+
+
+def make_image_upload(name="dish.jpg", color=(200, 120, 40), size=(64, 64), format="JPEG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f"image/{format.lower()}")
+
+
+@override_settings(
+    USDA_API_KEY="test-key", NUTRITION_CACHE_TTL=3600, NUTRITION_CACHE_NEGATIVE_TTL=60, NUTRITION_CACHE_MAX_ENTRIES=2,
+    NUTRITION_TABLE_PATH=os.path.join(tempfile.gettempdir(), "missing-nutrition-table.json"),
+)
+class NutritionCacheTest(TestCase):
+    NUTRIENTS = {"calories": 250, "proteins": 3, "fats": 12, "carbs": 34}
+
+    def setUp(self):
+        load_nutrition_table.cache_clear()
+        self.addCleanup(load_nutrition_table.cache_clear)
+
+    @patch('analyzer.nutrition.fetch_usda_nutrition')
+    def test_repeat_lookup_is_served_from_cache(self, mock_fetch):
+        """
+        Test that a second lookup for the same (differently formatted) name makes no USDA call.
+        """
+        mock_fetch.return_value = self.NUTRIENTS
+        self.assertEqual(get_usda_nutrition("Apple Pie"), self.NUTRIENTS)
+        self.assertEqual(get_usda_nutrition("apple_pie"), self.NUTRIENTS)
+        self.assertEqual(mock_fetch.call_count, 1)
+
+    @patch('analyzer.nutrition.fetch_usda_nutrition')
+    def test_negative_results_are_cached(self, mock_fetch):
+        """
+        Test that a name USDA does not know is cached as a miss and returns an empty dict.
+        """
+        mock_fetch.return_value = None
+        self.assertEqual(get_usda_nutrition("Mystery Dish"), {})
+        self.assertEqual(get_usda_nutrition("Mystery Dish"), {})
+        self.assertEqual(mock_fetch.call_count, 1)
+        self.assertFalse(NutritionCacheEntry.objects.get(food_name="mystery dish").found)
+
+    @patch('analyzer.nutrition.fetch_usda_nutrition')
+    def test_lookup_errors_are_not_cached(self, mock_fetch):
+        """
+        Test that transient USDA failures are retried on the next request.
+        """
+        mock_fetch.side_effect = NutritionLookupError("timeout")
+        self.assertEqual(get_usda_nutrition("Sushi"), {})
+        self.assertFalse(NutritionCacheEntry.objects.exists())
+
+    @patch('analyzer.nutrition.fetch_usda_nutrition')
+    def test_expired_entries_are_refetched(self, mock_fetch):
+        """
+        Test that entries older than the TTL are treated as misses.
+        """
+        mock_fetch.return_value = self.NUTRIENTS
+        get_usda_nutrition("Ramen")
+        NutritionCacheEntry.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        get_usda_nutrition("Ramen")
+        self.assertEqual(mock_fetch.call_count, 2)
+
+    @patch('analyzer.nutrition.fetch_usda_nutrition')
+    def test_least_recently_used_entries_are_evicted(self, mock_fetch):
+        """
+        Test that the cache keeps at most NUTRITION_CACHE_MAX_ENTRIES rows, dropping the least recently used.
+        """
+        mock_fetch.return_value = self.NUTRIENTS
+        get_usda_nutrition("Tacos")
+        get_usda_nutrition("Pizza")
+        NutritionCacheEntry.objects.filter(food_name="tacos").update(last_used_at=timezone.now() - timedelta(minutes=5))
+        get_usda_nutrition("Waffles")
+        self.assertEqual(
+            set(NutritionCacheEntry.objects.values_list('food_name', flat=True)),
+            {"pizza", "waffles"},
+        )
+
+
+@override_settings(USDA_API_KEY="test-key")
+class NutritionTableTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.table_path = os.path.join(tmp_dir.name, "nutrition_table.json")
+        self.addCleanup(load_nutrition_table.cache_clear)
+        write_nutrition_table({"sushi": {"calories": 150}, "mystery dish": None}, self.table_path)
+
+    def test_table_can_be_written_to_a_bare_filename(self):
+        """
+        Test that a path without a directory part is written to the current directory.
+        """
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(os.path.dirname(self.table_path))
+        write_nutrition_table({"ramen": {"calories": 400}}, "table.json")
+        self.assertTrue(os.path.exists("table.json"))
+
+    @patch('analyzer.nutrition.fetch_usda_nutrition')
+    def test_table_labels_skip_the_network(self, mock_fetch):
+        """
+        Test that labels in the offline table, including known misses, never reach USDA.
+        """
+        with override_settings(NUTRITION_TABLE_PATH=self.table_path):
+            self.assertEqual(get_usda_nutrition("Sushi"), {"calories": 150})
+            self.assertEqual(get_usda_nutrition("mystery_dish"), {})
+        mock_fetch.assert_not_called()
+
+    @patch('analyzer.nutrition.fetch_usda_nutrition')
+    def test_unknown_names_fall_back_to_usda(self, mock_fetch):
+        """
+        Test that names missing from the table are looked up live.
+        """
+        mock_fetch.return_value = {"calories": 300}
+        with override_settings(NUTRITION_TABLE_PATH=self.table_path):
+            self.assertEqual(get_usda_nutrition("Pad Thai"), {"calories": 300})
+        mock_fetch.assert_called_once_with("Pad Thai")
+
+    @patch('analyzer.nutrition.fetch_usda_nutrition')
+    def test_candidates_are_fetched_once_each_and_returned_in_order(self, mock_fetch):
+        """
+        Test that multi-candidate lookups keep the input order and fetch duplicate names only once.
+        """
+        mock_fetch.side_effect = lambda name: {"calories": len(name)}
+        with override_settings(NUTRITION_TABLE_PATH=self.table_path):
+            results = get_nutrition_for_candidates(["Pad Thai", "Sushi", "pad_thai", "Pho"])
+        self.assertEqual(results, [{"calories": 8}, {"calories": 150}, {"calories": 8}, {"calories": 3}])
+        self.assertEqual(sorted(call.args[0] for call in mock_fetch.call_args_list), ["Pad Thai", "Pho"])
+
+    @patch('analyzer.nutrition.get_usda_session')
+    def test_usda_requests_use_pooled_session_with_timeouts(self, mock_session):
+        """
+        Test that USDA calls go through the shared session with connect/read timeouts.
+        """
+        search = MagicMock()
+        search.json.return_value = {"foods": [{"fdcId": 42}]}
+        details = MagicMock()
+        details.json.return_value = {"foodNutrients": [{"nutrient": {"number": "208"}, "amount": 99}]}
+        mock_session.return_value.get.side_effect = [search, details]
+        with override_settings(NUTRITION_TABLE_PATH=self.table_path, USDA_CONNECT_TIMEOUT=1, USDA_READ_TIMEOUT=2):
+            self.assertEqual(get_usda_nutrition("Bibimbap")["calories"], 99)
+        for call in mock_session.return_value.get.call_args_list:
+            self.assertEqual(call.kwargs["timeout"], (1, 2))
+
+
+@override_settings(
+    USDA_API_KEY="test-key",
+    NUTRITION_TABLE_PATH=os.path.join(tempfile.gettempdir(), "missing-nutrition-table.json"),
+)
+class AsyncNutritionTest(TestCase):
+    def setUp(self):
+        load_nutrition_table.cache_clear()
+        self.addCleanup(load_nutrition_table.cache_clear)
+        self.requests = []
+
+    def handler(self, request):
+        self.requests.append(request.url.path)
+        if request.url.path.endswith("/foods/search"):
+            query = request.url.params["query"]
+            foods = [] if query == "Mystery" else [{"fdcId": len(query)}]
+            return httpx.Response(200, json={"foods": foods})
+        return httpx.Response(200, json={"foodNutrients": [{"nutrient": {"number": "208"}, "amount": 120}]})
+
+    def test_candidates_are_fetched_with_the_async_client_and_cached(self):
+        """
+        Test that the async path resolves candidates over httpx and stores results in the shared cache.
+        """
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+        with patch('analyzer.nutrition.get_async_usda_client', new_callable=AsyncMock, return_value=client):
+            results = async_to_sync(aget_nutrition_for_candidates)(["Gyoza", "Mystery", "gyoza"])
+        self.assertEqual(results[0]["calories"], 120)
+        self.assertEqual(results[1], {})
+        self.assertEqual(results[2], results[0])
+        self.assertEqual(len(self.requests), 3)  # search + details for Gyoza, search for Mystery
+        self.assertEqual(get_usda_nutrition("Gyoza")["calories"], 120)
+        self.assertTrue(NutritionCacheEntry.objects.filter(food_name="mystery", found=False).exists())
+
+
+@override_settings(USDA_API_KEY=None)
+class ImageAnalysisViewTest(TestCase):
+    PREDICTIONS = [
+        {"label": "apple_pie", "score": 0.8},
+        {"label": "waffles", "score": 0.1},
+        {"label": "pancakes", "score": 0.05},
+        {"label": "churros", "score": 0.01},
+    ]
+
+    def setUp(self):
+        self.url = reverse('analyze_image')
+        patcher = patch('analyzer.views.analysis_cache', AnalysisCache(max_entries=8, max_distance=5))
+        self.analysis_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('analyzer.views.get_nutrition_for_candidates')
+    @patch('analyzer.views.image_batcher')
+    @patch('analyzer.views.image_classifier_loader', new=MagicMock())
+    def test_analysis_includes_nutrition_for_top_candidates(self, mock_batcher, mock_nutrition):
+        """
+        Test that the response keeps the existing fields and adds per-candidate nutrients.
+        """
+        mock_batcher.return_value = self.PREDICTIONS
+        mock_nutrition.side_effect = lambda names: [{"calories": i} for i, _ in enumerate(names)]
+
+        response = self.client.post(self.url, {"image": make_image_upload()})
+
+        self.assertEqual(response.status_code, 200)
+        analysis = response.json()["analysis"]
+        self.assertEqual(analysis["metadata"]["dish_name"], "Apple Pie")
+        self.assertEqual(analysis["total_profile"], {"calories": 0})
+        self.assertEqual(analysis["metadata"]["detected_items"], ["apple pie", "waffles", "pancakes"])
+        self.assertEqual(
+            [(c["name"], c["nutrients"]) for c in analysis["metadata"]["candidates"]],
+            [("Apple Pie", {"calories": 0}), ("Waffles", {"calories": 1}), ("Pancakes", {"calories": 2})],
+        )
+        mock_nutrition.assert_called_once_with(["Apple Pie", "Waffles", "Pancakes"])
+
+    @patch('analyzer.views.get_nutrition_for_candidates')
+    @patch('analyzer.views.image_batcher')
+    @patch('analyzer.views.image_classifier_loader', new=MagicMock())
+    def test_repeat_and_reencoded_uploads_skip_inference(self, mock_batcher, mock_nutrition):
+        """
+        Test that the same photo, and a re-encoded copy of it, are answered from the analysis cache.
+        """
+        mock_batcher.return_value = self.PREDICTIONS
+        mock_nutrition.side_effect = lambda names: [{"calories": 300} for _ in names]
+
+        first = self.client.post(self.url, {"image": make_image_upload()})
+        again = self.client.post(self.url, {"image": make_image_upload()})
+        reencoded = self.client.post(self.url, {"image": make_image_upload(name="copy.jpg", size=(48, 48))})
+
+        self.assertEqual(mock_batcher.call_count, 1)
+        self.assertEqual(first.json(), again.json())
+        self.assertEqual(first.json(), reencoded.json())
+
+    @override_settings(ANALYZER_MAX_IMAGE_PIXELS=100 * 100)
+    @patch('analyzer.views.image_batcher')
+    @patch('analyzer.views.image_classifier_loader', new=MagicMock())
+    def test_oversized_image_is_rejected_before_inference(self, mock_batcher):
+        """
+        Test that images over the pixel limit get a 413 without reaching the classifier.
+        """
+        response = self.client.post(self.url, {"image": make_image_upload(size=(200, 200))})
+        self.assertEqual(response.status_code, 413)
+        mock_batcher.assert_not_called()
+
+    @patch('PIL.Image.MAX_IMAGE_PIXELS', 1000)
+    @patch('analyzer.views.image_batcher')
+    @patch('analyzer.views.image_classifier_loader', new=MagicMock())
+    def test_decompression_bomb_gets_413(self, mock_batcher):
+        """
+        Test that images Pillow itself refuses to open get a 413 rather than a 500.
+        """
+        response = self.client.post(self.url, {"image": make_image_upload(size=(200, 200))})
+        self.assertEqual(response.status_code, 413)
+        mock_batcher.assert_not_called()
+
+    @patch('analyzer.views.image_classifier_loader', new=MagicMock())
+    def test_non_image_upload_is_rejected(self):
+        """
+        Test that a file Pillow cannot identify gets a 400 error.
+        """
+        upload = SimpleUploadedFile("notes.txt", b"not an image", content_type="text/plain")
+        response = self.client.post(self.url, {"image": upload})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('analyzer.views.aget_nutrition_for_candidates', new_callable=AsyncMock)
+    @patch('analyzer.views.image_batcher')
+    @patch('analyzer.views.image_classifier_loader', new=MagicMock())
+    def test_async_analysis_matches_sync_response(self, mock_batcher, mock_nutrition):
+        """
+        Test that the async endpoint returns the same analysis payload as the sync view.
+        """
+        future = Future()
+        future.set_result(self.PREDICTIONS)
+        mock_batcher.submit.return_value = future
+        mock_nutrition.side_effect = lambda names: [{"calories": i} for i, _ in enumerate(names)]
+
+        response = self.client.post(reverse('analyze_image_async'), {"image": make_image_upload()})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["analysis"]["metadata"]["dish_name"], "Apple Pie")
+        self.assertEqual(len(response.json()["analysis"]["metadata"]["candidates"]), 3)
+        mock_nutrition.assert_awaited_once_with(["Apple Pie", "Waffles", "Pancakes"])
+
+    def test_async_endpoint_rejects_get(self):
+        """
+        Test that the async endpoint only accepts POST.
+        """
+        self.assertEqual(self.client.get(reverse('analyze_image_async')).status_code, 405)
+
+    def test_missing_image_is_rejected(self):
+        """
+        Test that the analyze endpoint returns a 400 error if no image is uploaded.
+        """
+        response = self.client.post(self.url, {})
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalysisCacheTest(SimpleTestCase):
+    def test_perceptual_hash_tolerates_reencoding(self):
+        """
+        Test that a resized, recompressed copy hashes close to the original and a different image does not.
+        """
+        original = Image.new("RGB", (128, 128))
+        original.paste((255, 255, 255), (0, 0, 64, 128))
+        buffer = io.BytesIO()
+        original.resize((100, 100)).save(buffer, format="JPEG", quality=60)
+        copy = Image.open(io.BytesIO(buffer.getvalue()))
+        flipped = original.transpose(Image.FLIP_LEFT_RIGHT)
+
+        self.assertLessEqual(hamming_distance(perceptual_hash(original), perceptual_hash(copy)), 5)
+        self.assertGreater(hamming_distance(perceptual_hash(original), perceptual_hash(flipped)), 5)
+
+    def test_similar_lookup_respects_threshold(self):
+        """
+        Test that near matches are found only within the configured Hamming distance.
+        """
+        cache = AnalysisCache(max_entries=4, max_distance=2)
+        cache.put("a", 0b0000, {"dish": "a"})
+        self.assertEqual(cache.get_similar(0b0011), {"dish": "a"})
+        self.assertIsNone(cache.get_similar(0b0111))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """
+        Test that the cache stays within max_entries by dropping the least recently used payload.
+        """
+        cache = AnalysisCache(max_entries=2, max_distance=-1)
+        cache.put("a", 1, "A")
+        cache.put("b", 2, "B")
+        cache.get_exact("a")
+        cache.put("c", 3, "C")
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get_exact("b"))
+        self.assertEqual(cache.get_exact("a"), "A")
+
+
+class ClassifierLoaderTest(TestCase):
+    def test_model_is_loaded_once_on_first_use(self):
+        """
+        Test that the factory runs lazily and only once.
+        """
+        factory = MagicMock(return_value=MagicMock())
+        loader = ClassifierLoader(factory)
+        self.assertFalse(loader.is_loaded)
+        factory.assert_not_called()
+
+        self.assertIs(loader.get(), loader.get())
+        factory.assert_called_once()
+        self.assertTrue(loader.is_ready)
+
+    def test_background_warm_up_runs_a_dummy_pass(self):
+        """
+        Test that background warm-up loads the model, runs one forward pass and then reports ready.
+        """
+        model = MagicMock()
+        loader = ClassifierLoader(MagicMock(return_value=model))
+        loader.start_background_warm_up().join(timeout=5)
+        model.assert_called_once()
+        self.assertTrue(loader.is_ready)
+
+    def test_load_failures_are_reported(self):
+        """
+        Test that a failing factory leaves the loader not ready with the error recorded.
+        """
+        loader = ClassifierLoader(MagicMock(side_effect=OSError("no weights")))
+        self.assertIsNone(loader.get())
+        self.assertEqual(loader.status(), {"loaded": False, "ready": False, "error": "no weights"})
+
+    def test_failed_loads_are_retried_after_a_delay(self):
+        """
+        Test that a failed load is not retried on every call, but is retried once the delay has passed.
+        """
+        factory = MagicMock(side_effect=[OSError("server down"), MagicMock()])
+        loader = ClassifierLoader(factory, retry_after=60)
+        self.assertIsNone(loader.get())
+        self.assertIsNone(loader.get())
+        factory.assert_called_once()
+
+        loader._failed_at -= 60
+        self.assertIsNotNone(loader.get())
+        self.assertEqual(loader.status(), {"loaded": True, "ready": True, "error": None})
+
+    def test_failed_warm_up_is_restarted(self):
+        """
+        Test that a warm-up whose pass failed can be started again and then reports ready.
+        """
+        model = MagicMock(side_effect=[ConnectionRefusedError("not up yet"), [{"label": "x", "score": 1.0}]])
+        loader = ClassifierLoader(MagicMock(return_value=model))
+        first = loader.start_background_warm_up()
+        first.join(timeout=5)
+        self.assertFalse(loader._warmed_up)
+
+        second = loader.start_background_warm_up()
+        self.assertIsNot(second, first)
+        second.join(timeout=5)
+        self.assertTrue(loader.is_ready)
+        self.assertEqual(model.call_count, 2)
+
+    def test_readiness_endpoint_reflects_loader_state(self):
+        """
+        Test that the readiness probe returns 200 once the model is loaded.
+        """
+        loader = ClassifierLoader(MagicMock(return_value=MagicMock()))
+        loader.get()
+        with patch('analyzer.views.image_classifier_loader', loader):
+            response = self.client.get(reverse('analyzer_ready'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["ready"])
+
+    def test_readiness_probe_starts_warm_up_in_lazy_mode(self):
+        """
+        Test that without a startup warm-up the first probe starts one, so the worker becomes ready.
+        """
+        model = MagicMock()
+        loader = ClassifierLoader(MagicMock(return_value=model))
+        with patch('analyzer.views.image_classifier_loader', loader):
+            self.assertEqual(self.client.get(reverse('analyzer_ready')).status_code, 503)
+            loader.start_background_warm_up().join(timeout=5)
+            response = self.client.get(reverse('analyzer_ready'))
+        model.assert_called_once()
+        self.assertEqual(response.status_code, 200)
+
+
+class LoadImageTest(SimpleTestCase):
+    @override_settings(ANALYZER_DECODE_SIZE=224)
+    def test_large_jpeg_is_decoded_near_target_size(self):
+        """
+        Test that a large JPEG is decoded close to the target size rather than at full resolution.
+        """
+        image = load_image(make_image_upload(size=(3000, 2000)))
+        self.assertEqual(image.mode, "RGB")
+        self.assertGreaterEqual(min(image.size), 224)
+        self.assertLess(max(image.size), 3000 // 4)
+
+    @override_settings(ANALYZER_DECODE_SIZE=224)
+    def test_large_png_is_reduced(self):
+        """
+        Test that formats without draft mode are still shrunk with reduce().
+        """
+        image = load_image(make_image_upload(name="dish.png", size=(1000, 1000), format="PNG"))
+        self.assertEqual(image.size, (250, 250))
+
+    @override_settings(ANALYZER_DECODE_SIZE=224)
+    def test_palette_and_bilevel_images_are_shrunk_before_conversion(self):
+        """
+        Test that palette and bilevel images are shrunk without a full-size RGB copy.
+        """
+        for mode in ("P", "1"):
+            buffer = io.BytesIO()
+            Image.new(mode, (1000, 1000), 1).save(buffer, format="PNG")
+            upload = SimpleUploadedFile("dish.png", buffer.getvalue(), content_type="image/png")
+            with patch.object(Image.Image, 'convert', autospec=True, side_effect=Image.Image.convert) as mock_convert:
+                image = load_image(upload)
+            self.assertEqual((image.mode, image.size), ("RGB", (250, 250)))
+            self.assertTrue(all(call.args[0].size == (250, 250) for call in mock_convert.call_args_list
+                                if call.args[1] == "RGB"))
+
+    @override_settings(ANALYZER_MAX_IMAGE_PIXELS=10_000_000)
+    @patch('PIL.Image.MAX_IMAGE_PIXELS', 1000)
+    def test_decompression_bombs_are_reported_as_too_large(self):
+        """
+        Test that Pillow's decompression bomb guard surfaces as ImageTooLargeError.
+        """
+        with self.assertRaises(ImageTooLargeError):
+            load_image(make_image_upload())
+
+    @override_settings(ANALYZER_MAX_UPLOAD_BYTES=10)
+    def test_byte_limit_is_checked_before_decoding(self):
+        """
+        Test that uploads over the byte limit are rejected.
+        """
+        with self.assertRaises(ImageTooLargeError):
+            load_image(make_image_upload())
+
+
+class OnnxImageClassifierTest(SimpleTestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.session.get_inputs.return_value = [MagicMock()]
+        self.session.get_inputs.return_value[0].name = "pixel_values"
+        self.processor = MagicMock(side_effect=lambda images, return_tensors: {
+            "pixel_values": np.zeros((len(images), 3, 4, 4), dtype=np.float32)
+        })
+        self.classifier = OnnxImageClassifier(
+            self.session, self.processor, {0: "apple_pie", 1: "sushi", 2: "waffles"}, top_k=2
+        )
+
+    def test_output_matches_pipeline_format(self):
+        """
+        Test that a single image returns a pipeline-style list of label/score dicts, best first.
+        """
+        self.session.run.return_value = [np.array([[0.1, 3.0, 1.0]], dtype=np.float32)]
+        predictions = self.classifier(Image.new("RGB", (8, 8)))
+        self.assertEqual([p["label"] for p in predictions], ["sushi", "waffles"])
+        self.assertIsInstance(predictions[0]["score"], float)
+        self.assertGreater(predictions[0]["score"], predictions[1]["score"])
+
+    def test_lists_of_images_are_batched(self):
+        """
+        Test that a list of images returns one prediction list per image, split into batch_size runs.
+        """
+        self.session.run.side_effect = lambda _, feeds: [np.tile([0.0, 0.0, 5.0], (len(feeds["pixel_values"]), 1))]
+        predictions = self.classifier([Image.new("RGB", (8, 8))] * 3, batch_size=2)
+        self.assertEqual(len(predictions), 3)
+        self.assertEqual(self.session.run.call_count, 2)
+        self.assertTrue(all(p[0]["label"] == "waffles" for p in predictions))
+
+
+class InferenceServerTest(SimpleTestCase):
+    """Runs a real server on a temporary Unix socket with a fake model."""
+
+    class FakePixelClassifier:
+        def __init__(self):
+            self.batch_sizes = []
+
+        def predict(self, pixel_values, top_k=5):
+            self.batch_sizes.append(len(pixel_values))
+            # Label each image by the mean of its pixels so results can be traced back.
+            return [
+                [{"label": f"mean-{float(row.mean()):.0f}", "score": 1.0}, {"label": "other", "score": 0.0}][:top_k]
+                for row in pixel_values
+            ]
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.socket_path = os.path.join(tmp_dir.name, "inference.sock")
+        self.model = self.FakePixelClassifier()
+        self.server = InferenceServer(self.socket_path, self.model, max_batch_size=8, max_wait=0.05)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        # Stand-in for the image processor: the "pixels" are the image's colour value.
+        processor = MagicMock(side_effect=lambda images, return_tensors: {
+            "pixel_values": np.stack([np.full((3, 2, 2), image.getpixel((0, 0))[0], dtype=np.float32) for image in images])
+        })
+        self.client = RemoteImageClassifier(self.socket_path, processor, timeout=5)
+
+    def test_client_gets_pipeline_style_predictions(self):
+        """
+        Test that single images and lists round-trip through shared memory with the right results.
+        """
+        self.assertEqual(self.client.ping(), {"ok": True})
+        self.assertEqual(self.client(Image.new("RGB", (4, 4), (7, 0, 0)), top_k=1), [{"label": "mean-7", "score": 1.0}])
+        predictions = self.client([Image.new("RGB", (4, 4), (c, 0, 0)) for c in (1, 2)])
+        self.assertEqual([p[0]["label"] for p in predictions], ["mean-1", "mean-2"])
+
+    def test_concurrent_clients_share_a_forward_pass(self):
+        """
+        Test that requests from several threads are batched together on the server.
+        """
+        results = {}
+
+        def worker(color):
+            results[color] = self.client(Image.new("RGB", (4, 4), (color, 0, 0)))[0]["label"]
+
+        threads = [threading.Thread(target=worker, args=(c,)) for c in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, {c: f"mean-{c}" for c in range(6)})
+        self.assertLess(len(self.model.batch_sizes), 6)
+
+    def test_read_timeouts_are_not_retried(self):
+        """
+        Test that a request the server received but did not answer in time is sent only once.
+        """
+        silent_path = self.socket_path + ".silent"
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(silent_path)
+        listener.listen()
+        self.addCleanup(listener.close)
+        client = RemoteImageClassifier(silent_path, MagicMock(), timeout=0.2)
+
+        with self.assertRaises(InferenceServerError):
+            client.ping()
+        listener.settimeout(0.5)
+        connection, _ = listener.accept()
+        self.addCleanup(connection.close)
+        with self.assertRaises(socket.timeout):
+            listener.accept()  # No second connection: the request was not re-sent.
+
+    def test_restarted_server_is_reconnected(self):
+        """
+        Test that a request on a connection the server has dropped is re-sent on a new connection.
+        """
+        self.assertEqual(self.client.ping()["ok"], True)
+        sock, _ = self.client._connection()
+        sock.shutdown(socket.SHUT_WR)  # The next write fails before anything is sent.
+        self.assertEqual(self.client.ping()["ok"], True)
+
+    def test_unreachable_server_raises(self):
+        """
+        Test that the client raises InferenceServerError when nothing listens on the socket.
+        """
+        client = RemoteImageClassifier(self.socket_path + ".missing", MagicMock(), timeout=1)
+        with self.assertRaises(InferenceServerError):
+            client.ping()
+
+
+@override_settings(USDA_API_KEY=None, ANALYZER_BATCH_MAX_SIZE=2)
+class BatchImageAnalysisViewTest(TestCase):
+    def setUp(self):
+        self.url = reverse('analyze_batch')
+        patcher = patch('analyzer.views.image_classifier_loader')
+        self.loader = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Each image is classified by its colour so results can be matched to uploads.
+        self.loader.get.return_value = MagicMock(side_effect=lambda images, batch_size: [
+            [{"label": "sushi" if image.getpixel((0, 0))[0] > 128 else "ramen", "score": 0.9}] for image in images
+        ])
+
+    def read_lines(self, response):
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    @patch('analyzer.views.get_nutrition_for_candidates')
+    def test_images_are_streamed_in_order_with_shared_nutrition_lookups(self, mock_nutrition):
+        """
+        Test that every upload gets one NDJSON line in order, classification runs in chunks,
+        and each dish's nutrition is looked up once for the whole job.
+        """
+        mock_nutrition.side_effect = lambda names: [{"calories": len(name)} for name in names]
+        uploads = [make_image_upload(f"{i}.jpg", color=(255 if i % 2 else 0, 0, 0)) for i in range(5)]
+
+        lines = self.read_lines(self.client.post(self.url, {"images": uploads}))
+
+        self.assertEqual([line["index"] for line in lines], [0, 1, 2, 3, 4])
+        self.assertEqual(
+            [line["analysis"]["metadata"]["dish_name"] for line in lines],
+            ["Ramen", "Sushi", "Ramen", "Sushi", "Ramen"],
+        )
+        self.assertEqual(self.loader.get.return_value.call_count, 3)
+        looked_up = [name for call in mock_nutrition.call_args_list for name in call.args[0]]
+        self.assertEqual(sorted(looked_up), ["Ramen", "Sushi"])
+
+    @patch('analyzer.views.get_nutrition_for_candidates', side_effect=lambda names: [{} for _ in names])
+    def test_zip_archive_and_bad_members(self, mock_nutrition):
+        """
+        Test that images inside a zip archive are analyzed and unreadable members get an error line.
+        """
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            zf.writestr("meals/lunch.jpg", make_image_upload().read())
+            zf.writestr("meals/broken.png", b"not really a png")
+            zf.writestr("meals/notes.txt", b"skipped")
+        archive = SimpleUploadedFile("meals.zip", buffer.getvalue(), content_type="application/zip")
+
+        lines = self.read_lines(self.client.post(self.url, {"archive": archive}))
+
+        self.assertEqual([line["filename"] for line in lines], ["meals/lunch.jpg", "meals/broken.png"])
+        self.assertIn("analysis", lines[0])
+        self.assertIn("error", lines[1])
+
+    @patch('analyzer.views.get_nutrition_for_candidates', side_effect=lambda names: [{} for _ in names])
+    def test_corrupt_archive_members_get_an_error_line(self, mock_nutrition):
+        """
+        Test that a member that fails its CRC check gets an error line and later members are still analyzed.
+        """
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            zf.writestr("first.jpg", make_image_upload().read())
+            zf.writestr("corrupt.jpg", make_image_upload().read())
+            zf.writestr("last.jpg", make_image_upload().read())
+            info = zf.getinfo("corrupt.jpg")
+        data = bytearray(buffer.getvalue())
+        # Flip a byte of the stored member's data, after its local header.
+        data[info.header_offset + 30 + len(info.filename) + 100] ^= 0xFF
+        archive = SimpleUploadedFile("meals.zip", bytes(data), content_type="application/zip")
+
+        lines = self.read_lines(self.client.post(self.url, {"archive": archive}))
+
+        self.assertEqual([line["filename"] for line in lines], ["first.jpg", "corrupt.jpg", "last.jpg"])
+        self.assertEqual(lines[1]["error"], "The file could not be read from the archive.")
+        self.assertIn("analysis", lines[0])
+        self.assertIn("analysis", lines[2])
+
+    @patch('PIL.Image.MAX_IMAGE_PIXELS', 5000)
+    @patch('analyzer.views.get_nutrition_for_candidates', side_effect=lambda names: [{} for _ in names])
+    def test_decompression_bomb_gets_an_error_line(self, mock_nutrition):
+        """
+        Test that an image Pillow refuses to open gets its own error line and the stream continues.
+        """
+        uploads = [make_image_upload("bomb.png", size=(200, 200), format="PNG"), make_image_upload("ok.jpg")]
+
+        lines = self.read_lines(self.client.post(self.url, {"images": uploads}))
+
+        self.assertEqual([line["filename"] for line in lines], ["bomb.png", "ok.jpg"])
+        self.assertIn("error", lines[0])
+        self.assertIn("analysis", lines[1])
+
+    @patch('analyzer.views.load_image', side_effect=[RuntimeError("codec crashed"), Image.new("RGB", (8, 8))])
+    @patch('analyzer.views.get_nutrition_for_candidates', side_effect=lambda names: [{} for _ in names])
+    def test_unexpected_decode_errors_get_an_error_line(self, mock_nutrition, mock_load_image):
+        """
+        Test that an unexpected decoding error is reported for that file only.
+        """
+        uploads = [make_image_upload("first.jpg"), make_image_upload("second.jpg")]
+
+        lines = self.read_lines(self.client.post(self.url, {"images": uploads}))
+
+        self.assertEqual(lines[0]["error"], "An error occurred: codec crashed")
+        self.assertIn("analysis", lines[1])
+
+    @override_settings(ANALYZER_BATCH_MAX_IMAGES=2)
+    def test_batches_over_the_image_limit_are_rejected(self):
+        """
+        Test that a batch with more images than allowed, counting archive members, gets a 413.
+        """
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            zf.writestr("a.jpg", make_image_upload().read())
+            zf.writestr("notes.txt", b"not counted")
+        archive = SimpleUploadedFile("meals.zip", buffer.getvalue(), content_type="application/zip")
+        uploads = [make_image_upload("1.jpg"), make_image_upload("2.jpg")]
+
+        response = self.client.post(self.url, {"images": uploads, "archive": archive})
+
+        self.assertEqual(response.status_code, 413)
+        self.loader.get.return_value.assert_not_called()
+
+    def test_upload_limit_matches_the_batch_limit(self):
+        """
+        Test that a batch at the image limit reaches the view and one more image gets the view's 413, not Django's 400.
+        """
+        limit = settings.ANALYZER_BATCH_MAX_IMAGES
+        image = make_image_upload().read()
+
+        def uploads(count):
+            return [SimpleUploadedFile(f"{i}.jpg", image, content_type="image/jpeg") for i in range(count)]
+
+        response = self.client.post(self.url, {"images": uploads(limit)})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+        response = self.client.post(self.url, {"images": uploads(limit + 1)})
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("the limit is", response.json()["error"])
+
+    def test_request_without_images_is_rejected(self):
+        """
+        Test that the batch endpoint returns a 400 error if nothing is uploaded.
+        """
+        self.assertEqual(self.client.post(self.url, {}).status_code, 400)
+
+
+@override_settings(GEMINI_API_KEY="test-key", RECIPE_CACHE_TTL=60)
+class RecipeCacheTest(TestCase):
+    RECIPES = [{"id": 1, "title": "Shakshuka", "description": "Eggs in spiced tomato sauce.", "image": "x"}]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @patch('analyzer.recipes.generate_recipes')
+    def test_repeat_category_is_served_from_cache(self, mock_generate):
+        """
+        Test that the same category (in any casing/spacing) only reaches Gemini once while fresh.
+        """
+        mock_generate.return_value = self.RECIPES
+        response = self.client.get(reverse('generate_recipes'), {"category": "Middle  Eastern"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), get_recipes("middle eastern"))
+        self.assertEqual([recipe["title"] for recipe in response.json()], ["Shakshuka"])
+        mock_generate.assert_called_once()
+
+    @patch('analyzer.recipes.schedule_refresh')
+    @patch('analyzer.recipes.generate_recipes')
+    def test_stale_entries_are_served_while_refreshing(self, mock_generate, mock_refresh):
+        """
+        Test that a stale entry is returned immediately and a background refresh is scheduled.
+        """
+        cache.set(recipe_cache_key("vegan"), {"recipes": self.RECIPES, "generated_at": 0}, timeout=None)
+        self.assertEqual(get_recipes("vegan"), self.RECIPES)
+        mock_generate.assert_not_called()
+        mock_refresh.assert_called_once_with("vegan")
+
+    @patch('analyzer.recipes.generate_recipes')
+    def test_background_refresh_replaces_stale_entry(self, mock_generate):
+        """
+        Test that the background refresh stores newly generated recipes.
+        """
+        mock_generate.return_value = self.RECIPES
+        schedule_refresh("tapas").join(timeout=5)
+        self.assertEqual(cache.get(recipe_cache_key("tapas"))["recipes"], self.RECIPES)
+
+    @patch('analyzer.recipes.generate_recipes')
+    def test_refresh_skips_categories_refreshed_by_another_worker(self, mock_generate):
+        """
+        Test that a refresh started from a stale mirror only re-reads the catalog once it is fresh again.
+        """
+        save_catalog_recipes("vegan", self.RECIPES)
+        cache.set(recipe_cache_key("vegan"), {"recipes": [], "generated_at": 0}, timeout=None)
+
+        _refresh("vegan")
+
+        mock_generate.assert_not_called()
+        self.assertEqual([recipe["title"] for recipe in get_recipes("vegan")], ["Shakshuka"])
+
+
+class StreamingRecipesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_objects_are_yielded_as_soon_as_they_close(self):
+        """
+        Test that the incremental parser handles fences, split chunks, and braces or quotes inside strings.
+        """
+        text = '```json\n[{"id": 1, "title": "Curly {brace} \\"pie\\""}, {"id": 2, "tags": ["a", "b"]}]\n```'
+        chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+        consumed = []
+
+        def tracked():
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        objects = iter_json_objects(tracked())
+        first = next(objects)
+        self.assertEqual(first, {"id": 1, "title": 'Curly {brace} "pie"'})
+        self.assertLess(len(consumed), len(chunks))  # Yielded before the stream ended.
+        self.assertEqual(list(objects), [{"id": 2, "tags": ["a", "b"]}])
+
+    @override_settings(GEMINI_API_KEY="test-key")
+    @patch('analyzer.recipes.gemini_stream')
+    def test_stream_endpoint_emits_ndjson_and_fills_cache(self, mock_stream):
+        """
+        Test that the streaming endpoint sends one NDJSON line per recipe and caches the full list.
+        """
+        text = '[{"id": 1, "title": "Pho"}, {"id": 2, "title": "Banh Mi"}]'
+        mock_stream.return_value = iter([text[:15], text[15:]])
+
+        response = self.client.get(reverse('stream_recipes'), {"category": "Vietnamese"})
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual([line["title"] for line in lines], ["Pho", "Banh Mi"])
+        self.assertEqual([recipe["title"] for recipe in get_recipes("vietnamese")], ["Pho", "Banh Mi"])
+        mock_stream.assert_called_once()
+
+
+@override_settings(GEMINI_API_KEY="test-key", GEMINI_RECIPE_MODEL="gemini-test")
+class GeminiRecipeGenerationTest(TestCase):
+    """Runs recipe generation through the real google-genai client, with only the HTTP transport faked."""
+    TEXT = '[{"id": 1, "title": "Pho"}, {"id": 2, "title": "Banh Mi"}]'
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(SINGLEFLIGHT_DIR=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.requests = []
+
+    def handler(self, request):
+        self.requests.append(request.url.path)
+        chunks = [self.TEXT[:15], self.TEXT[15:]] if request.url.path.endswith(":streamGenerateContent") else [self.TEXT]
+        events = [{"candidates": [{"content": {"role": "model", "parts": [{"text": chunk}]}}]} for chunk in chunks]
+        if len(chunks) == 1:
+            return httpx.Response(200, json=events[0])
+        body = "".join(f"data: {json.dumps(event)}\r\n\r\n" for event in events)
+        return httpx.Response(200, content=body.encode(), headers={"content-type": "text/event-stream"})
+
+    def gemini_client(self):
+        http_client = httpx.Client(transport=httpx.MockTransport(self.handler))
+        return genai.Client(api_key="test-key", http_options=types.HttpOptions(httpx_client=http_client))
+
+    def test_generate_endpoint_calls_generate_content(self):
+        """
+        Test that a category miss is generated with models.generate_content on the configured model.
+        """
+        with patch('pants_backend.llm.get_gemini_client', return_value=self.gemini_client()):
+            response = self.client.get(reverse('generate_recipes'), {"category": "Vietnamese"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe["title"] for recipe in response.json()], ["Pho", "Banh Mi"])
+        self.assertEqual(self.requests, ["/v1beta/models/gemini-test:generateContent"])
+
+    def test_stream_endpoint_calls_generate_content_stream(self):
+        """
+        Test that the streaming endpoint reads server-sent chunks from models.generate_content_stream.
+        """
+        with patch('pants_backend.llm.get_gemini_client', return_value=self.gemini_client()):
+            response = self.client.get(reverse('stream_recipes'), {"category": "Vietnamese"})
+            lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([line["title"] for line in lines], ["Pho", "Banh Mi"])
+        self.assertEqual(self.requests, ["/v1beta/models/gemini-test:streamGenerateContent"])
+
+
+@override_settings(GEMINI_API_KEY="test-key")
+class RecipeCatalogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        save_catalog_recipes("italian", [
+            {"title": "Risotto alla Milanese", "description": "Creamy saffron rice with parmesan.", "image": "a"},
+            {"title": "Saffron Arancini", "description": "Fried rice balls.", "image": "b"},
+            {"title": "Tiramisu", "description": "Coffee soaked ladyfingers with mascarpone.", "image": "c"},
+        ])
+        save_catalog_recipes("indian", [
+            {"title": "Saffron Biryani", "description": "Layered rice with spices.", "image": "d"},
+        ])
+
+    @patch('analyzer.recipes.generate_recipes')
+    def test_catalogued_category_skips_generation(self, mock_generate):
+        """
+        Test that a catalogued category is served from the database without calling Gemini.
+        """
+        response = self.client.get(reverse('generate_recipes'), {"category": "Italian"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+        mock_generate.assert_not_called()
+
+    @patch('analyzer.recipes.generate_recipes')
+    def test_new_category_is_generated_once_and_catalogued(self, mock_generate):
+        """
+        Test that an unseen category is generated on first request and persisted for later ones.
+        """
+        mock_generate.return_value = [{"id": 7, "title": "Ramen", "description": "Noodle soup.", "image": "e"}]
+        first = get_recipes("Japanese")
+        cache.clear()
+        self.assertEqual(get_recipes("japanese"), first)
+        self.assertEqual(list(Recipe.objects.filter(category="japanese").values_list("title", flat=True)), ["Ramen"])
+        mock_generate.assert_called_once()
+
+    def test_search_matches_words_and_prefixes(self):
+        """
+        Test that search matches title and description words, including prefixes, with title hits ranked first.
+        """
+        titles = [recipe.title for recipe in search_recipes("saffr")]
+        self.assertCountEqual(titles[:2], ["Saffron Arancini", "Saffron Biryani"])
+        self.assertEqual(titles[2:], ["Risotto alla Milanese"])
+        self.assertEqual([recipe.title for recipe in search_recipes("mascarpone coffee")], ["Tiramisu"])
+        self.assertEqual(search_recipes('") OR title:*'), [])
+
+    def test_search_endpoint_filters_by_category(self):
+        """
+        Test that the search endpoint honours the category filter and limit.
+        """
+        response = self.client.get(reverse('search_recipes'), {"q": "saffron", "category": " Indian"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe["title"] for recipe in response.json()["results"]], ["Saffron Biryani"])
+
+        response = self.client.get(reverse('search_recipes'), {"category": "italian", "limit": 2})
+        self.assertEqual(response.json()["count"], 2)
+        self.assertEqual(self.client.get(reverse('search_recipes'), {"limit": "many"}).status_code, 400)
+
+    def test_search_limit_is_clamped(self):
+        """
+        Test that zero or negative limits return one result on both the browse and full-text paths.
+        """
+        for params in ({"limit": -1}, {"q": "saffron", "limit": -1}, {"limit": 0}):
+            response = self.client.get(reverse('search_recipes'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["count"], 1)
+
+    @override_settings(GEMINI_API_KEY=None)
+    def test_catalogued_categories_are_served_without_an_api_key(self):
+        """
+        Test that known categories work with no Gemini key and only new categories require one.
+        """
+        self.assertEqual(self.client.get(reverse('generate_recipes'), {"category": "Italian"}).status_code, 200)
+        response = self.client.get(reverse('stream_recipes'), {"category": "Italian"})
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 3)
+
+        self.assertEqual(self.client.get(reverse('generate_recipes'), {"category": "Thai"}).status_code, 500)
+        self.assertEqual(self.client.get(reverse('stream_recipes'), {"category": "Thai"}).status_code, 500)
+
+    @override_settings(RECIPE_CACHE_TTL=60)
+    @patch('analyzer.recipes.schedule_refresh')
+    def test_old_catalog_rows_are_refreshed(self, mock_refresh):
+        """
+        Test that catalogued recipes older than the TTL are served while a refresh is scheduled.
+        """
+        get_recipes("italian")
+        mock_refresh.assert_not_called()
+
+        cache.clear()
+        Recipe.objects.filter(category="italian").update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(len(get_recipes("italian")), 3)
+        mock_refresh.assert_called_once_with("italian")
+
+    @patch('analyzer.recipes.generate_recipes')
+    def test_refresh_replaces_catalogued_recipes(self, mock_generate):
+        """
+        Test that a background refresh regenerates a stale catalogued category and serves the new recipes.
+        """
+        mock_generate.return_value = [{"title": "Ossobuco", "description": "Braised veal shanks.", "image": "f"}]
+        Recipe.objects.filter(category="italian").update(created_at=timezone.now() - timedelta(days=1))
+        _refresh("italian")  # The body of the background thread, run here to stay in the test transaction.
+        self.assertEqual([recipe["title"] for recipe in get_recipes("italian")], ["Ossobuco"])
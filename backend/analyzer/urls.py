@@ -2,10 +2,23 @@
 
 from django.urls import path
 # Make sure to import the new view
-from .views import ImageAnalysisView, GenerateRecipesView
+from .views import (
+    ImageAnalysisView, BatchImageAnalysisView, GenerateRecipesView, StreamRecipesView, RecipeSearchView,
+    ClassifierReadinessView, analyze_image_async,
+)
 
 urlpatterns = [
     path('analyze/', ImageAnalysisView.as_view(), name='analyze_image'),
+    # Non-blocking variant of analyze/ for ASGI deployments
+    path('analyze/async/', analyze_image_async, name='analyze_image_async'),
+    # Many images (or a zip archive) per request, streamed back as NDJSON
+    path('analyze/batch/', BatchImageAnalysisView.as_view(), name='analyze_batch'),
+    # Readiness probe: 503 until the classifier is loaded and warmed up
+    path('ready/', ClassifierReadinessView.as_view(), name='analyzer_ready'),
     # Add this new URL pattern for the recipe generator
     path('recipes/', GenerateRecipesView.as_view(), name='generate_recipes'),
+    # Same recipes streamed as NDJSON, one line per recipe as soon as it is generated
+    path('recipes/stream/', StreamRecipesView.as_view(), name='stream_recipes'),
+    # Full-text search and browsing over the local recipe catalog
+    path('recipes/search/', RecipeSearchView.as_view(), name='search_recipes'),
 ]
\ No newline at end of file
@@ -1,110 +1,362 @@
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from PIL import Image
-from transformers import pipeline
-import requests
+from PIL import UnidentifiedImageError
+import asyncio
+import itertools
 import logging
-from google import genai
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import json
+from pants_backend.batching import MicroBatcher
+from .classifier import image_classifier_loader
+from .image_cache import AnalysisCache, file_digest, perceptual_hash
+from .imaging import ImageTooLargeError, load_image
+from .nutrition import aget_nutrition_for_candidates, get_nutrition_for_candidates
+from .catalog import recipe_to_dict, search_recipes
+from .recipes import cached_recipes, get_recipes, normalize_category, stream_recipes
 logger = logging.getLogger(__name__)
 
-# --- This part of your code for image analysis remains the same ---
-try:
-    image_classifier = pipeline("image-classification", model="nateraw/food")
-except Exception as e:
-    image_classifier = None
-    logger.error(f"Failed to load image classifier model: {e}")
-
-def get_usda_nutrition(food_name: str):
-    # (Your existing get_usda_nutrition function code goes here, unchanged)
-    api_key = settings.USDA_API_KEY
-    if not api_key:
-        logger.warning("USDA_API_KEY not found in settings.")
-        return {}
-    try:
-        search_params = {"query": food_name, "api_key": api_key, "pageSize": 1}
-        search_response = requests.get("https://api.nal.usda.gov/fdc/v1/foods/search", params=search_params)
-        search_response.raise_for_status()
-        search_data = search_response.json()
-        if not search_data.get('foods'):
-            logger.info(f"No food found for '{food_name}' in USDA database.")
-            return {}
-        fdc_id = search_data['foods'][0]['fdcId']
-        details_url = f"https://api.nal.usda.gov/fdc/v1/food/{fdc_id}"
-        details_response = requests.get(details_url, params={"api_key": api_key})
-        details_response.raise_for_status()
-        details_data = details_response.json()
-        nutrients = {"calories": 0, "proteins": 0, "fats": 0, "carbs": 0}
-        for nutrient in details_data.get('foodNutrients', []):
-            num = nutrient.get("nutrient", {}).get("number")
-            if num == "208": nutrients['calories'] = nutrient.get('amount', 0)
-            elif num == "203": nutrients['proteins'] = nutrient.get('amount', 0)
-            elif num == "204": nutrients['fats'] = nutrient.get('amount', 0)
-            elif num == "205": nutrients['carbs'] = nutrient.get('amount', 0)
-        return nutrients
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching USDA data for '{food_name}': {e}")
-        return {}
-    except (KeyError, IndexError) as e:
-        logger.error(f"Error parsing USDA data for '{food_name}': {e}")
-        return {}
+def classify_batch(images):
+    """Runs one forward pass over a list of images; returns one prediction list per image."""
+    image_classifier = image_classifier_loader.get()
+    if image_classifier is None:
+        raise RuntimeError("AI model is not available.")
+    return image_classifier(images, batch_size=len(images))
+
+# Requests arriving within the same wait window share a single pipeline call.
+image_batcher = MicroBatcher(
+    classify_batch,
+    max_batch_size=settings.ANALYZER_BATCH_MAX_SIZE,
+    max_wait=settings.ANALYZER_BATCH_MAX_WAIT_MS / 1000.0,
+    name="image-classifier-batcher",
+)
+
+# Re-uploads of the same photo (or a re-encoded copy) skip inference entirely.
+analysis_cache = AnalysisCache(
+    max_entries=settings.ANALYSIS_CACHE_MAX_ENTRIES,
+    max_distance=settings.ANALYSIS_CACHE_HAMMING_THRESHOLD,
+)
+
+def get_candidate_names(predictions):
+    """Display names of the top ANALYZER_TOP_K predictions, best first."""
+    return [p['label'].replace("_", " ").title() for p in predictions[:settings.ANALYZER_TOP_K]]
+
+
+def build_analysis(predictions, candidate_nutrition):
+    """Builds the `analysis` payload from pipeline predictions and one nutrient dict per candidate."""
+    top_predictions = predictions[:settings.ANALYZER_TOP_K]
+    candidate_names = get_candidate_names(predictions)
+    top_prediction = candidate_names[0]
+    nutrition_data = candidate_nutrition[0]
+    return {
+        "total_profile": nutrition_data,
+        "ingredient_breakdown": [{"ingredient": {"name": top_prediction}, "nutrients": nutrition_data, "cost": None}],
+        "metadata": {
+            "dish_name": top_prediction,
+            "detected_items": [p['label'].replace("_", " ") for p in predictions[:3]],
+            "candidates": [
+                {"name": name, "score": p['score'], "nutrients": nutrients}
+                for name, p, nutrients in zip(candidate_names, top_predictions, candidate_nutrition)
+            ],
+        }
+    }
+
 
 class ImageAnalysisView(APIView):
-    # (Your existing ImageAnalysisView code goes here, unchanged)
     def post(self, request, *args, **kwargs):
         image_file = request.FILES.get('image')
         if not image_file:
             return Response({"error": "No image file provided"}, status=status.HTTP_400_BAD_REQUEST)
-        if not image_classifier:
+        digest = file_digest(image_file)
+        cached_analysis = analysis_cache.get_exact(digest)
+        if cached_analysis is not None:
+            return Response({"analysis": cached_analysis})
+        if image_classifier_loader.get() is None:
             return Response({"error": "AI model is not available."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         try:
-            image = Image.open(image_file).convert("RGB")
-            predictions = image_classifier(image)
+            image = load_image(image_file)
+            phash = perceptual_hash(image)
+            cached_analysis = analysis_cache.get_similar(phash)
+            if cached_analysis is not None:
+                return Response({"analysis": cached_analysis})
+            predictions = image_batcher(image)
             if not predictions:
                 return Response({"error": "Could not classify the image."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            top_prediction = predictions[0]['label'].replace("_", " ").title()
-            nutrition_data = get_usda_nutrition(top_prediction)
-            analysis_response = {
-                "total_profile": nutrition_data,
-                "ingredient_breakdown": [{"ingredient": {"name": top_prediction}, "nutrients": nutrition_data, "cost": None}],
-                "metadata": {"dish_name": top_prediction, "detected_items": [p['label'].replace("_", " ") for p in predictions[:3]]}
-            }
+            candidate_names = get_candidate_names(predictions)
+            # All candidates are looked up concurrently, so this costs about one lookup.
+            analysis_response = build_analysis(predictions, get_nutrition_for_candidates(candidate_names))
+            # Results without nutrition may come from a USDA outage, so they are not pinned in the cache.
+            if analysis_response["total_profile"]:
+                analysis_cache.put(digest, phash, analysis_response)
             return Response({"analysis": analysis_response})
+        except ImageTooLargeError as e:
+            return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except UnidentifiedImageError:
+            return Response({"error": "The uploaded file is not a supported image."}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"An error occurred during image analysis: {e}")
             return Response({"error": f"An error occurred: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# --- Async analysis (ASGI) ---
+def decode_and_match(image_file):
+    """CPU-bound half of the async path: decode, hash and check the perceptual cache."""
+    image = load_image(image_file)
+    phash = perceptual_hash(image)
+    return image, phash, analysis_cache.get_similar(phash)
+
+
+async def analyze_image_async(request):
+    """
+    Same contract as ImageAnalysisView, written for the ASGI entry point.
+    Decoding runs on the bounded decode pool, inference waits on the shared
+    micro-batcher without holding a thread, and USDA lookups use an async
+    HTTP client, so one worker can hold many analyses waiting on I/O.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    image_file = request.FILES.get('image')
+    if not image_file:
+        return JsonResponse({"error": "No image file provided"}, status=400)
+
+    loop = asyncio.get_running_loop()
+    executor = get_decode_executor()
+    digest = await loop.run_in_executor(executor, file_digest, image_file)
+    cached_analysis = analysis_cache.get_exact(digest)
+    if cached_analysis is not None:
+        return JsonResponse({"analysis": cached_analysis})
+    if await loop.run_in_executor(executor, image_classifier_loader.get) is None:
+        return JsonResponse({"error": "AI model is not available."}, status=500)
+    try:
+        image, phash, cached_analysis = await loop.run_in_executor(executor, decode_and_match, image_file)
+        if cached_analysis is not None:
+            return JsonResponse({"analysis": cached_analysis})
+        predictions = await asyncio.wrap_future(image_batcher.submit(image))
+        if not predictions:
+            return JsonResponse({"error": "Could not classify the image."}, status=500)
+        candidate_nutrition = await aget_nutrition_for_candidates(get_candidate_names(predictions))
+        analysis_response = build_analysis(predictions, candidate_nutrition)
+        if analysis_response["total_profile"]:
+            analysis_cache.put(digest, phash, analysis_response)
+        return JsonResponse({"analysis": analysis_response})
+    except ImageTooLargeError as e:
+        return JsonResponse({"error": str(e)}, status=413)
+    except UnidentifiedImageError:
+        return JsonResponse({"error": "The uploaded file is not a supported image."}, status=400)
+    except Exception as e:
+        logger.error(f"An error occurred during image analysis: {e}")
+        return JsonResponse({"error": f"An error occurred: {e}"}, status=500)
+
+# Django 3.2's csrf_exempt decorator does not support coroutine views; set the flag directly.
+analyze_image_async.csrf_exempt = True
+
+
+# --- Batch analysis ---
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.heic')
+
+
+@lru_cache(maxsize=1)
+def get_decode_executor():
+    return ThreadPoolExecutor(max_workers=settings.ANALYZER_DECODE_WORKERS, thread_name_prefix="image-decode")
+
+
+def is_archive_image(info):
+    return not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def count_archive_images(archive):
+    """Number of image members, read from the zip's central directory without extracting anything."""
+    with zipfile.ZipFile(archive) as zf:
+        return sum(1 for info in zf.infolist() if is_archive_image(info))
+
+
+def iter_archive_images(archive):
+    """
+    Yields (filename, file, size) for each image in a zip archive, reading one
+    member at a time. File is None for members that are not extracted.
+    """
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            if not is_archive_image(info):
+                continue
+            if info.file_size > settings.ANALYZER_MAX_UPLOAD_BYTES:
+                # Oversized members are reported without being extracted.
+                yield info.filename, None, info.file_size
+                continue
+            try:
+                data = zf.read(info)
+            except Exception as e:
+                # A corrupt or encrypted member (bad CRC, unsupported compression,
+                # password set) is reported on its own line like any other bad file.
+                logger.error(f"Could not read archive member '{info.filename}': {e}")
+                yield info.filename, None, info.file_size
+                continue
+            yield info.filename, ContentFile(data, name=info.filename), info.file_size
+
+
+def decode_upload(upload):
+    filename, image_file, size = upload
+    if size > settings.ANALYZER_MAX_UPLOAD_BYTES:
+        return None, f"Image is {size} bytes; the limit is {settings.ANALYZER_MAX_UPLOAD_BYTES}."
+    if image_file is None:
+        return None, "The file could not be read from the archive."
+    try:
+        return load_image(image_file), None
+    except ImageTooLargeError as e:
+        return None, str(e)
+    except (UnidentifiedImageError, OSError):
+        return None, "The uploaded file is not a supported image."
+    except Exception as e:
+        # One bad file must not end the stream for the rest of the batch.
+        logger.error(f"Could not decode batch upload '{filename}': {e}")
+        return None, f"An error occurred: {e}"
+
+
+def stream_batch_analysis(uploads):
+    """
+    Yields one NDJSON line per upload. Uploads are consumed in chunks of
+    ANALYZER_BATCH_MAX_SIZE: each chunk is decoded on a thread pool, classified
+    in one forward pass and enriched with nutrition looked up once per distinct
+    dish for the whole job. Only one chunk of decoded images is held at a time.
+    """
+    nutrition_by_name = {}
+    index = itertools.count()
+    uploads = iter(uploads)
+    while True:
+        chunk = list(itertools.islice(uploads, settings.ANALYZER_BATCH_MAX_SIZE))
+        if not chunk:
+            return
+        decoded = list(get_decode_executor().map(decode_upload, chunk))
+        images = [image for image, _ in decoded if image is not None]
+        try:
+            predictions = iter(classify_batch(images) if images else [])
+            error = None
+        except Exception as e:
+            logger.error(f"Batch classification failed: {e}")
+            predictions, error = iter(()), f"An error occurred: {e}"
+
+        results = []
+        for (filename, _, _), (image, decode_error) in zip(chunk, decoded):
+            if decode_error or error:
+                results.append((filename, None, decode_error or error))
+            else:
+                results.append((filename, next(predictions), None))
+
+        names = {name for _, p, _ in results if p for name in get_candidate_names(p)}
+        new_names = sorted(names - nutrition_by_name.keys())
+        nutrition_by_name.update(zip(new_names, get_nutrition_for_candidates(new_names)))
+
+        for filename, image_predictions, result_error in results:
+            line = {"index": next(index), "filename": filename}
+            if result_error:
+                line["error"] = result_error
+            elif not image_predictions:
+                line["error"] = "Could not classify the image."
+            else:
+                candidate_nutrition = [nutrition_by_name[name] for name in get_candidate_names(image_predictions)]
+                line["analysis"] = build_analysis(image_predictions, candidate_nutrition)
+            yield json.dumps(line) + "\n"
+
+
+class BatchImageAnalysisView(APIView):
+    """
+    Analyzes many images in one request, sent as repeated `images` files or as
+    a zip `archive`. Results are streamed as NDJSON, one line per image, in
+    upload order.
+    """
+    def post(self, request, *args, **kwargs):
+        files = request.FILES.getlist('images')
+        archive = request.FILES.get('archive')
+        if not files and not archive:
+            return Response({"error": "No images or archive provided"}, status=status.HTTP_400_BAD_REQUEST)
+        if image_classifier_loader.get() is None:
+            return Response({"error": "AI model is not available."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if archive and not zipfile.is_zipfile(archive):
+            return Response({"error": "The archive is not a valid zip file."}, status=status.HTTP_400_BAD_REQUEST)
+
+        image_count = len(files) + (count_archive_images(archive) if archive else 0)
+        if image_count > settings.ANALYZER_BATCH_MAX_IMAGES:
+            return Response(
+                {"error": f"The batch has {image_count} images; the limit is {settings.ANALYZER_BATCH_MAX_IMAGES}."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        uploads = [(f.name, f, f.size) for f in files]
+        if archive:
+            archive.seek(0)
+            uploads = itertools.chain(uploads, iter_archive_images(archive))
+        return StreamingHttpResponse(stream_batch_analysis(uploads), content_type='application/x-ndjson')
+
+
+class ClassifierReadinessView(APIView):
+    """
+    Readiness probe for the load balancer: 200 once the model is loaded and warm, 503 before.
+    Without ANALYZER_WARMUP_ON_STARTUP nothing else loads the model before traffic arrives,
+    so the first probe starts the background warm-up.
+    """
+    def get(self, request, *args, **kwargs):
+        classifier_status = image_classifier_loader.status()
+        if not classifier_status["ready"]:
+            image_classifier_loader.start_background_warm_up()
+        http_status = status.HTTP_200_OK if classifier_status["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+        return Response(classifier_status, status=http_status)
+
+
 # --- CORRECTED DYNAMIC RECIPE VIEW ---
 class GenerateRecipesView(APIView):
     def get(self, request, *args, **kwargs):
         category = request.query_params.get('category', 'popular global dishes')
-        api_key = settings.GEMINI_API_KEY
-        if not api_key:
-            logger.error("Gemini API key is not configured in .env file.")
-            return Response({"error": "Gemini API key not configured."}, status=500)
-
         try:
-            genai.configure(api_key=api_key)
-            
-            # Using the standard model name which will now work correctly
-            model = genai.GenerativeModel('gemini-pro')
-
-            prompt = f"""
-            Generate a list of 12 diverse and authentic recipes for the theme: "{category}".
-            For each recipe, provide: a unique id, a creative title, a short description (15-20 words), and a high-quality, royalty-free image URL from Unsplash or Pexels.
-            Return the response as a valid JSON array only.
-            """
-            
-            response = model.generate_content(prompt)
-            
-            cleaned_response = response.text.strip().lstrip("```json").rstrip("```")
-            recipes_data = json.loads(cleaned_response)
-            
+            # Served from the recipe cache or catalog; Gemini is only called on a miss or in a background refresh.
+            recipes_data = cached_recipes(category)
+            if recipes_data is None:
+                if not settings.GEMINI_API_KEY:
+                    logger.error("Gemini API key is not configured in .env file.")
+                    return Response({"error": "Gemini API key not configured."}, status=500)
+                recipes_data = get_recipes(category)
             return Response(recipes_data)
 
         except Exception as e:
             logger.error(f"A critical Gemini API error occurred for category '{category}': {e}")
-            return Response({"error": f"An error occurred: {str(e)}"}, status=500)
\ No newline at end of file
+            return Response({"error": f"An error occurred: {str(e)}"}, status=500)
+
+
+class StreamRecipesView(APIView):
+    """
+    Streaming variant of GenerateRecipesView: one NDJSON line per recipe, sent
+    as soon as the model has finished writing it.
+    """
+    def get(self, request, *args, **kwargs):
+        category = request.query_params.get('category', 'popular global dishes')
+        recipes = cached_recipes(category)
+        if recipes is None and not settings.GEMINI_API_KEY:
+            logger.error("Gemini API key is not configured in .env file.")
+            return Response({"error": "Gemini API key not configured."}, status=500)
+
+        def lines():
+            try:
+                for recipe in recipes if recipes is not None else stream_recipes(category):
+                    yield json.dumps(recipe) + "\n"
+            except Exception as e:
+                logger.error(f"A critical Gemini API error occurred for category '{category}': {e}")
+                yield json.dumps({"error": f"An error occurred: {str(e)}"}) + "\n"
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+
+class RecipeSearchView(APIView):
+    """Searches the local recipe catalog: `q` matches title and description, `category` filters."""
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        category = request.query_params.get('category')
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 50)), 200))
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        recipes = search_recipes(query, normalize_category(category) if category else None, limit=limit)
+        return Response({"count": len(recipes), "results": [recipe_to_dict(recipe) for recipe in recipes]})
@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import CachedAnswer
+
+
+@admin.register(CachedAnswer)
+class CachedAnswerAdmin(admin.ModelAdmin):
+    list_display = ('query', 'created_at', 'last_used_at')
+    search_fields = ('query', 'answer')
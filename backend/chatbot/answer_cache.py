@@ -0,0 +1,136 @@
+"""
+Semantic cache of chatbot answers, shared by all worker processes through the
+database.
+
+A question is first looked up by its normalized text, which costs no API call.
+Otherwise its embedding is compared with the embeddings of cached questions
+and the answer of the closest one is reused if it lies within
+CHATBOT_ANSWER_CACHE_MAX_DISTANCE (cosine distance). Entries expire after
+CHATBOT_ANSWER_CACHE_TTL seconds and the least recently used ones are evicted
+beyond CHATBOT_ANSWER_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import logging
+import re
+import threading
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from .models import CachedAnswer
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query):
+    """Lowercases, collapses whitespace and drops trailing punctuation."""
+    return re.sub(r"[\s?!.]+$", "", " ".join(query.lower().split()))
+
+
+def query_hash(query):
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def _expiry_cutoff():
+    return timezone.now() - timedelta(seconds=settings.CHATBOT_ANSWER_CACHE_TTL)
+
+
+def _touch(entry):
+    CachedAnswer.objects.filter(pk=entry.pk).update(last_used_at=timezone.now())
+    return entry.answer
+
+
+def get_exact_answer(query):
+    """Returns the cached answer for the same normalized question, or None."""
+    try:
+        entry = CachedAnswer.objects.filter(query_hash=query_hash(query), created_at__gte=_expiry_cutoff()).first()
+        return _touch(entry) if entry is not None else None
+    except DatabaseError as e:
+        logger.error(f"Answer cache read failed: {e}")
+        return None
+
+
+class _EmbeddingMirror:
+    """
+    Per-process copy of the cached question embeddings. Each lookup only lists
+    the live primary keys and fetches embeddings for rows it has not seen yet.
+    """
+
+    def __init__(self):
+        self._vectors = {}
+        self._lock = threading.Lock()
+
+    def nearest(self, embedding):
+        """Returns (pk, cosine similarity) of the closest cached question, or (None, -1)."""
+        live = set(CachedAnswer.objects.filter(created_at__gte=_expiry_cutoff()).values_list('pk', flat=True))
+        with self._lock:
+            for pk in set(self._vectors) - live:
+                del self._vectors[pk]
+            new = live - set(self._vectors)
+        if new:
+            rows = CachedAnswer.objects.filter(pk__in=new).values_list('pk', 'embedding')
+            fetched = {pk: np.frombuffer(bytes(blob), dtype=np.float32) for pk, blob in rows}
+            with self._lock:
+                self._vectors.update(fetched)
+        with self._lock:
+            pks = [pk for pk, vector in self._vectors.items() if vector.shape == embedding.shape]
+            if not pks:
+                return None, -1.0
+            matrix = np.stack([self._vectors[pk] for pk in pks])
+        similarities = matrix @ embedding / np.maximum(np.linalg.norm(matrix, axis=1) * np.linalg.norm(embedding), 1e-12)
+        best = int(np.argmax(similarities))
+        return pks[best], float(similarities[best])
+
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+
+
+embedding_mirror = _EmbeddingMirror()
+
+
+def get_similar_answer(embedding):
+    """Returns the answer of the closest cached question within the configured cosine distance, or None."""
+    max_distance = settings.CHATBOT_ANSWER_CACHE_MAX_DISTANCE
+    if max_distance < 0:
+        return None
+    embedding = np.asarray(embedding, dtype=np.float32)
+    try:
+        pk, similarity = embedding_mirror.nearest(embedding)
+        if pk is None or 1.0 - similarity > max_distance:
+            return None
+        entry = CachedAnswer.objects.filter(pk=pk).first()
+        return _touch(entry) if entry is not None else None
+    except DatabaseError as e:
+        logger.error(f"Answer cache read failed: {e}")
+        return None
+
+
+def store_answer(query, embedding, answer):
+    now = timezone.now()
+    try:
+        CachedAnswer.objects.update_or_create(
+            query_hash=query_hash(query),
+            defaults={
+                "query": normalize_query(query),
+                "embedding": np.asarray(embedding, dtype=np.float32).tobytes(),
+                "answer": answer,
+                "created_at": now,
+                "last_used_at": now,
+            },
+        )
+        evict_answer_cache()
+    except DatabaseError as e:
+        logger.error(f"Answer cache write failed: {e}")
+
+
+def evict_answer_cache(max_entries=None):
+    """Drops expired entries and the least recently used ones beyond the size limit."""
+    max_entries = settings.CHATBOT_ANSWER_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    CachedAnswer.objects.filter(created_at__lt=_expiry_cutoff()).delete()
+    stale_ids = list(CachedAnswer.objects.order_by('-last_used_at').values_list('pk', flat=True)[max_entries:])
+    if stale_ids:
+        CachedAnswer.objects.filter(pk__in=stale_ids).delete()
@@ -0,0 +1,112 @@
+"""
+On-disk store for knowledge-base embeddings.
+
+Each embedding is keyed by a hash of the embedding model and the exact text,
+so only new or edited documents are sent to the embeddings API. Vectors live
+in a float32 .npy file that is memory-mapped read-only: every worker process
+shares the same page cache instead of holding its own copy.
+
+A store directory holds one JSON index per model that names the current data
+file and lists the key of each row. Updates write a new data file and then
+atomically replace the index, so readers never see a half-written state and
+processes that still map the previous file keep working.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, directory, model):
+        self.directory = str(directory)
+        self.model = model
+        slug = re.sub(r"[^\w.-]+", "-", model)
+        self.index_path = os.path.join(self.directory, f"{slug}.json")
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get("model") == self.model else None
+
+    def load(self):
+        """Returns (keys, read-only memmap) for the stored vectors, or ([], None) if there are none."""
+        index = self._read_index()
+        if index is None:
+            return [], None
+        try:
+            matrix = np.load(os.path.join(self.directory, index["data"]), mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Embedding store {self.index_path} is unreadable, rebuilding: {e}")
+            return [], None
+        return index["keys"], matrix
+
+    def embeddings_for(self, texts, embed_fn, keep_unused=True):
+        """
+        Returns one row per text, embedding only texts the store has not seen.
+        `embed_fn(texts)` must return one vector per input text.
+
+        The file is kept ordered like the most recent `texts`, so repeated calls
+        with the same documents get a zero-copy view of the memory map. Rows of
+        texts not in `texts` are kept unless `keep_unused` is false.
+        """
+        keys = [content_key(self.model, text) for text in texts]
+        stored_keys, matrix = self.load()
+        positions = {key: i for i, key in enumerate(stored_keys)}
+
+        missing = [i for i, key in enumerate(keys) if key not in positions]
+        if not missing:
+            if not keep_unused and len(stored_keys) > len(set(keys)):
+                self._write(keys, np.asarray(matrix[[positions[key] for key in keys]]))
+                return self.load()[1]
+            if stored_keys[:len(keys)] == keys:
+                return matrix[:len(keys)]
+            return np.asarray(matrix[[positions[key] for key in keys]])
+
+        new_vectors = np.asarray(embed_fn([texts[i] for i in missing]), dtype=np.float32)
+        if new_vectors.ndim != 2 or len(new_vectors) != len(missing):
+            raise ValueError(f"Expected {len(missing)} embeddings, got an array of shape {new_vectors.shape}.")
+        logger.info(f"Embedded {len(missing)} new text(s) for {self.model}.")
+
+        fresh = dict(zip((keys[i] for i in missing), new_vectors))
+        rows = [fresh[key] if key in fresh else matrix[positions[key]] for key in keys]
+        # Rows no longer requested stay at the end, so reverting an edit costs nothing.
+        requested = set(keys)
+        extra_keys = [key for key in stored_keys if key not in requested] if keep_unused else []
+        if extra_keys and matrix.shape[1] == new_vectors.shape[1]:
+            rows.extend(matrix[positions[key]] for key in extra_keys)
+        else:
+            extra_keys = []
+        self._write(keys + extra_keys, np.vstack(rows).astype(np.float32, copy=False))
+        return self.load()[1][:len(keys)]
+
+    def _write(self, keys, matrix):
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self._read_index()
+        data_name = f"{os.path.splitext(os.path.basename(self.index_path))[0]}-{uuid.uuid4().hex}.npy"
+        np.save(os.path.join(self.directory, data_name), matrix)
+
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "dim": int(matrix.shape[1]), "data": data_name, "keys": keys}, f)
+        os.replace(tmp_path, self.index_path)
+
+        # Processes still mapping the old file keep their mapping after the unlink.
+        if previous and previous["data"] != data_name:
+            try:
+                os.remove(os.path.join(self.directory, previous["data"]))
+            except OSError:
+                pass
@@ -0,0 +1,150 @@
+"""
+Bulk ingestion of Markdown and text documents into the chatbot knowledge base.
+
+Documents are split into overlapping passages, embedded in size-bounded
+batches by a small thread pool (retrying with backoff when the API rate
+limits us) and written to the embedding store. Ingested passages are kept in
+a JSON file next to the hard-coded KNOWLEDGE_BASE, which `rag.py` loads.
+"""
+import json
+import logging
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_EXTENSIONS = ('.md', '.markdown', '.txt')
+
+# The embeddings API accepts up to 2048 inputs per request and bounds the
+# total tokens; ~4 characters per token keeps batches well below that limit.
+MAX_BATCH_ITEMS = 256
+MAX_BATCH_CHARS = 400_000
+
+
+def iter_documents(directory):
+    """Yields (path relative to `directory`, text) for every document below it, in a stable order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                path = os.path.join(root, name)
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    yield os.path.relpath(path, directory), f.read()
+
+
+def _split_long(paragraph, max_chars):
+    # Prefer sentence boundaries; fall back to hard cuts for run-on text.
+    pieces, current = [], ""
+    for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text, max_chars=1500, overlap=200):
+    """
+    Splits a document into passages of at most about `max_chars` characters
+    along paragraph boundaries. Each passage repeats up to `overlap` trailing
+    characters of the previous one so context is not lost at the cut.
+    """
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if paragraph:
+            paragraphs.extend(_split_long(paragraph, max_chars))
+
+    passages, current = [], ""
+    for paragraph in paragraphs:
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            passages.append(current)
+            tail = current[-overlap:] if overlap else ""
+            # Start the overlap at a word boundary.
+            tail = tail[tail.find(" ") + 1:] if " " in tail else tail
+            current = f"{tail} {paragraph}" if tail else paragraph
+        else:
+            current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+def make_batches(texts, max_items=MAX_BATCH_ITEMS, max_chars=MAX_BATCH_CHARS):
+    """Groups texts into consecutive batches bounded by item count and total characters."""
+    batches, batch, size = [], [], 0
+    for text in texts:
+        if batch and (len(batch) >= max_items or size + len(text) > max_chars):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def call_with_backoff(fn, *args, max_retries=6, base_delay=1.0, max_delay=60.0):
+    """Calls fn(*args), retrying rate-limit and transient connection errors with jittered exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args)
+        except (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError) as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_after(e) or min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Embedding request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def embed_in_batches(texts, embed_fn, workers=4, max_items=MAX_BATCH_ITEMS, max_chars=MAX_BATCH_CHARS):
+    """
+    Embeds `texts` with `embed_fn` using concurrent, size-bounded requests and
+    returns the vectors in input order.
+    """
+    batches = make_batches(texts, max_items, max_chars)
+    if len(batches) <= 1 or workers <= 1:
+        return [vector for batch in batches for vector in call_with_backoff(embed_fn, batch)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as executor:
+        results = executor.map(lambda batch: call_with_backoff(embed_fn, batch), batches)
+        return [vector for vectors in results for vector in vectors]
+
+
+def load_passages(path):
+    """Returns the ingested passages as a list of {"source", "text"} dicts (empty if none)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read ingested passages from {path}: {e}")
+        return []
+
+
+def write_passages(passages, path):
+    """Atomically replaces the passages file, so readers never see a partial write."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(passages, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
@@ -0,0 +1,86 @@
+"""
+Keyword retrieval over the knowledge base, computed entirely in-process.
+
+`BM25Index` scores passages with Okapi BM25 from an inverted index built once
+per process, so a query costs a few dictionary lookups and array additions
+instead of a round trip to the embeddings API.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+STOPWORDS = frozenset("""
+    a about an and are as at be by can could do does did for from has have how i if in is it its me my
+    of on or our please should so tell that the this to us was we what when where which who why will
+    with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords."""
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+def token_overlap(a, b):
+    """Jaccard similarity of the token sets of two texts (0 when either has no tokens)."""
+    a, b = set(tokenize(a)), set(tokenize(b))
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class BM25Index:
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+        lengths = np.zeros(self.size, dtype=np.float32)
+        postings = defaultdict(lambda: ([], []))
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[i] = sum(counts.values())
+            for term, count in counts.items():
+                postings[term][0].append(i)
+                postings[term][1].append(count)
+
+        average_length = float(lengths.mean()) if self.size and lengths.mean() > 0 else 1.0
+        # Per-document part of the BM25 denominator, precomputed once.
+        self._norms = k1 * (1 - b + b * lengths / average_length)
+        self._postings = {}
+        for term, (doc_ids, counts) in postings.items():
+            idf = math.log(1 + (self.size - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            doc_ids = np.asarray(doc_ids, dtype=np.int64)
+            counts = np.asarray(counts, dtype=np.float32)
+            # Term weight per document; a query only sums these.
+            self._postings[term] = (doc_ids, idf * counts * (k1 + 1) / (counts + self._norms[doc_ids]))
+
+    def __len__(self):
+        return self.size
+
+    def scores(self, query):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        return scores
+
+    def search(self, query, k=5, min_score=0.0):
+        """Returns up to k (row, BM25 score) pairs scoring above `min_score`, best first."""
+        scores = self.scores(query)
+        matching = np.flatnonzero(scores > max(min_score, 0.0))
+        if not len(matching):
+            return []
+        best = matching[np.argsort(-scores[matching], kind="stable")[:k]]
+        return [(int(i), float(scores[i])) for i in best]
+
+
+def reciprocal_rank_fusion(*rankings, k=60):
+    """Merges ranked lists of row ids; rows ranked high in several lists come first."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] += 1.0 / (k + rank + 1)
+    return sorted(fused, key=lambda row: -fused[row])
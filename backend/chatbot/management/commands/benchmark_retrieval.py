@@ -0,0 +1,76 @@
+import statistics
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatbot.vector_index import VectorIndex
+
+
+def synthetic_embeddings(n, dim, rng, n_topics=200):
+    """Clustered unit vectors, roughly like embeddings of articles about a few hundred topics."""
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    vectors = topics[rng.integers(0, n_topics, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def brute_force(embeddings, query, k):
+    """The original per-query search over a float64 matrix: recompute all norms, sort every score."""
+    similarities = np.dot(embeddings, query) / (np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query))
+    return [(int(i), float(similarities[i])) for i in np.argsort(-similarities)[:k]]
+
+
+def timed_ms(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks knowledge base retrieval on synthetic embeddings. For the original float64 brute-force "
+        "search and each index variant (exact, IVF, float16 and int8 with re-ranking) it reports resident "
+        "vector memory, query latency and recall@k against the float64 results."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default="1000,10000,50000", help="Comma-separated knowledge base sizes.")
+        parser.add_argument('--dim', type=int, default=1536, help="Embedding dimension.")
+        parser.add_argument('--queries', type=int, default=100, help="Queries per size.")
+        parser.add_argument('--k', type=int, default=5)
+        parser.add_argument('--probes', type=int, default=settings.CHATBOT_IVF_PROBES)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        k = options['k']
+        for n in [int(size) for size in options['sizes'].split(",")]:
+            embeddings = synthetic_embeddings(n, options['dim'], rng)
+            queries = embeddings[rng.integers(0, n, options['queries'])]
+            queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+            float64_embeddings = embeddings.astype(np.float64)
+
+            variants = {"float64 brute force": (float64_embeddings.nbytes, lambda q: brute_force(float64_embeddings, q, k))}
+            for name, kwargs in [
+                ("float32 exact", {"ivf_threshold": n + 1}),
+                ("float32 ivf", {"ivf_threshold": 0, "n_probe": options['probes']}),
+                ("float16 exact", {"ivf_threshold": n + 1, "precision": "float16"}),
+                ("int8 exact", {"ivf_threshold": n + 1, "precision": "int8"}),
+                ("int8 ivf", {"ivf_threshold": 0, "n_probe": options['probes'], "precision": "int8"}),
+            ]:
+                index = VectorIndex(embeddings, **kwargs)
+                # The float32 variants scan the (normally memory-mapped) store itself.
+                variants[name] = (index.nbytes or embeddings.nbytes, lambda q, index=index: index.search(q, k))
+
+            truth = [{i for i, _ in brute_force(float64_embeddings, q, k)} for q in queries]
+            self.stdout.write(f"n={n} dim={options['dim']} k={k}")
+            for name, (nbytes, search) in variants.items():
+                latencies, recalls = [], []
+                for query, expected in zip(queries, truth):
+                    results, ms = timed_ms(lambda: search(query))
+                    latencies.append(ms)
+                    recalls.append(len(expected & {i for i, _ in results}) / len(expected))
+                self.stdout.write(
+                    f"  {name:>19}: {nbytes / 2**20:7.1f} MB, mean {statistics.mean(latencies):6.2f} ms, "
+                    f"p50 {statistics.median(latencies):6.2f} ms, recall@{k} {statistics.mean(recalls):.1%}"
+                )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot import rag
+from chatbot.ingestion import embed_in_batches
+
+
+class Command(BaseCommand):
+    help = "Embeds new or changed knowledge base documents into the on-disk embedding store."
+
+    def handle(self, *args, **options):
+        embedder = rag.get_embedder(bulk=True)
+        if embedder is None:
+            raise CommandError(
+                "No embedding model is available: configure OPENAI_API_KEY, or CHATBOT_LOCAL_EMBEDDING_MODEL in local mode."
+            )
+        model_name, embed = embedder
+        store = rag.get_embedding_store(model_name)
+        try:
+            embeddings = store.embeddings_for(rag.load_documents(), lambda texts: embed_in_batches(texts, embed))
+        except Exception as e:
+            raise CommandError(f"Could not embed the knowledge base: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(embeddings)} documents embedded with {store.model} in {store.directory}."
+        ))
@@ -0,0 +1,76 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chatbot import rag
+from chatbot.ingestion import MAX_BATCH_ITEMS, chunk_text, embed_in_batches, iter_documents, load_passages, write_passages
+
+
+class Command(BaseCommand):
+    help = (
+        "Splits the Markdown/text documents in a directory into passages, embeds them in concurrent batches "
+        "and adds them to the chatbot knowledge base. Re-ingesting a file replaces its passages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="Directory searched recursively for .md, .markdown and .txt files.")
+        parser.add_argument('--chunk-size', type=int, default=1500, help="Maximum passage length in characters.")
+        parser.add_argument('--overlap', type=int, default=200, help="Characters repeated between passages.")
+        parser.add_argument('--workers', type=int, default=4, help="Concurrent embedding requests.")
+        parser.add_argument('--batch-size', type=int, default=MAX_BATCH_ITEMS, help="Passages per embedding request.")
+        parser.add_argument('--checkpoint', type=int, default=2000,
+                            help="Passages embedded between writes to the embedding store.")
+        parser.add_argument('--replace', action='store_true', help="Drop passages from files not in this directory.")
+
+    def handle(self, *args, **options):
+        embedder = rag.get_embedder(bulk=True)
+        if embedder is None:
+            raise CommandError(
+                "No embedding model is available: configure OPENAI_API_KEY, or CHATBOT_LOCAL_EMBEDDING_MODEL in local mode."
+            )
+        model_name, bulk_embed = embedder
+        if not os.path.isdir(options['directory']):
+            raise CommandError(f"{options['directory']} is not a directory.")
+
+        new_passages = []
+        sources = set()
+        for source, text in iter_documents(options['directory']):
+            sources.add(source)
+            new_passages.extend(
+                {"source": source, "text": passage}
+                for passage in chunk_text(text, options['chunk_size'], options['overlap'])
+            )
+        if not new_passages:
+            raise CommandError(f"No documents found in {options['directory']}.")
+        self.stdout.write(f"Split {len(sources)} documents into {len(new_passages)} passages.")
+
+        store = rag.get_embedding_store(model_name)
+
+        def embed(texts):
+            return embed_in_batches(texts, bulk_embed, workers=options['workers'], max_items=options['batch_size'])
+
+        # Embed in checkpoints so an interrupted run resumes where it stopped:
+        # passages already in the store are never sent to the API again.
+        start = time.perf_counter()
+        texts = [passage["text"] for passage in new_passages]
+        step = max(1, options['checkpoint'])
+        for offset in range(0, len(texts), step):
+            try:
+                store.embeddings_for(texts[offset:offset + step], embed)
+            except Exception as e:
+                raise CommandError(f"Embedding failed after {offset} passages: {e}")
+            self.stdout.write(f"  {min(offset + step, len(texts))}/{len(texts)} passages embedded")
+
+        kept = [] if options['replace'] else [
+            passage for passage in load_passages(settings.CHATBOT_KNOWLEDGE_PATH) if passage["source"] not in sources
+        ]
+        write_passages(kept + new_passages, settings.CHATBOT_KNOWLEDGE_PATH)
+        # Reorder the store like the knowledge base and drop vectors of removed passages.
+        store.embeddings_for(rag.load_documents(), embed, keep_unused=False)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Knowledge base now has {len(kept) + len(new_passages)} ingested passages "
+            f"({time.perf_counter() - start:.1f} s)."
+        ))
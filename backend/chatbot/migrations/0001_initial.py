@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query_hash', models.CharField(max_length=64, unique=True)),
+                ('query', models.TextField()),
+                ('embedding', models.BinaryField()),
+                ('answer', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -1,3 +1,15 @@
 from django.db import models
 
-# Create your models here.
+
+class CachedAnswer(models.Model):
+    # One row per normalized question. `embedding` holds the question's float32
+    # embedding so near-duplicate questions can reuse the answer as well.
+    query_hash = models.CharField(max_length=64, unique=True)
+    query = models.TextField()
+    embedding = models.BinaryField()
+    answer = models.TextField()
+    created_at = models.DateTimeField()
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.query
@@ -1,17 +1,29 @@
+import asyncio
 import os
-import openai
+import time
+from functools import lru_cache
 from dotenv import load_dotenv
 import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from pants_backend.batching import MicroBatcher
+from pants_backend.llm import call_with_deadline, get_async_openai_client, get_openai_client, iter_with_deadline
+from pants_backend.singleflight import fingerprint, llm_requests
+from .answer_cache import get_exact_answer, get_similar_answer, normalize_query, store_answer
+from .embedding_store import EmbeddingStore
+from .ingestion import embed_in_batches, load_passages
+from .lexical import BM25Index, reciprocal_rank_fusion, token_overlap
+from .vector_index import VectorIndex
 
 # --- 1. CONFIGURATION & INITIALIZATION ---
 load_dotenv()
 
-# Configure the OpenAI API client
+# Configure the OpenAI API client (pooled, with timeouts and bounded retries; see pants_backend/llm.py)
 try:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OPENAI_API_KEY not found in .env file or environment variables.")
-    client = openai.OpenAI(api_key=api_key)
+    client = get_openai_client(api_key)
 except Exception as e:
     print(f"Error configuring OpenAI client: {e}")
     client = None
@@ -32,87 +44,350 @@ KNOWLEDGE_BASE = {
 
 documents = list(KNOWLEDGE_BASE.values())
 doc_embeddings = None
+doc_index = None
+doc_lexical_index = None
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+def embed_texts(texts, max_retries=None):
+    """Embeds a list of texts with the OpenAI API, one vector per text. `max_retries` overrides the client's."""
+    api = client if max_retries is None else client.with_options(max_retries=max_retries)
+    response = api.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+    return [item.embedding for item in response.data]
+
+def bulk_embed_texts(texts):
+    """embed_texts for ingestion.embed_in_batches, whose call_with_backoff already retries; SDK retries would multiply them."""
+    return embed_texts(texts, max_retries=0)
+
+@lru_cache(maxsize=1)
+def get_local_embedder(model_name):
+    """
+    Loads a CPU sentence-transformers model once per process; None if it is not
+    installed or cannot be loaded. Failures are cached too, so requests fall back
+    to keyword retrieval instead of retrying the load every time.
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        print("sentence-transformers is not installed; local retrieval uses keywords only.")
+        return None
+    try:
+        model = SentenceTransformer(model_name, device="cpu")
+    except Exception as e:
+        print(f"Could not load embedding model {model_name}; local retrieval uses keywords only: {e}")
+        return None
+    return lambda texts: model.encode(list(texts), normalize_embeddings=True).tolist()
+
+def get_embedder(bulk=False):
+    """
+    Returns (model name, embed function) for the configured retrieval mode, or None if unavailable.
+    With `bulk`, the function is meant for ingestion.embed_in_batches.
+    """
+    if settings.CHATBOT_RETRIEVAL_MODE == "local":
+        model_name = settings.CHATBOT_LOCAL_EMBEDDING_MODEL
+        embed = get_local_embedder(model_name) if model_name else None
+        return (model_name, embed) if embed else None
+    return (EMBEDDING_MODEL, bulk_embed_texts if bulk else embed_texts) if client else None
+
+def get_embedding_store(model=EMBEDDING_MODEL):
+    return EmbeddingStore(settings.CHATBOT_EMBEDDING_DIR, model)
+
+def load_documents():
+    """The built-in knowledge base followed by passages added with `manage.py ingest_documents`."""
+    passages = load_passages(settings.CHATBOT_KNOWLEDGE_PATH)
+    return list(KNOWLEDGE_BASE.values()) + [passage["text"] for passage in passages]
 
 def compute_embeddings():
-    """Computes embeddings for the knowledge base documents using the OpenAI API."""
-    global doc_embeddings
-    if not client:
-        print("OpenAI client is not configured. Cannot compute embeddings.")
+    """
+    Builds the keyword index and loads the knowledge base embeddings from the
+    on-disk store, embedding only documents that are new or have changed since
+    they were last stored.
+    """
+    global documents, doc_embeddings, doc_index, doc_lexical_index
+    texts = load_documents()
+    documents, doc_lexical_index = texts, BM25Index(texts)
+
+    embedder = get_embedder(bulk=True)
+    if embedder is None:
+        if settings.CHATBOT_RETRIEVAL_MODE != "local":
+            print("OpenAI client is not configured. Cannot compute embeddings.")
+        doc_embeddings = doc_index = None
         return
+    model_name, embed = embedder
+    # A local model is not rate limited and gains nothing from concurrent calls.
+    workers = 1 if settings.CHATBOT_RETRIEVAL_MODE == "local" else 4
 
     try:
-        response = client.embeddings.create(input=documents, model="text-embedding-ada-002")
-        doc_embeddings = np.array([item.embedding for item in response.data])
-        print("Knowledge base embeddings computed successfully.")
+        embeddings = get_embedding_store(model_name).embeddings_for(
+            texts, lambda missing: embed_in_batches(missing, embed, workers=workers)
+        )
+        doc_index = VectorIndex(
+            embeddings,
+            ivf_threshold=settings.CHATBOT_IVF_THRESHOLD,
+            n_probe=settings.CHATBOT_IVF_PROBES,
+            precision=settings.CHATBOT_VECTOR_PRECISION,
+        )
+        doc_embeddings = embeddings
+        print("Knowledge base embeddings loaded successfully.")
     except Exception as e:
-        print(f"Error computing embeddings with OpenAI: {e}")
-        doc_embeddings = None
+        print(f"Error computing embeddings with {model_name}: {e}")
+        doc_embeddings = doc_index = None
 
 # Removed global compute_embeddings() call
 
 # --- 3. CORE RAG LOGIC ---
-def find_best_passage(query, embeddings, texts):
-    """Finds the most relevant passage from the knowledge base using vector similarity."""
-    if embeddings is None or client is None:
-        print("Embeddings or OpenAI client not available.")
-        return KNOWLEDGE_BASE["default"]
-
-    try:
-        query_embedding_response = client.embeddings.create(input=[query], model="text-embedding-ada-002")
-        query_embedding = np.array(query_embedding_response.data[0].embedding)
+def match_knowledge_base_key(query):
+    """Returns the KNOWLEDGE_BASE answer whose key the query matches confidently, or None."""
+    threshold = settings.CHATBOT_FAST_PATH_THRESHOLD
+    if threshold < 0:
+        return None
+    best_key, best_overlap = None, 0.0
+    for key in KNOWLEDGE_BASE:
+        if key == "default":
+            continue
+        overlap = token_overlap(query, key)
+        if overlap > best_overlap:
+            best_key, best_overlap = key, overlap
+    return KNOWLEDGE_BASE[best_key] if best_key and best_overlap >= threshold else None
 
-        dot_products = np.dot(embeddings, query_embedding)
-        norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
+def embed_query_batch(queries):
+    """Embeds the questions of concurrent requests in one call; repeated questions are embedded once."""
+    embedder = get_embedder()
+    if embedder is None:
+        raise RuntimeError("No embedding model is available.")
+    unique = list(dict.fromkeys(queries))
+    vectors = dict(zip(unique, embedder[1](unique)))
+    return [vectors[query] for query in queries]
 
-        if np.all(norms == 0):
-            return KNOWLEDGE_BASE["default"]
+# Questions arriving within a few milliseconds of each other share one embeddings request.
+query_batcher = MicroBatcher(
+    embed_query_batch,
+    max_batch_size=settings.CHATBOT_QUERY_BATCH_MAX_SIZE,
+    max_wait=settings.CHATBOT_QUERY_BATCH_MAX_WAIT_MS / 1000.0,
+    name="query-embedding-batcher",
+)
 
-        similarities = dot_products / norms
+def embed_query(query):
+    """Embeds a user question; returns None if no embedder is available or the call fails or times out."""
+    if get_embedder() is None:
+        return None
+    try:
+        vector = query_batcher(query, timeout=settings.CHATBOT_QUERY_EMBED_TIMEOUT)
+        return np.asarray(vector, dtype=np.float32)
+    except Exception as e:
+        print(f"Error embedding query: {e!r}")
+        return None
 
-        if np.max(similarities) < 0.75: # Adjusted threshold for better relevance
-            return KNOWLEDGE_BASE["default"]
+async def aembed_query(query):
+    """Async counterpart of embed_query; waits on the batcher without holding a thread."""
+    if get_embedder() is None:
+        return None
+    try:
+        future = asyncio.wrap_future(query_batcher.submit(query))
+        vector = await asyncio.wait_for(future, settings.CHATBOT_QUERY_EMBED_TIMEOUT)
+        return np.asarray(vector, dtype=np.float32)
+    except Exception as e:
+        print(f"Error embedding query: {e!r}")
+        return None
 
-        best_doc_index = np.argmax(similarities)
-        return texts[best_doc_index]
+def find_passages(query, k=None, query_embedding=None, embed=True):
+    """
+    Returns up to k knowledge base passages relevant to the query, best first.
+    Vector matches below CHATBOT_MIN_SIMILARITY and keyword matches below
+    CHATBOT_MIN_KEYWORD_SCORE are left out. In "local" mode both rankings are
+    fused; otherwise keywords are only used when the query cannot be embedded.
+    Pass embed=False when the caller already tried to embed the query.
+    """
+    k = k or settings.CHATBOT_CONTEXT_PASSAGES
+    if doc_index is not None and query_embedding is None and embed:
+        query_embedding = embed_query(query)
 
+    try:
+        vector_rows = []
+        if doc_index is not None and query_embedding is not None:
+            vector_rows = [
+                i for i, similarity in doc_index.search(query_embedding, k)
+                if similarity >= settings.CHATBOT_MIN_SIMILARITY
+            ]
+            if settings.CHATBOT_RETRIEVAL_MODE != "local":
+                return [documents[i] for i in vector_rows]
+        if doc_lexical_index is None:
+            print("Knowledge base index not available.")
+            return []
+        keyword_rows = [
+            i for i, _ in doc_lexical_index.search(query, k, min_score=settings.CHATBOT_MIN_KEYWORD_SCORE)
+        ]
+        return [documents[i] for i in reciprocal_rank_fusion(vector_rows, keyword_rows)[:k]]
     except Exception as e:
-        print(f"Error finding best passage: {e}")
-        return KNOWLEDGE_BASE["default"]
+        print(f"Error finding passages: {e}")
+        return []
 
 def get_rag_response(user_query):
-    """Generates a response using the RAG model with OpenAI's ChatCompletions."""
-    if doc_embeddings is None:
-        compute_embeddings()
-    if doc_embeddings is None or client is None:
-        return "My apologies, my knowledge systems are currently offline. Please try again later."
+    """
+    Generates a response using the RAG model with OpenAI's ChatCompletions.
+    Answers to previously asked (or nearly identical) questions come from the
+    answer cache; identical questions asked at the same time share one upstream call.
+    """
+    cached = get_exact_answer(user_query)
+    if cached is not None:
+        return cached
+    key = fingerprint("rag", "gpt-3.5-turbo", normalize_query(user_query))
+    return llm_requests.do(key, lambda: _generate_rag_response(user_query))
 
-    context = find_best_passage(user_query, doc_embeddings, documents)
+OFFLINE_MESSAGE = "My apologies, my knowledge systems are currently offline. Please try again later."
+ERROR_MESSAGE = "I seem to be having trouble accessing my core functions. Please try again in a moment."
 
-    system_prompt = """
+SYSTEM_PROMPT = """
     You are Pipo, the helpful AI assistant for a culinary analysis platform called Eden.
     Your personality is professional, slightly futuristic, and very helpful.
     A user has asked a question. Use the provided context to answer them.
     If the context doesn't have the answer, state that you don't have information on that topic, but remain helpful.
     """
 
+def _answer_without_completion(user_query):
+    """
+    Returns an answer that needs no retrieval or completion (knowledge base
+    match or offline), else None after making sure the indexes are loaded.
+    """
+    answer = match_knowledge_base_key(user_query)
+    if answer is not None:
+        return answer
+    if client is None:
+        return OFFLINE_MESSAGE
+    if doc_lexical_index is None or (doc_embeddings is None and settings.CHATBOT_RETRIEVAL_MODE != "local"):
+        compute_embeddings()
+    return None
+
+def build_messages(user_query, passages):
+    context = "\n".join(passages) if passages else KNOWLEDGE_BASE["default"]
+
     user_prompt = f"""
     Context: "{context}"
 
     User's Question: "{user_query}"
     """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def _prepare_completion(user_query):
+    """
+    Returns (answer, None, None) when the question can be answered without a
+    completion (knowledge base match, cache hit or offline), else
+    (None, messages, query_embedding).
+    """
+    answer = _answer_without_completion(user_query)
+    if answer is not None:
+        return answer, None, None
+
+    query_embedding = embed_query(user_query)
+    if query_embedding is not None:
+        cached = get_similar_answer(query_embedding)
+        if cached is not None:
+            return cached, None, None
+
+    passages = find_passages(user_query, query_embedding=query_embedding, embed=False)
+    return None, build_messages(user_query, passages), query_embedding
+
+def _generate_rag_response(user_query):
+    answer, messages, query_embedding = _prepare_completion(user_query)
+    if answer is not None:
+        return answer
+
+    try:
+        response = call_with_deadline(
+            client.chat.completions.create,
+            model="gpt-3.5-turbo",
+            messages=messages,
+            max_tokens=150,
+            temperature=0.7,
+        )
+        answer = response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Error generating content with OpenAI model: {e}")
+        return ERROR_MESSAGE
+
+    # Only real answers are cached, never the fallbacks above.
+    if query_embedding is not None:
+        store_answer(user_query, query_embedding, answer)
+    return answer
+
+def stream_rag_response(user_query):
+    """
+    Yields the reply to `user_query` piece by piece as the completion API
+    streams it. Cached answers and fallbacks are yielded in one piece.
+    """
+    cached = get_exact_answer(user_query)
+    if cached is not None:
+        yield cached
+        return
+    answer, messages, query_embedding = _prepare_completion(user_query)
+    if answer is not None:
+        yield answer
+        return
 
+    # Streaming replies are not coalesced: each client needs its own token stream.
+    parts = []
+    started = time.monotonic()
     try:
-        response = client.chat.completions.create(
+        stream = client.chat.completions.create(
             model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+            messages=messages,
             max_tokens=150,
             temperature=0.7,
+            stream=True,
         )
-        return response.choices[0].message.content.strip()
+        for chunk in iter_with_deadline(stream, started):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        print(f"Error streaming content with OpenAI model: {e}")
+        if not parts:
+            yield ERROR_MESSAGE
+        return
 
+    answer = "".join(parts).strip()
+    if answer and query_embedding is not None:
+        store_answer(user_query, query_embedding, answer)
+
+async def aget_rag_response(user_query):
+    """
+    Async counterpart of get_rag_response for the ASGI entry point. The
+    embeddings and completion calls are awaited without holding a thread;
+    database lookups run through sync_to_async.
+    """
+    cached = await sync_to_async(get_exact_answer)(user_query)
+    if cached is not None:
+        return cached
+    answer = await sync_to_async(_answer_without_completion)(user_query)
+    if answer is not None:
+        return answer
+
+    query_embedding = await aembed_query(user_query)
+    if query_embedding is not None:
+        cached = await sync_to_async(get_similar_answer)(query_embedding)
+        if cached is not None:
+            return cached
+    messages = build_messages(user_query, find_passages(user_query, query_embedding=query_embedding, embed=False))
+
+    try:
+        async_client = await get_async_openai_client(api_key)
+        response = await asyncio.wait_for(
+            async_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                max_tokens=150,
+                temperature=0.7,
+            ),
+            settings.LLM_DEADLINE,
+        )
+        answer = response.choices[0].message.content.strip()
     except Exception as e:
         print(f"Error generating content with OpenAI model: {e}")
-        return "I seem to be having trouble accessing my core functions. Please try again in a moment."
+        return ERROR_MESSAGE
+
+    if query_embedding is not None:
+        await sync_to_async(store_answer)(user_query, query_embedding, answer)
+    return answer
@@ -1,12 +1,47 @@
-from django.test import TestCase, Client
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, Client, override_settings
 from django.urls import reverse
+import asyncio
+import io
 import json
-from unittest.mock import patch, MagicMock
+import os
+import sys
+import tempfile
+import threading
+from unittest.mock import AsyncMock, patch, MagicMock
+
+import httpx
+import numpy as np
+import openai
+
+from pants_backend.batching import MicroBatcher
+
+from . import rag
+from .answer_cache import evict_answer_cache, get_exact_answer, store_answer
+from .models import CachedAnswer
+from .embedding_store import EmbeddingStore
+from .lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from .ingestion import call_with_backoff, chunk_text, embed_in_batches, load_passages, make_batches
+from .vector_index import VectorIndex, normalize_rows
+
+
+def fake_embeddings_response(input, model):
+    """Mimics the embeddings API: one vector per input text."""
+    # 1536 is the text-embedding-ada-002 dimension.
+    return MagicMock(data=[MagicMock(embedding=[0.1] * 1536) for _ in input])
+
 
 class ChatbotAPITest(TestCase):
     def setUp(self):
         self.client = Client()
         self.chat_url = reverse('chat')
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(CHATBOT_EMBEDDING_DIR=tmp_dir.name, SINGLEFLIGHT_DIR=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        rag.doc_embeddings = None
+        self.addCleanup(setattr, rag, "doc_embeddings", None)
 
     @patch('chatbot.rag.client')
     def test_chat_endpoint_success(self, mock_openai_client):
@@ -14,9 +49,8 @@ class ChatbotAPITest(TestCase):
         Test that the chat endpoint returns a successful response with a mocked OpenAI client.
         """
         # Mock the embedding response
-        mock_embedding = MagicMock()
-        mock_embedding.embedding = [0.1] * 1536  # text-embedding-ada-002 dimension
-        mock_openai_client.embeddings.create.return_value = MagicMock(data=[mock_embedding])
+        mock_openai_client.with_options.return_value = mock_openai_client  # Bulk embedding turns SDK retries off.
+        mock_openai_client.embeddings.create.side_effect = fake_embeddings_response
 
         # Mock the chat completion response
         mock_choice = MagicMock()
@@ -54,3 +88,510 @@ class ChatbotAPITest(TestCase):
         response = self.client.get(self.chat_url)
         self.assertEqual(response.status_code, 405)
         self.assertEqual(response.json(), {'detail': 'Method "GET" not allowed.'})
+
+
+class EmbeddingStoreTest(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.directory = tmp_dir.name
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+    def test_only_new_or_changed_texts_are_embedded(self):
+        """
+        Test that a second store (as in another process or after a restart) reuses stored vectors.
+        """
+        first = EmbeddingStore(self.directory, "model-a").embeddings_for(["alpha", "beta"], self.embed)
+        again = EmbeddingStore(self.directory, "model-a").embeddings_for(["alpha", "beta"], self.embed)
+        edited = EmbeddingStore(self.directory, "model-a").embeddings_for(["alpha", "beta!", "gamma"], self.embed)
+
+        np.testing.assert_array_equal(first, again)
+        self.assertEqual(self.calls, [["alpha", "beta"], ["beta!", "gamma"]])
+        np.testing.assert_array_equal(edited[:, 0], [5, 5, 5])
+        self.assertEqual(edited.dtype, np.float32)
+
+    def test_vectors_are_memory_mapped_read_only(self):
+        """
+        Test that stored vectors come back as a read-only memory map and old data files are removed.
+        """
+        store = EmbeddingStore(self.directory, "model-a")
+        store.embeddings_for(["alpha"], self.embed)
+        embeddings = store.embeddings_for(["alpha", "beta"], self.embed)
+        self.assertIsInstance(embeddings, np.memmap)
+        self.assertFalse(embeddings.flags.writeable)
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.endswith(".npy")]), 1)
+
+    def test_keys_depend_on_the_model(self):
+        """
+        Test that switching embedding models re-embeds everything.
+        """
+        EmbeddingStore(self.directory, "model-a").embeddings_for(["alpha"], self.embed)
+        EmbeddingStore(self.directory, "model-b").embeddings_for(["alpha"], self.embed)
+        self.assertEqual(self.calls, [["alpha"], ["alpha"]])
+
+    def test_wrong_number_of_vectors_is_rejected(self):
+        """
+        Test that a short embeddings response raises instead of storing misaligned rows.
+        """
+        with self.assertRaises(ValueError):
+            EmbeddingStore(self.directory, "model-a").embeddings_for(["alpha", "beta"], lambda texts: [[1.0, 2.0]])
+        self.assertFalse(os.listdir(self.directory))
+
+
+class VectorIndexTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        topics = rng.standard_normal((20, 32))
+        self.embeddings = topics[rng.integers(0, 20, 2000)] + 0.3 * rng.standard_normal((2000, 32))
+        self.queries = self.embeddings[:50] + 0.1 * rng.standard_normal((50, 32))
+
+    def test_exact_search_matches_full_sort(self):
+        """
+        Test that argpartition top-k returns the same rows and order as sorting every cosine similarity.
+        """
+        index = VectorIndex(self.embeddings)
+        self.assertFalse(index.is_approximate)
+        self.assertEqual(index.vectors.dtype, np.float32)
+        for query in self.queries[:10]:
+            similarities = normalize_rows(self.embeddings) @ normalize_rows(query)
+            expected = list(np.argsort(-similarities)[:5])
+            self.assertEqual([i for i, _ in index.search(query, k=5)], expected)
+
+    def test_ivf_search_finds_most_true_neighbours(self):
+        """
+        Test that the IVF index kicks in above the threshold and keeps recall high.
+        """
+        exact = VectorIndex(self.embeddings)
+        ivf = VectorIndex(self.embeddings, ivf_threshold=1000, n_probe=8)
+        self.assertTrue(ivf.is_approximate)
+        recalls = []
+        for query in self.queries:
+            truth = {i for i, _ in exact.search(query, k=10)}
+            recalls.append(len(truth & {i for i, _ in ivf.search(query, k=10)}) / 10)
+        self.assertGreater(np.mean(recalls), 0.9)
+        # Probing every list is exact.
+        ivf.n_probe = len(ivf.centroids)
+        self.assertEqual(ivf.search(self.queries[0], k=10), exact.search(self.queries[0], k=10))
+
+    def test_compact_precisions_rerank_in_full_precision(self):
+        """
+        Test that float16 and int8 indexes are smaller, return the exact top k, and report full-precision scores.
+        """
+        exact = VectorIndex(self.embeddings)
+        for precision, max_bytes in [("float16", exact.nbytes * 0.6), ("int8", exact.nbytes * 0.35)]:
+            index = VectorIndex(self.embeddings, precision=precision)
+            self.assertLess(index.nbytes, max_bytes)
+            for query in self.queries[:10]:
+                expected = exact.search(query, k=5)
+                results = index.search(query, k=5)
+                self.assertEqual([i for i, _ in results], [i for i, _ in expected])
+                np.testing.assert_allclose([s for _, s in results], [s for _, s in expected], rtol=1e-5)
+
+        ivf = VectorIndex(self.embeddings, ivf_threshold=1000, precision="int8")
+        self.assertTrue(ivf.is_approximate)
+        self.assertEqual(ivf.search(self.queries[0], k=1)[0][0], exact.search(self.queries[0], k=1)[0][0])
+
+    def test_short_indexes_and_zero_vectors(self):
+        """
+        Test that k larger than the index and all-zero rows are handled.
+        """
+        for precision in VectorIndex.PRECISIONS:
+            index = VectorIndex([[0.0, 0.0], [3.0, 4.0]], precision=precision)
+            self.assertEqual([i for i, _ in index.search([3.0, 4.0], k=5)], [1, 0])
+
+
+@override_settings(CHATBOT_ANSWER_CACHE_MAX_DISTANCE=0.05, CHATBOT_ANSWER_CACHE_TTL=3600)
+class AnswerCacheTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(CHATBOT_EMBEDDING_DIR=tmp_dir.name, SINGLEFLIGHT_DIR=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        rag.doc_embeddings = None
+        self.addCleanup(setattr, rag, "doc_embeddings", None)
+
+        patcher = patch('chatbot.rag.client')
+        self.openai = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.query_vectors = {}
+
+        def embeddings(input, model):
+            # Documents get one direction; questions get the vector registered for them.
+            vectors = [self.query_vectors.get(text, [1.0, 0.0, 0.0]) for text in input]
+            return MagicMock(data=[MagicMock(embedding=vector) for vector in vectors])
+
+        self.openai.with_options.return_value = self.openai
+        self.openai.embeddings.create.side_effect = embeddings
+        choice = MagicMock()
+        choice.message.content = "Eden is free to use."
+        self.openai.chat.completions.create.return_value = MagicMock(choices=[choice])
+
+    def test_same_question_skips_every_api_call(self):
+        """
+        Test that a repeat of a question (different casing, spacing or punctuation) needs no API call at all.
+        """
+        self.query_vectors["Does Eden cost money?"] = [0.0, 1.0, 0.0]
+        self.assertEqual(rag.get_rag_response("Does Eden cost money?"), "Eden is free to use.")
+        embedding_calls = self.openai.embeddings.create.call_count
+
+        self.assertEqual(rag.get_rag_response("  does eden   COST money "), "Eden is free to use.")
+        self.assertEqual(self.openai.embeddings.create.call_count, embedding_calls)
+        self.openai.chat.completions.create.assert_called_once()
+
+    def test_similar_question_reuses_the_answer(self):
+        """
+        Test that a question within the cosine distance threshold skips the chat completion only.
+        """
+        self.query_vectors["Does Eden cost money?"] = [0.0, 1.0, 0.0]
+        self.query_vectors["Is Eden paid?"] = [0.0, 0.99, 0.05]
+        self.query_vectors["Who built Pipo?"] = [0.0, 0.0, 1.0]
+        rag.get_rag_response("Does Eden cost money?")
+        self.assertEqual(rag.get_rag_response("Is Eden paid?"), "Eden is free to use.")
+        self.openai.chat.completions.create.assert_called_once()
+
+        rag.get_rag_response("Who built Pipo?")
+        self.assertEqual(self.openai.chat.completions.create.call_count, 2)
+
+    def test_entries_expire_and_are_bounded(self):
+        """
+        Test that expired entries are not served and the least recently used are evicted beyond the limit.
+        """
+        for question in ["a", "b", "c"]:
+            store_answer(question, [1.0, 0.0], f"answer {question}")
+        self.assertEqual(get_exact_answer("a"), "answer a")  # a is now the most recently used.
+        evict_answer_cache(max_entries=2)
+        self.assertEqual(sorted(CachedAnswer.objects.values_list("query", flat=True)), ["a", "c"])
+
+        with override_settings(CHATBOT_ANSWER_CACHE_TTL=0):
+            self.assertIsNone(get_exact_answer("a"))
+
+
+class ChatStreamTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(CHATBOT_EMBEDDING_DIR=tmp_dir.name, SINGLEFLIGHT_DIR=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        rag.doc_embeddings = None
+        self.addCleanup(setattr, rag, "doc_embeddings", None)
+        self.url = reverse('chat_stream')
+
+    def read_events(self, response):
+        body = b"".join(response.streaming_content).decode()
+        return [event for event in body.split("\n\n") if event]
+
+    @patch('chatbot.rag.client')
+    def test_tokens_are_sent_as_server_sent_events(self, mock_openai_client):
+        """
+        Test that completion deltas are forwarded as SSE events and the full reply is cached.
+        """
+        mock_openai_client.with_options.return_value = mock_openai_client
+        mock_openai_client.embeddings.create.side_effect = fake_embeddings_response
+        deltas = ["Eden ", "is ", None, "free."]
+        mock_openai_client.chat.completions.create.return_value = iter(
+            MagicMock(choices=[MagicMock(delta=MagicMock(content=delta))]) for delta in deltas
+        )
+
+        response = self.client.post(self.url, data=json.dumps({'message': 'Does Eden cost money?'}), content_type='application/json')
+        events = self.read_events(response)
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual([json.loads(event[len("data: "):])["token"] for event in events[:-1]], ["Eden ", "is ", "free."])
+        self.assertEqual(events[-1], "event: done\ndata: {}")
+        self.assertTrue(mock_openai_client.chat.completions.create.call_args.kwargs["stream"])
+        self.assertEqual(get_exact_answer("does eden cost money"), "Eden is free.")
+
+    @patch('chatbot.rag.client')
+    def test_cached_answer_is_sent_in_one_event(self, mock_openai_client):
+        """
+        Test that a cached answer is streamed without calling OpenAI.
+        """
+        store_answer("Does Eden cost money?", [0.1] * 1536, "Yes, Eden is free.")
+        response = self.client.post(self.url, data=json.dumps({'message': 'does eden cost money'}), content_type='application/json')
+        events = self.read_events(response)
+        self.assertEqual(json.loads(events[0][len("data: "):]), {"token": "Yes, Eden is free."})
+        mock_openai_client.chat.completions.create.assert_not_called()
+        mock_openai_client.embeddings.create.assert_not_called()
+
+    def test_missing_message_is_rejected(self):
+        """
+        Test that the streaming endpoint validates the request like the JSON endpoint.
+        """
+        response = self.client.post(self.url, data=json.dumps({}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'No message provided'})
+
+
+class IngestionTest(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp = tmp_dir.name
+
+    def test_chunks_follow_paragraphs_and_overlap(self):
+        """
+        Test that passages respect the size limit, split at paragraphs, and overlap.
+        """
+        text = "\n\n".join(f"Paragraph {i} talks about topic {i}. " * 5 for i in range(10))
+        passages = chunk_text(text, max_chars=400, overlap=60)
+        self.assertGreater(len(passages), 1)
+        self.assertTrue(all(len(passage) <= 400 + 60 for passage in passages))
+        self.assertIn(passages[1][:20], passages[0][-60:])
+        self.assertEqual(chunk_text("one sentence", max_chars=400), ["one sentence"])
+        self.assertTrue(all(len(p) <= 100 for p in chunk_text("x" * 350, max_chars=100, overlap=0)))
+
+    def test_batches_are_bounded(self):
+        """
+        Test that batches respect both the item and character limits.
+        """
+        batches = make_batches(["a" * 10] * 7, max_items=3, max_chars=25)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2, 1])
+
+    @patch('chatbot.ingestion.time.sleep')
+    def test_rate_limits_are_retried(self, mock_sleep):
+        """
+        Test that a rate-limited call is retried, honouring Retry-After.
+        """
+        response = httpx.Response(429, headers={"retry-after": "2"}, request=httpx.Request("POST", "https://api"))
+        calls = []
+
+        def flaky(batch):
+            calls.append(batch)
+            if len(calls) < 3:
+                raise openai.RateLimitError("slow down", response=response, body=None)
+            return [[1.0]] * len(batch)
+
+        self.assertEqual(call_with_backoff(flaky, ["a"]), [[1.0]])
+        self.assertEqual(len(calls), 3)
+        mock_sleep.assert_called_with(2.0)
+
+    def test_concurrent_batches_keep_input_order(self):
+        """
+        Test that vectors come back in input order when batches run concurrently.
+        """
+        texts = [str(i) for i in range(50)]
+        vectors = embed_in_batches(texts, lambda batch: [[float(text)] for text in batch], workers=4, max_items=7)
+        self.assertEqual([vector[0] for vector in vectors], list(range(50)))
+
+    @patch('chatbot.rag.client')
+    def test_ingest_command_embeds_only_new_passages(self, mock_openai_client):
+        """
+        Test that the command adds passages to the knowledge base and a re-run embeds nothing new.
+        """
+        mock_openai_client.with_options.return_value = mock_openai_client
+        mock_openai_client.embeddings.create.side_effect = fake_embeddings_response
+        docs = os.path.join(self.tmp, "docs")
+        os.makedirs(os.path.join(docs, "guides"))
+        with open(os.path.join(docs, "faq.md"), "w") as f:
+            f.write("# FAQ\n\nEden analyzes food photos.\n\nRecipes are generated per category.")
+        with open(os.path.join(docs, "guides", "upload.txt"), "w") as f:
+            f.write("Upload a clear photo of a single dish.")
+        knowledge_path = os.path.join(self.tmp, "knowledge.json")
+
+        with override_settings(CHATBOT_EMBEDDING_DIR=os.path.join(self.tmp, "emb"), CHATBOT_KNOWLEDGE_PATH=knowledge_path):
+            call_command("ingest_documents", docs, stdout=io.StringIO())
+            embedded = sum(len(call.kwargs["input"]) for call in mock_openai_client.embeddings.create.call_args_list)
+            call_command("ingest_documents", docs, stdout=io.StringIO())
+            documents = rag.load_documents()
+
+        passages = load_passages(knowledge_path)
+        self.assertEqual({passage["source"] for passage in passages}, {"faq.md", os.path.join("guides", "upload.txt")})
+        self.assertEqual(documents[len(rag.KNOWLEDGE_BASE):], [passage["text"] for passage in passages])
+        # Ingested passages plus the built-in entries, each embedded exactly once.
+        self.assertEqual(embedded, len(passages) + len(rag.KNOWLEDGE_BASE))
+        self.assertEqual(
+            sum(len(call.kwargs["input"]) for call in mock_openai_client.embeddings.create.call_args_list), embedded
+        )
+        # call_with_backoff does the retrying, so the SDK must not retry as well.
+        mock_openai_client.with_options.assert_called_with(max_retries=0)
+
+
+class LocalRetrievalTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(CHATBOT_EMBEDDING_DIR=tmp_dir.name, SINGLEFLIGHT_DIR=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        rag.doc_embeddings = rag.doc_lexical_index = None
+        self.addCleanup(setattr, rag, "doc_embeddings", None)
+        self.addCleanup(setattr, rag, "doc_lexical_index", None)
+
+    def test_bm25_ranks_rare_terms_higher(self):
+        """
+        Test that BM25 ignores stopwords and favours passages matching rarer query terms.
+        """
+        index = BM25Index([
+            "The analyzer identifies a dish from a photo.",
+            "Recipes help you cook the dish at home.",
+            "The guestbook collects feedback.",
+        ])
+        self.assertEqual(tokenize("What is the analyzer?"), ["analyzer"])
+        self.assertEqual([i for i, _ in index.search("how does the analyzer read a dish photo")], [0, 1])
+        self.assertEqual(index.search("what is it"), [])
+        self.assertEqual(reciprocal_rank_fusion([2, 0], [0, 1]), [0, 2, 1])
+
+    @patch('chatbot.rag.client')
+    def test_knowledge_base_questions_are_answered_directly(self, mock_openai_client):
+        """
+        Test that a question matching a KNOWLEDGE_BASE key is answered without any API call.
+        """
+        self.assertEqual(rag.get_rag_response("Who is Pipo?"), rag.KNOWLEDGE_BASE["who is pipo"])
+        self.assertEqual(rag.get_rag_response("is eden free"), rag.KNOWLEDGE_BASE["is eden free"])
+        mock_openai_client.embeddings.create.assert_not_called()
+        mock_openai_client.chat.completions.create.assert_not_called()
+
+    @override_settings(CHATBOT_RETRIEVAL_MODE="local", CHATBOT_LOCAL_EMBEDDING_MODEL="")
+    @patch('chatbot.rag.client')
+    def test_local_mode_retrieves_without_the_embeddings_api(self, mock_openai_client):
+        """
+        Test that local mode finds context with keywords and only calls the chat completion.
+        """
+        choice = MagicMock()
+        choice.message.content = "Try a clearer photo."
+        mock_openai_client.chat.completions.create.return_value = MagicMock(choices=[choice])
+
+        self.assertEqual(rag.get_rag_response("My analysis failed, what now?"), "Try a clearer photo.")
+        mock_openai_client.embeddings.create.assert_not_called()
+        prompt = mock_openai_client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        self.assertIn(rag.KNOWLEDGE_BASE["troubleshooting analyzer failed"], prompt)
+
+    @patch('chatbot.rag.client')
+    def test_keywords_are_the_fallback_when_embedding_fails(self, mock_openai_client):
+        """
+        Test that a failing query embedding still yields keyword-matched passages.
+        """
+        mock_openai_client.with_options.return_value = mock_openai_client
+        mock_openai_client.embeddings.create.side_effect = fake_embeddings_response
+        rag.compute_embeddings()
+        mock_openai_client.embeddings.create.side_effect = openai.APITimeoutError(request=httpx.Request("POST", "https://api"))
+        self.assertEqual(rag.find_passages("guestbook feedback page"), [rag.KNOWLEDGE_BASE["how do I use the guestbook"]])
+
+
+    @override_settings(CHATBOT_RETRIEVAL_MODE="local", CHATBOT_LOCAL_EMBEDDING_MODEL="missing-model")
+    @patch('chatbot.rag.client')
+    def test_local_model_load_failure_falls_back_to_keywords(self, mock_openai_client):
+        """
+        Test that a local embedding model that fails to load is tried once and retrieval uses keywords.
+        """
+        rag.get_local_embedder.cache_clear()
+        self.addCleanup(rag.get_local_embedder.cache_clear)
+        sentence_transformers = MagicMock()
+        sentence_transformers.SentenceTransformer.side_effect = OSError("model weights not found")
+
+        with patch.dict(sys.modules, {"sentence_transformers": sentence_transformers}):
+            rag.compute_embeddings()
+            passages = rag.find_passages("guestbook feedback page")
+            self.assertIsNone(rag.embed_query("guestbook feedback page"))
+
+        self.assertEqual(passages[0], rag.KNOWLEDGE_BASE["how do I use the guestbook"])
+        sentence_transformers.SentenceTransformer.assert_called_once()
+        mock_openai_client.embeddings.create.assert_not_called()
+
+    @override_settings(CHATBOT_RETRIEVAL_MODE="local", CHATBOT_LOCAL_EMBEDDING_MODEL="local-model")
+    @patch('chatbot.rag.get_local_embedder', return_value=lambda texts: [[1.0, 0.0] for _ in texts])
+    @patch('chatbot.rag.client', None)
+    def test_embed_command_uses_the_local_model(self, mock_local_embedder):
+        """
+        Test that the embedding command works without an OpenAI key in local mode and fills that model's store.
+        """
+        call_command("embed_knowledge_base", stdout=io.StringIO())
+
+        keys, _ = rag.get_embedding_store("local-model").load()
+        self.assertEqual(len(keys), len(rag.load_documents()))
+        self.assertFalse(os.path.exists(rag.get_embedding_store().index_path))
+
+
+class QueryBatchingTest(SimpleTestCase):
+    @patch('chatbot.rag.client')
+    def test_concurrent_queries_share_one_embeddings_call(self, mock_openai_client):
+        """
+        Test that questions from concurrent requests are embedded in one call and routed back to each caller.
+        """
+        mock_openai_client.embeddings.create.side_effect = lambda input, model: MagicMock(
+            data=[MagicMock(embedding=[float(len(text)), 1.0]) for text in input]
+        )
+        batcher = MicroBatcher(rag.embed_query_batch, max_batch_size=8, max_wait=0.5)
+        questions = ["a", "bb", "ccc", "bb"]
+        results = {}
+
+        def ask(i, question):
+            results[i] = rag.embed_query(question)
+
+        with patch('chatbot.rag.query_batcher', batcher):
+            threads = [threading.Thread(target=ask, args=item) for item in enumerate(questions)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(timeout=5)
+
+        self.assertEqual([results[i][0] for i in range(4)], [1.0, 2.0, 3.0, 2.0])
+        mock_openai_client.embeddings.create.assert_called_once()
+        self.assertCountEqual(mock_openai_client.embeddings.create.call_args.kwargs["input"], ["a", "bb", "ccc"])
+
+
+class AsyncChatTest(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(CHATBOT_EMBEDDING_DIR=tmp_dir.name, SINGLEFLIGHT_DIR=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        rag.doc_embeddings = None
+        self.addCleanup(setattr, rag, "doc_embeddings", None)
+
+    @patch('chatbot.rag.get_async_openai_client', new_callable=AsyncMock)
+    @patch('chatbot.rag.client')
+    def test_async_chat_awaits_the_shared_async_client(self, mock_openai_client, mock_get_async_client):
+        """
+        Test that the ASGI chat view answers through the async completion client and caches the answer.
+        """
+        mock_openai_client.with_options.return_value = mock_openai_client
+        mock_openai_client.embeddings.create.side_effect = fake_embeddings_response
+        choice = MagicMock()
+        choice.message.content = "Analyses run on a food classifier."
+        mock_get_async_client.return_value.chat.completions.create = AsyncMock(return_value=MagicMock(choices=[choice]))
+
+        data = json.dumps({'message': 'Which model classifies my photos?'})
+        response = self.client.post(reverse('chat_async'), data=data, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'response': "Analyses run on a food classifier."})
+        mock_openai_client.chat.completions.create.assert_not_called()
+        self.assertEqual(get_exact_answer("which model classifies my photos"), "Analyses run on a food classifier.")
+
+    @override_settings(LLM_DEADLINE=0.2)
+    @patch('chatbot.rag.get_async_openai_client', new_callable=AsyncMock)
+    @patch('chatbot.rag.client')
+    def test_async_chat_gives_up_at_the_deadline(self, mock_openai_client, mock_get_async_client):
+        """
+        Test that a completion still pending at LLM_DEADLINE is cancelled and answered with the error message.
+        """
+        mock_openai_client.with_options.return_value = mock_openai_client
+        mock_openai_client.embeddings.create.side_effect = fake_embeddings_response
+
+        async def never_answers(**kwargs):
+            await asyncio.sleep(10)
+
+        mock_get_async_client.return_value.chat.completions.create = never_answers
+
+        data = json.dumps({'message': 'Which model classifies my photos?'})
+        response = self.client.post(reverse('chat_async'), data=data, content_type='application/json')
+
+        self.assertEqual(response.json(), {'response': rag.ERROR_MESSAGE})
+        self.assertIsNone(get_exact_answer("which model classifies my photos"))
+
+    def test_async_chat_validates_requests(self):
+        """
+        Test that the ASGI chat view rejects bad requests like the sync view.
+        """
+        url = reverse('chat_async')
+        self.assertEqual(self.client.post(url, data='not json', content_type='application/json').json(), {'error': 'Invalid JSON'})
+        self.assertEqual(self.client.post(url, data='{}', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
@@ -3,4 +3,6 @@ from . import views
 
 urlpatterns = [
     path('chat/', views.chat, name='chat'),
+    path('chat/stream/', views.chat_stream, name='chat_stream'),
+    path('chat/async/', views.chat_async, name='chat_async'),
 ]
@@ -0,0 +1,189 @@
+"""
+Cosine-similarity retrieval over the knowledge base embeddings.
+
+Vectors are normalized once when the index is built, so a query costs one
+matrix-vector product plus an `argpartition` for the top k. Above
+`ivf_threshold` rows the index also builds an inverted file (IVF): rows are
+clustered with k-means and a query only scores the rows of the `n_probe`
+clusters whose centroids are closest to it. That trades a little recall for
+search time that grows with roughly sqrt(n) instead of n.
+
+For large knowledge bases the vectors can also be held as float16 or int8
+codes (4x smaller than float32 with int8), with the final ranking computed
+in full precision.
+"""
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """Returns float32 rows scaled to unit length; rows that already are (or are all zero) are not copied."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    if np.allclose(norms[norms > 0], 1.0, atol=1e-3):
+        return matrix
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def kmeans(vectors, n_clusters, iterations=10, sample_size=50_000, seed=0):
+    """Spherical k-means on a sample of the rows; returns unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > sample_size:
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = sample[assignment == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+def quantize_int8(vectors):
+    """Symmetric per-row int8 quantization; returns (codes, scales) with vectors ~= codes * scales[:, None]."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class VectorIndex:
+    """
+    `precision` selects how the normalized vectors are held in memory:
+    "float32" keeps them as is; "float16" and "int8" (with one float32 scale
+    per row) keep a compact copy for the first-pass scan and re-rank the best
+    `rerank_factor * k` candidates against the original full-precision rows.
+    The original rows are only read for those candidates, so when they come
+    from the memory-mapped embedding store they stay out of resident memory.
+    """
+    BLOCK_ROWS = 8192
+    PRECISIONS = ("float32", "float16", "int8")
+
+    def __init__(self, embeddings, ivf_threshold=20_000, n_lists=None, n_probe=8, precision="float32", rerank_factor=4):
+        if precision not in self.PRECISIONS:
+            raise ValueError(f"Unknown vector precision '{precision}'; expected one of {self.PRECISIONS}.")
+        self.precision = precision
+        self.rerank_factor = rerank_factor
+        self.n_probe = n_probe
+        self.centroids = None
+        self.lists = None
+        if precision == "float32":
+            self.vectors = normalize_rows(embeddings)
+            self.size = len(self.vectors)
+        else:
+            self._build_compact(embeddings)
+        if self.size >= ivf_threshold:
+            self._build_ivf(n_lists or int(np.sqrt(self.size)))
+
+    def _build_compact(self, embeddings):
+        self.vectors = None
+        self.full = embeddings if isinstance(embeddings, np.ndarray) else np.asarray(embeddings, dtype=np.float32)
+        self.size = len(self.full)
+        self.full_norms = np.empty(self.size, dtype=np.float32)
+        code_dtype = np.float16 if self.precision == "float16" else np.int8
+        self.codes = np.empty(self.full.shape, dtype=code_dtype)
+        self.scales = np.empty(self.size, dtype=np.float32) if self.precision == "int8" else None
+        # Convert in blocks so building never holds a full float32 copy.
+        for start in range(0, self.size, self.BLOCK_ROWS):
+            block = np.asarray(self.full[start:start + self.BLOCK_ROWS], dtype=np.float32)
+            norms = np.linalg.norm(block, axis=1)
+            self.full_norms[start:start + len(block)] = norms
+            block = block / np.where(norms == 0, 1.0, norms)[:, None]
+            if self.scales is None:
+                self.codes[start:start + len(block)] = block
+            else:
+                codes, scales = quantize_int8(block)
+                self.codes[start:start + len(block)] = codes
+                self.scales[start:start + len(block)] = scales
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def is_approximate(self):
+        return self.centroids is not None
+
+    @property
+    def nbytes(self):
+        """Bytes held in memory by the index itself (not counting a memory-mapped source)."""
+        if self.vectors is not None:
+            arrays = [self.vectors] if not isinstance(self.vectors, np.memmap) else []
+        else:
+            arrays = [self.codes, self.full_norms] + ([self.scales] if self.scales is not None else [])
+        return sum(array.nbytes for array in arrays)
+
+    def _rows(self, rows):
+        """Normalized float32 rows for a slice or index array, decoded from the compact form if needed."""
+        if self.vectors is not None:
+            return self.vectors[rows]
+        block = self.codes[rows].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][:, None]
+        return block
+
+    def _compact_scores(self, query, rows):
+        # Scale the scores rather than the decoded rows: one multiply per row instead of per element.
+        scores = self.codes[rows].astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales[rows]
+        return scores
+
+    def _scores(self, query, rows=None):
+        if self.vectors is not None:
+            return self.vectors @ query if rows is None else self.vectors[rows] @ query
+        if rows is not None:
+            return self._compact_scores(query, rows)
+        # Decode block by block so a scan never materializes the whole matrix in float32.
+        return np.concatenate([
+            self._compact_scores(query, slice(start, start + self.BLOCK_ROWS))
+            for start in range(0, self.size, self.BLOCK_ROWS)
+        ])
+
+    def _build_ivf(self, n_lists, sample_size=50_000):
+        rng = np.random.default_rng(0)
+        sample = rng.choice(self.size, sample_size, replace=False) if self.size > sample_size else slice(None)
+        self.centroids = kmeans(self._rows(sample), min(n_lists, self.size))
+        assignment = np.empty(self.size, dtype=np.int64)
+        # Assign in chunks to bound the temporary score matrix.
+        for start in range(0, self.size, self.BLOCK_ROWS):
+            chunk = self._rows(slice(start, start + self.BLOCK_ROWS))
+            assignment[start:start + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def search(self, query, k=5, exact=False):
+        """Returns up to k (row, cosine similarity) pairs, most similar first."""
+        query = normalize_rows(query)
+        n_candidates = k if self.vectors is not None else k * self.rerank_factor
+        if not self.is_approximate or exact:
+            candidates = None
+            scores = self._scores(query)
+        else:
+            probes = top_k(self.centroids @ query, self.n_probe)
+            candidates = np.concatenate([self.lists[i] for i in probes])
+            scores = self._scores(query, candidates)
+        best = top_k(scores, n_candidates)
+        rows = best if candidates is None else candidates[best]
+        if self.vectors is not None:
+            return [(int(row), float(score)) for row, score in zip(rows, scores[best])]
+
+        # Re-rank the compact-scan candidates in full precision.
+        rows = np.sort(rows)  # Sorted reads are friendlier to a memory map.
+        full = np.asarray(self.full[rows], dtype=np.float32)
+        exact_scores = full @ query / np.where(self.full_norms[rows] == 0, 1.0, self.full_norms[rows])
+        return [(int(rows[i]), float(exact_scores[i])) for i in top_k(exact_scores, k)]
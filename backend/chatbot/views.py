@@ -1,7 +1,7 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view
-from .rag import get_rag_response
+from .rag import aget_rag_response, get_rag_response, stream_rag_response
 import json
 
 @csrf_exempt
@@ -21,3 +21,51 @@ def chat(request):
             return JsonResponse({'error': 'Invalid JSON'}, status=400)
     else:
         return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+@csrf_exempt
+@api_view(['POST'])
+def chat_stream(request):
+    """
+    Streaming variant of `chat`: the reply is sent as server-sent events while
+    it is generated. Each event carries {"token": ...}; a final `done` event
+    closes the stream.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    user_message = data.get('message')
+    if not user_message:
+        return JsonResponse({'error': 'No message provided'}, status=400)
+
+    def events():
+        for token in stream_rag_response(user_message):
+            yield f"data: {json.dumps({'token': token})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keeps nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def chat_async(request):
+    """
+    Same contract as `chat`, written for the ASGI entry point: waiting on the
+    embeddings and completion APIs does not tie up a worker thread.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    user_message = data.get('message')
+    if not user_message:
+        return JsonResponse({'error': 'No message provided'}, status=400)
+    return JsonResponse({'response': await aget_rag_response(user_message)})
+
+# Django 3.2's csrf_exempt decorator does not support coroutine views; set the flag directly.
+chat_async.csrf_exempt = True
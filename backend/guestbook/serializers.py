@@ -1,7 +1,6 @@
 from rest_framework import serializers
 from .models import GuestbookEntry
 from django.contrib.auth.models import User
-from allauth.socialaccount.models import SocialAccount # <--- IMPORT THIS
 
 # This serializer will be used to get the current user's information.
 class UserSerializer(serializers.ModelSerializer):
@@ -15,13 +14,15 @@ class UserSerializer(serializers.ModelSerializer):
 
     # This function tells the serializer how to get the value for 'avatar_url'.
     def get_avatar_url(self, obj): # <--- ADD THIS ENTIRE FUNCTION
-        try:
-            # Look up the social account linked to this user from the 'github' provider.
-            social_account = SocialAccount.objects.get(user=obj, provider='github')
-            return social_account.get_avatar_url()
-        except SocialAccount.DoesNotExist:
-            # If the user isn't logged in via GitHub, return nothing for the avatar.
-            return None
+        # Look up the social account linked to this user from the 'github' provider.
+        # Going through `socialaccount_set` reuses accounts prefetched with
+        # prefetch_related('socialaccount_set'), so serializing many users stays one query.
+        for social_account in obj.socialaccount_set.all():
+            if social_account.provider == 'github':
+                # Same value as social_account.get_avatar_url(), without the provider's SocialApp query.
+                return social_account.extra_data.get('avatar_url')
+        # If the user isn't logged in via GitHub, return nothing for the avatar.
+        return None
 
 # This serializer handles the guestbook entries.
 class GuestbookEntrySerializer(serializers.ModelSerializer):
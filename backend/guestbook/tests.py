@@ -1,3 +1,61 @@
+from allauth.socialaccount.models import SocialAccount
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from .models import GuestbookEntry
+from .serializers import UserSerializer
+
+
+class GuestbookQueryCountTest(TestCase):
+    def create_user(self, username, github=True):
+        user = User.objects.create_user(username=username, password='password')
+        if github:
+            SocialAccount.objects.create(
+                user=user, provider='github', uid=username,
+                extra_data={'avatar_url': f'https://avatars.example.com/{username}'},
+            )
+        return user
+
+    def test_entry_list_runs_one_query_for_any_number_of_entries(self):
+        """
+        Test that listing entries joins their authors instead of querying each one.
+        """
+        for i in range(5):
+            GuestbookEntry.objects.create(user=self.create_user(f'guest{i}'), message=f'Hello {i}')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('guestbook_list'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['user'] for entry in response.json()], [f'guest{i}' for i in reversed(range(5))])
+
+    def test_user_serializer_uses_prefetched_social_accounts(self):
+        """
+        Test that serializing many users with prefetched accounts doesn't query per user.
+        """
+        for i in range(4):
+            self.create_user(f'guest{i}', github=i % 2 == 0)
+
+        with self.assertNumQueries(2):
+            users = User.objects.prefetch_related('socialaccount_set').order_by('username')
+            data = UserSerializer(users, many=True).data
+
+        self.assertEqual([user['avatar_url'] for user in data], [
+            'https://avatars.example.com/guest0', None, 'https://avatars.example.com/guest2', None,
+        ])
+
+    def test_current_user_runs_a_fixed_number_of_queries(self):
+        """
+        Test that the current user endpoint returns the GitHub avatar with one avatar query.
+        """
+        user = self.create_user('octocat')
+        self.client.force_login(user)
+
+        # Session and user lookups, plus one query for the social accounts.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('current_user'))
+
+        self.assertEqual(response.json(), {
+            'id': user.id, 'username': 'octocat', 'avatar_url': 'https://avatars.example.com/octocat',
+        })
@@ -5,7 +5,8 @@ from .serializers import GuestbookEntrySerializer, UserSerializer
 # --- View to LIST all guestbook entries ---
 # This endpoint is public and can be accessed by anyone.
 class GuestbookEntryList(generics.ListAPIView):
-    queryset = GuestbookEntry.objects.all().order_by('-created_at')
+    # The author is joined into the same query, so listing N entries doesn't run N user queries.
+    queryset = GuestbookEntry.objects.select_related('user').order_by('-created_at')
     serializer_class = GuestbookEntrySerializer
     permission_classes = [permissions.AllowAny]
 
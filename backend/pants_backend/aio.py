@@ -0,0 +1,39 @@
+"""
+Async clients scoped to the event loop that created them.
+
+httpx async clients keep connections bound to one event loop, so ASGI code
+keeps one client per loop. A loop can be discarded while its clients are
+still open: `async_to_sync` runs a fresh loop per call when no loop is
+running. `LoopClients` closes each client when its loop shuts down, so
+their connections and transports are not leaked.
+"""
+import asyncio
+import weakref
+
+
+async def _close_on_shutdown(client):
+    # Suspended async generators are finalized by loop.shutdown_asyncgens(),
+    # which asyncio.run() (used by asgiref and uvicorn) calls before closing the loop.
+    try:
+        yield
+    finally:
+        # httpx clients have aclose(); the OpenAI SDK's async close() is a coroutine.
+        await (client.aclose() if hasattr(client, "aclose") else client.close())
+
+
+class LoopClients:
+    """One client per running event loop (and per argument tuple), built by `factory(*args)`."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._clients = weakref.WeakKeyDictionary()
+
+    async def get(self, *args):
+        clients = self._clients.setdefault(asyncio.get_running_loop(), {})
+        if args not in clients:
+            client = self.factory(*args)
+            closer = _close_on_shutdown(client)
+            # The loop only tracks the generator weakly, so keep it alive next to the client.
+            clients[args] = (client, closer)
+            await closer.__anext__()
+        return clients[args][0]
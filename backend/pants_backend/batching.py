@@ -0,0 +1,87 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many request threads and hands them to
+    `batch_fn` as one list, so concurrent requests share a single call.
+
+    `batch_fn` receives a list of items and must return a list of results in
+    the same order. A batch is flushed as soon as it holds `max_batch_size`
+    items, or `max_wait` seconds after its first item arrived.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait=0.01, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self.name = name
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """Queues a single item and returns a Future for its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        """Blocks until the result for `item` is available."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        # Block for the first item, then keep pulling until the batch is full
+        # or the wait window opened by that first item has closed.
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Processing happens in a separate frame so no references to the
+            # items (e.g. views on shared memory) outlive their batch.
+            self._process(self._collect())
+
+    def _process(self, batch):
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        del batch
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"{self.name}: batch function returned {len(results)} results for {len(items)} items"
+                )
+        except Exception as e:
+            logger.error(f"{self.name}: batch of {len(items)} failed: {e}")
+            for future in futures:
+                future.set_exception(e)
+            return
+        # Drop the items before waking the callers, who may free them.
+        del items
+        for future, result in zip(futures, results):
+            future.set_result(result)
@@ -0,0 +1,131 @@
+"""
+Shared LLM clients: OpenAI for the chatbot, Gemini for recipe generation.
+
+Each provider has one client per process, instead of one per call site or
+request. Async clients are kept one per event loop and closed with it (see
+pants_backend/aio.py).
+
+- HTTP connections are reused from a bounded httpx pool of LLM_POOL_SIZE.
+  A slow provider can hold at most that many connections. Callers waiting
+  longer than LLM_POOL_TIMEOUT for a free connection fail fast instead of
+  piling up in the worker pool.
+- Each attempt gets LLM_CONNECT_TIMEOUT to connect. It may then wait up to
+  LLM_TIMEOUT for each read; this bounds stalls, not the whole response.
+- Connection errors, 408, 429 and 5xx responses are retried at most
+  LLM_MAX_RETRIES times with jittered exponential backoff. The SDKs' own
+  retry loops do this.
+- LLM_DEADLINE bounds a whole call, retries included. Blocking calls made
+  through `call_with_deadline` (or awaited with asyncio.wait_for) give up
+  when it passes; streams are checked between chunks by `iter_with_deadline`,
+  so they can overrun it by at most one read.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import lru_cache
+
+import httpx
+import openai
+from django.conf import settings
+from google import genai
+from google.genai import types
+
+from .aio import LoopClients
+
+
+def http_timeout():
+    return httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT, pool=settings.LLM_POOL_TIMEOUT)
+
+
+def http_limits():
+    return httpx.Limits(max_connections=settings.LLM_POOL_SIZE, max_keepalive_connections=settings.LLM_POOL_SIZE)
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    pass
+
+
+@lru_cache(maxsize=1)
+def get_call_executor():
+    # Calls past their deadline keep running here until the SDK gives up; the
+    # connection pool already bounds how many can be in flight.
+    return ThreadPoolExecutor(max_workers=settings.LLM_POOL_SIZE, thread_name_prefix="llm-call")
+
+
+def call_with_deadline(fn, *args, **kwargs):
+    """Returns fn(*args, **kwargs), raising LLMDeadlineExceeded if it takes longer than LLM_DEADLINE."""
+    future = get_call_executor().submit(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=settings.LLM_DEADLINE)
+    except FutureTimeoutError:
+        raise LLMDeadlineExceeded(f"No response within {settings.LLM_DEADLINE} s.") from None
+
+
+def iter_with_deadline(chunks, started=None):
+    """
+    Yields from `chunks`, raising LLMDeadlineExceeded once LLM_DEADLINE has
+    passed since `started` (a time.monotonic() value, by default the first chunk request).
+    """
+    deadline = (time.monotonic() if started is None else started) + settings.LLM_DEADLINE
+    for chunk in chunks:
+        if time.monotonic() > deadline:
+            raise LLMDeadlineExceeded(f"The response took longer than {settings.LLM_DEADLINE} s.")
+        yield chunk
+
+
+# --- OpenAI ---
+@lru_cache(maxsize=None)
+def get_openai_client(api_key):
+    return openai.OpenAI(
+        api_key=api_key,
+        timeout=http_timeout(),
+        max_retries=settings.LLM_MAX_RETRIES,
+        http_client=httpx.Client(timeout=http_timeout(), limits=http_limits()),
+    )
+
+
+def build_async_openai_client(api_key):
+    return openai.AsyncOpenAI(
+        api_key=api_key,
+        timeout=http_timeout(),
+        max_retries=settings.LLM_MAX_RETRIES,
+        http_client=httpx.AsyncClient(timeout=http_timeout(), limits=http_limits()),
+    )
+
+
+# Async clients hold connections bound to the loop that created them.
+async_openai_clients = LoopClients(build_async_openai_client)
+
+
+async def get_async_openai_client(api_key):
+    return await async_openai_clients.get(api_key)
+
+
+# --- Gemini ---
+def gemini_http_options(**client):
+    return types.HttpOptions(
+        timeout=int(settings.LLM_TIMEOUT * 1000),  # milliseconds
+        retry_options=types.HttpRetryOptions(attempts=settings.LLM_MAX_RETRIES + 1, jitter=1.0),
+        **client,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_gemini_client(api_key):
+    http_client = httpx.Client(timeout=http_timeout(), limits=http_limits())
+    return genai.Client(api_key=api_key, http_options=gemini_http_options(httpx_client=http_client))
+
+
+def gemini_generate(model, prompt):
+    """Returns the full text Gemini generates for `prompt`."""
+    client = get_gemini_client(settings.GEMINI_API_KEY)
+    return call_with_deadline(client.models.generate_content, model=model, contents=prompt).text
+
+
+def gemini_stream(model, prompt):
+    """Yields the text Gemini generates for `prompt` chunk by chunk."""
+    client = get_gemini_client(settings.GEMINI_API_KEY)
+    for chunk in iter_with_deadline(client.models.generate_content_stream(model=model, contents=prompt)):
+        if chunk.text:
+            yield chunk.text
+
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -81,6 +82,11 @@ TIME_ZONE = 'UTC'
 USE_I18N = True
 USE_TZ = True
 
+# Stream every upload to a temporary file instead of buffering small ones in memory.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
@@ -100,6 +106,112 @@ CSRF_TRUSTED_ORIGINS = [
 USDA_API_KEY = os.getenv("USDA_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# --- Image analyzer inference ---
+ANALYZER_MODEL_NAME = os.getenv("ANALYZER_MODEL_NAME", "nateraw/food")
+# "pytorch" runs the transformers pipeline; "onnx" runs an int8-quantized export on
+# ONNX Runtime (create it with `manage.py export_onnx_model`); "remote" is described below.
+ANALYZER_INFERENCE_BACKEND = os.getenv("ANALYZER_INFERENCE_BACKEND", "pytorch")
+ANALYZER_ONNX_MODEL_PATH = os.getenv("ANALYZER_ONNX_MODEL_PATH", os.path.join(BASE_DIR, 'analyzer', 'data', 'food-int8.onnx'))
+# "remote" sends preprocessed tensors to a shared `manage.py run_inference_server` process
+# on this Unix socket, so web workers do not each hold a copy of the model.
+ANALYZER_INFERENCE_SOCKET = os.getenv("ANALYZER_INFERENCE_SOCKET", "/tmp/eden-inference.sock")
+ANALYZER_INFERENCE_TIMEOUT = float(os.getenv("ANALYZER_INFERENCE_TIMEOUT", "30"))
+# The model is loaded lazily on first use. Set this in web workers to load and warm it
+# up in the background at startup; /api/analyze/ready/ reports when it is done.
+ANALYZER_WARMUP_ON_STARTUP = os.getenv("ANALYZER_WARMUP_ON_STARTUP", "false").lower() == "true"
+# Concurrent uploads are grouped into one batched forward pass. A batch is
+# flushed when it is full or when the wait window (milliseconds) has elapsed.
+ANALYZER_BATCH_MAX_SIZE = int(os.getenv("ANALYZER_BATCH_MAX_SIZE", "8"))
+ANALYZER_BATCH_MAX_WAIT_MS = float(os.getenv("ANALYZER_BATCH_MAX_WAIT_MS", "10"))
+# Uploads are decoded close to this edge length (the model itself uses 224px)
+# and rejected before decoding if they exceed the byte or pixel-count limits.
+ANALYZER_DECODE_SIZE = int(os.getenv("ANALYZER_DECODE_SIZE", "448"))
+ANALYZER_MAX_UPLOAD_BYTES = int(os.getenv("ANALYZER_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+ANALYZER_MAX_IMAGE_PIXELS = int(os.getenv("ANALYZER_MAX_IMAGE_PIXELS", str(64_000_000)))
+# Batch endpoint: images decoded in parallel and the most images accepted per request.
+ANALYZER_DECODE_WORKERS = int(os.getenv("ANALYZER_DECODE_WORKERS", "4"))
+ANALYZER_BATCH_MAX_IMAGES = int(os.getenv("ANALYZER_BATCH_MAX_IMAGES", "1000"))
+# Django rejects multipart requests with more files than this before the view runs,
+# so it follows the batch limit (plus the optional archive field).
+DATA_UPLOAD_MAX_NUMBER_FILES = ANALYZER_BATCH_MAX_IMAGES + 1
+# Number of top predictions returned with their own nutrition data.
+ANALYZER_TOP_K = int(os.getenv("ANALYZER_TOP_K", "3"))
+# Per-process cache of analysis results for repeated uploads. Images whose perceptual
+# hashes differ by at most this many bits (out of 64) count as the same photo; -1 disables it.
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "512"))
+ANALYSIS_CACHE_HAMMING_THRESHOLD = int(os.getenv("ANALYSIS_CACHE_HAMMING_THRESHOLD", "5"))
+
+# --- USDA HTTP client (seconds) ---
+USDA_CONNECT_TIMEOUT = float(os.getenv("USDA_CONNECT_TIMEOUT", "3.05"))
+USDA_READ_TIMEOUT = float(os.getenv("USDA_READ_TIMEOUT", "10"))
+USDA_MAX_RETRIES = int(os.getenv("USDA_MAX_RETRIES", "2"))
+USDA_POOL_SIZE = int(os.getenv("USDA_POOL_SIZE", "10"))
+
+# --- USDA nutrition cache (seconds / rows) ---
+# Misses are cached for a shorter time so newly added USDA foods are picked up.
+NUTRITION_CACHE_TTL = int(os.getenv("NUTRITION_CACHE_TTL", str(30 * 24 * 3600)))
+NUTRITION_CACHE_NEGATIVE_TTL = int(os.getenv("NUTRITION_CACHE_NEGATIVE_TTL", str(24 * 3600)))
+NUTRITION_CACHE_MAX_ENTRIES = int(os.getenv("NUTRITION_CACHE_MAX_ENTRIES", "5000"))
+# Offline nutrient table for every classifier label, written by `manage.py build_nutrition_table`.
+NUTRITION_TABLE_PATH = os.getenv("NUTRITION_TABLE_PATH", os.path.join(BASE_DIR, 'analyzer', 'data', 'nutrition_table.json'))
+
+# --- Shared LLM clients (seconds) ---
+# One pooled client per provider. LLM_TIMEOUT bounds each read and LLM_POOL_TIMEOUT the wait for one of
+# the LLM_POOL_SIZE connections; failed calls are retried LLM_MAX_RETRIES times with jitter. LLM_DEADLINE
+# bounds a whole call, retries included (streams are checked between chunks).
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "5"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "90"))
+
+# --- Recipe generation ---
+GEMINI_RECIPE_MODEL = os.getenv("GEMINI_RECIPE_MODEL", "gemini-pro")
+# Recipes per category are kept in the local catalog, shared by all workers, and fresh for
+# RECIPE_CACHE_TTL seconds after they were generated; after that they are served while one
+# refresh runs. Each process mirrors them in the default Django cache for RECIPE_CACHE_MIRROR_TTL.
+RECIPE_CACHE_TTL = int(os.getenv("RECIPE_CACHE_TTL", str(6 * 3600)))
+RECIPE_CACHE_MIRROR_TTL = int(os.getenv("RECIPE_CACHE_MIRROR_TTL", "60"))
+
+# --- Chatbot ---
+# Knowledge base embeddings, memory-mapped by every worker and recomputed only for changed documents.
+CHATBOT_EMBEDDING_DIR = os.getenv("CHATBOT_EMBEDDING_DIR", os.path.join(BASE_DIR, 'chatbot', 'data', 'embeddings'))
+# Passages added to the knowledge base by `manage.py ingest_documents`.
+CHATBOT_KNOWLEDGE_PATH = os.getenv("CHATBOT_KNOWLEDGE_PATH", os.path.join(BASE_DIR, 'chatbot', 'data', 'knowledge.json'))
+# "openai" embeds each question with the embeddings API (keyword search is the fallback when
+# that fails); "local" retrieves with an in-process BM25 index, fused with a CPU sentence-transformers
+# model when CHATBOT_LOCAL_EMBEDDING_MODEL is set (e.g. "sentence-transformers/all-MiniLM-L6-v2").
+CHATBOT_RETRIEVAL_MODE = os.getenv("CHATBOT_RETRIEVAL_MODE", "openai")
+CHATBOT_LOCAL_EMBEDDING_MODEL = os.getenv("CHATBOT_LOCAL_EMBEDDING_MODEL", "")
+CHATBOT_MIN_KEYWORD_SCORE = float(os.getenv("CHATBOT_MIN_KEYWORD_SCORE", "1.0"))
+# Questions whose words overlap a KNOWLEDGE_BASE key at least this much (Jaccard, stopwords
+# ignored) are answered with that entry directly, without any API call; -1 disables it.
+CHATBOT_FAST_PATH_THRESHOLD = float(os.getenv("CHATBOT_FAST_PATH_THRESHOLD", "0.8"))
+# Concurrent questions are embedded together: a batch is sent when it is full or when the
+# wait window (milliseconds) has elapsed. Past the timeout (seconds) retrieval falls back to keywords.
+CHATBOT_QUERY_BATCH_MAX_SIZE = int(os.getenv("CHATBOT_QUERY_BATCH_MAX_SIZE", "32"))
+CHATBOT_QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("CHATBOT_QUERY_BATCH_MAX_WAIT_MS", "10"))
+CHATBOT_QUERY_EMBED_TIMEOUT = float(os.getenv("CHATBOT_QUERY_EMBED_TIMEOUT", "10"))
+# Up to CHATBOT_CONTEXT_PASSAGES passages with at least this cosine similarity go into the prompt.
+CHATBOT_CONTEXT_PASSAGES = int(os.getenv("CHATBOT_CONTEXT_PASSAGES", "3"))
+CHATBOT_MIN_SIMILARITY = float(os.getenv("CHATBOT_MIN_SIMILARITY", "0.75"))
+# Knowledge bases with at least this many passages are searched through an approximate
+# IVF index that scores only the CHATBOT_IVF_PROBES closest clusters.
+CHATBOT_IVF_THRESHOLD = int(os.getenv("CHATBOT_IVF_THRESHOLD", "20000"))
+CHATBOT_IVF_PROBES = int(os.getenv("CHATBOT_IVF_PROBES", "8"))
+# "float16" or "int8" keep a compact in-memory copy of the vectors for the similarity scan and
+# re-rank the best candidates against the memory-mapped float32 store; "float32" scans the store directly.
+CHATBOT_VECTOR_PRECISION = os.getenv("CHATBOT_VECTOR_PRECISION", "float32")
+# Answers are reused for the same normalized question, or for a question whose embedding is
+# within this cosine distance of a cached one (-1 disables the semantic match). Shared via the database.
+CHATBOT_ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("CHATBOT_ANSWER_CACHE_MAX_DISTANCE", "0.05"))
+CHATBOT_ANSWER_CACHE_TTL = int(os.getenv("CHATBOT_ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+CHATBOT_ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("CHATBOT_ANSWER_CACHE_MAX_ENTRIES", "2000"))
+
+# Lock files used to coalesce identical concurrent LLM requests across worker processes.
+SINGLEFLIGHT_DIR = os.getenv("SINGLEFLIGHT_DIR", os.path.join(tempfile.gettempdir(), "eden-singleflight"))
+
 # --- ADDED: These settings are required for allauth ---
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
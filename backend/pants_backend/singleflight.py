@@ -0,0 +1,172 @@
+"""
+Single-flight coalescing for expensive upstream calls (LLM generations).
+
+Concurrent calls with the same key share one execution. Within a process the
+first caller runs the function and the rest wait on its result. Across
+processes the caller that runs it holds an exclusive lock file for the key,
+and writes the result next to it before releasing. Callers in other processes
+that were already waiting on the lock pick that result up instead of calling
+upstream again. A result is only reused by callers whose wait started before
+it was written, so this coalesces concurrent requests without turning into a
+cache.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process coalescing only.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Lock and result files older than this are removed by prune(), which each
+# SingleFlight runs after a call at most once every PRUNE_INTERVAL seconds.
+STALE_FILE_AGE = 3600
+PRUNE_INTERVAL = 600
+
+
+def fingerprint(*parts):
+    """Stable key for a request made of JSON-serializable parts."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, lock_dir=None, prune_interval=PRUNE_INTERVAL):
+        self._lock_dir = lock_dir
+        self.prune_interval = prune_interval  # None disables automatic pruning.
+        self._pruned_at = time.monotonic()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def lock_dir(self):
+        if self._lock_dir is None:
+            from django.conf import settings
+
+            return settings.SINGLEFLIGHT_DIR
+        return self._lock_dir
+
+    def do(self, key, fn):
+        """Returns fn(), sharing one execution among concurrent callers with the same key."""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._run_across_processes(key, fn)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _run_across_processes(self, key, fn):
+        if fcntl is None:
+            return fn()
+        result_path = os.path.join(self.lock_dir, f"{key}.json")
+        waiting_since = time.time()
+        try:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            lock_file = self._lock_file(os.path.join(self.lock_dir, f"{key}.lock"))
+        except OSError as e:
+            logger.warning(f"Single-flight lock unavailable, running without it: {e}")
+            return fn()
+
+        with lock_file:
+            try:
+                shared = self._read_result(result_path, waiting_since)
+                if shared is not None:
+                    return shared["result"]
+                result = fn()
+                self._write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._prune_if_due()
+
+    @staticmethod
+    def _lock_file(path):
+        """Opens and exclusively locks `path`, retrying if it was pruned while we waited."""
+        while True:
+            lock_file = open(path, "a+")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # A pruned file is unlinked while locked; its waiters must lock the new file instead.
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(path).st_ino:
+                    os.utime(path)  # Marks the lock as recently used for prune().
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    @staticmethod
+    def _read_result(path, waiting_since):
+        try:
+            with open(path, encoding="utf-8") as f:
+                shared = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return shared if shared.get("written_at", 0) >= waiting_since else None
+
+    @staticmethod
+    def _write_result(path, result):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"written_at": time.time(), "result": result}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            # Results that cannot be shared still reach the in-process waiters.
+            logger.warning(f"Could not share single-flight result: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _prune_if_due(self):
+        if self.prune_interval is None:
+            return
+        with self._lock:
+            if time.monotonic() - self._pruned_at < self.prune_interval:
+                return
+            self._pruned_at = time.monotonic()
+        self.prune()
+
+    def prune(self):
+        """Removes lock and result files not used for STALE_FILE_AGE seconds, skipping locks that are held."""
+        cutoff = time.time() - STALE_FILE_AGE
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if not name.endswith(".lock"):
+                    os.remove(path)
+                    continue
+                # Only remove lock files nobody holds, and remove them while holding the lock.
+                with open(path, "a+") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+            except OSError:
+                pass
+
+
+# Shared by every LLM call site (recipe generation, chatbot answers).
+llm_requests = SingleFlight()
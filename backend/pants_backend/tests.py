@@ -0,0 +1,337 @@
+import asyncio
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import httpx
+from django.test import SimpleTestCase, override_settings
+
+from . import llm
+from .aio import LoopClients
+from .batching import MicroBatcher
+from .singleflight import SingleFlight, fingerprint
+
+
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.lock_dir = tmp_dir.name
+
+    def run_concurrently(self, targets):
+        threads = [threading.Thread(target=target) for target in targets]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+
+    def test_concurrent_calls_share_one_execution(self):
+        """
+        Test that concurrent callers with the same key wait on a single call and get its result.
+        """
+        group = SingleFlight(self.lock_dir)
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def slow_call():
+            calls.append(1)
+            release.wait(timeout=5)
+            return {"answer": 42}
+
+        def caller():
+            results.append(group.do("same", slow_call))
+
+        threads = [threading.Thread(target=caller) for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join(timeout=5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"answer": 42}] * 5)
+
+    def test_waiters_in_another_process_reuse_the_result(self):
+        """
+        Test that a caller blocked on the lock file (as another process would be) reuses the shared result.
+        """
+        # Separate instances share nothing in memory, like two worker processes.
+        leader, follower = SingleFlight(self.lock_dir), SingleFlight(self.lock_dir)
+        started, release = threading.Event(), threading.Event()
+        follower_calls = []
+        results = {}
+
+        def leader_call():
+            started.set()
+            release.wait(timeout=5)
+            return "generated once"
+
+        def run_leader():
+            results["leader"] = leader.do("key", leader_call)
+
+        def run_follower():
+            started.wait(timeout=5)
+            threading.Timer(0.1, release.set).start()
+            results["follower"] = follower.do("key", lambda: follower_calls.append(1) or "generated twice")
+
+        self.run_concurrently([run_leader, run_follower])
+        self.assertEqual(results, {"leader": "generated once", "follower": "generated once"})
+        self.assertEqual(follower_calls, [])
+
+    def test_later_calls_run_again(self):
+        """
+        Test that a call made after the previous one finished is not served the old result.
+        """
+        group = SingleFlight(self.lock_dir)
+        self.assertEqual(group.do("key", lambda: 1), 1)
+        self.assertEqual(group.do("key", lambda: 2), 2)
+
+    def test_prune_keeps_lock_files_that_are_held(self):
+        """
+        Test that pruning removes stale files but never a lock file another caller holds.
+        """
+        group = SingleFlight(self.lock_dir)
+        lock_path = os.path.join(self.lock_dir, "key.lock")
+        result_path = os.path.join(self.lock_dir, "key.json")
+
+        def call_while_pruning():
+            os.utime(lock_path, (0, 0))
+            group.prune()
+            return os.path.exists(lock_path)
+
+        self.assertTrue(group.do("key", call_while_pruning))
+        os.utime(lock_path, (0, 0))
+        os.utime(result_path, (0, 0))
+        group.prune()
+        self.assertEqual(os.listdir(self.lock_dir), [])
+
+    def test_calls_prune_once_per_interval(self):
+        """
+        Test that stale files are pruned after a call only once the prune interval has passed.
+        """
+        group = SingleFlight(self.lock_dir, prune_interval=60)
+        stale_path = os.path.join(self.lock_dir, "old.json")
+        open(stale_path, "w").close()
+        os.utime(stale_path, (0, 0))
+
+        group.do("key", lambda: 1)
+        self.assertTrue(os.path.exists(stale_path))
+
+        group._pruned_at -= 60
+        group.do("key", lambda: 2)
+        self.assertFalse(os.path.exists(stale_path))
+
+    def test_waiters_relock_a_pruned_lock_file(self):
+        """
+        Test that a caller whose lock file was removed while it waited locks the new file instead.
+        """
+        lock_path = os.path.join(self.lock_dir, "key.lock")
+        with open(lock_path, "a+") as held:
+            fcntl.flock(held, fcntl.LOCK_EX)
+            acquired = []
+            waiter = threading.Thread(target=lambda: acquired.append(SingleFlight._lock_file(lock_path)))
+            waiter.start()
+            time.sleep(0.1)
+            os.remove(lock_path)
+            fcntl.flock(held, fcntl.LOCK_UN)
+            waiter.join(timeout=5)
+        with acquired[0]:
+            self.assertEqual(os.fstat(acquired[0].fileno()).st_ino, os.stat(lock_path).st_ino)
+
+    def test_errors_reach_every_waiter(self):
+        """
+        Test that an exception from the shared call is raised in every waiting caller.
+        """
+        group = SingleFlight(self.lock_dir)
+        release = threading.Event()
+        errors = []
+
+        def failing_call():
+            release.wait(timeout=5)
+            raise RuntimeError("upstream down")
+
+        def caller():
+            try:
+                group.do("key", failing_call)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=caller) for _ in range(3)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join(timeout=5)
+        self.assertEqual(errors, ["upstream down"] * 3)
+
+    def test_fingerprint_is_stable(self):
+        """
+        Test that fingerprints depend only on the request parts.
+        """
+        self.assertEqual(fingerprint("rag", {"b": 1, "a": 2}), fingerprint("rag", {"a": 2, "b": 1}))
+        self.assertNotEqual(fingerprint("rag", "hi"), fingerprint("recipes", "hi"))
+
+
+class MicroBatcherTest(SimpleTestCase):
+    def test_concurrent_items_share_one_batch(self):
+        """
+        Test that items submitted together are passed to the batch function as one list
+        and that every caller gets back its own result.
+        """
+        calls = []
+
+        def batch_fn(items):
+            calls.append(list(items))
+            return [item * 10 for item in items]
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait=0.5)
+        futures = [batcher.submit(i) for i in range(4)]
+
+        self.assertEqual([f.result(timeout=2) for f in futures], [0, 10, 20, 30])
+        self.assertEqual(calls, [[0, 1, 2, 3]])
+
+    def test_batch_is_flushed_after_max_wait(self):
+        """
+        Test that a partial batch is flushed once the wait window closes.
+        """
+        batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_batch_size=16, max_wait=0.01)
+        self.assertEqual(batcher(1, timeout=2), 2)
+
+    def test_batch_errors_reach_every_caller(self):
+        """
+        Test that an exception raised by the batch function is propagated to each waiting caller.
+        """
+        def batch_fn(items):
+            raise ValueError("model exploded")
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait=0.5)
+        futures = [batcher.submit(i) for i in range(2)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=2)
+
+    def test_results_routed_from_many_threads(self):
+        """
+        Test that results are routed back to the thread that submitted each item.
+        """
+        batcher = MicroBatcher(lambda items: [item * item for item in items], max_batch_size=8, max_wait=0.02)
+        results = {}
+
+        def worker(n):
+            results[n] = batcher(n, timeout=2)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, {n: n * n for n in range(20)})
+
+
+@override_settings(LLM_TIMEOUT=12, LLM_CONNECT_TIMEOUT=2, LLM_POOL_TIMEOUT=1, LLM_POOL_SIZE=3, LLM_MAX_RETRIES=4)
+class LLMClientTest(SimpleTestCase):
+    def setUp(self):
+        llm.get_openai_client.cache_clear()
+        llm.get_gemini_client.cache_clear()
+        self.addCleanup(llm.get_openai_client.cache_clear)
+        self.addCleanup(llm.get_gemini_client.cache_clear)
+
+    def test_openai_client_is_shared_and_bounded(self):
+        """
+        Test that one OpenAI client per key is reused, with timeouts and bounded retries.
+        """
+        client = llm.get_openai_client("test-key")
+        self.assertIs(llm.get_openai_client("test-key"), client)
+        self.assertEqual(client.max_retries, 4)
+        self.assertEqual((client.timeout.read, client.timeout.connect, client.timeout.pool), (12, 2, 1))
+
+    def test_async_clients_are_per_event_loop(self):
+        """
+        Test that async clients are reused within an event loop and closed along with it.
+        """
+        async def get_twice():
+            return await llm.get_async_openai_client("test-key"), await llm.get_async_openai_client("test-key")
+
+        first, again = asyncio.run(get_twice())
+        self.assertIs(first, again)
+        self.assertEqual(first.max_retries, 4)
+        self.assertTrue(first.is_closed())
+
+    @patch('pants_backend.llm.genai')
+    def test_gemini_client_is_reused_with_timeout_and_retries(self, mock_genai):
+        """
+        Test that Gemini is configured once per process with a timeout and jittered retries.
+        """
+        self.assertIs(llm.get_gemini_client("test-key"), llm.get_gemini_client("test-key"))
+        mock_genai.Client.assert_called_once()
+        options = mock_genai.Client.call_args.kwargs["http_options"]
+        self.assertEqual(options.timeout, 12000)
+        self.assertEqual(options.retry_options.attempts, 5)
+        self.assertTrue(options.retry_options.jitter)
+
+    @override_settings(GEMINI_API_KEY="test-key")
+    @patch('pants_backend.llm.genai')
+    def test_gemini_stream_yields_text_chunks(self, mock_genai):
+        """
+        Test that streamed chunks without text are skipped.
+        """
+        mock_genai.Client.return_value.models.generate_content_stream.return_value = [
+            MagicMock(text="[{"), MagicMock(text=None), MagicMock(text="}]"),
+        ]
+        self.assertEqual(list(llm.gemini_stream("gemini-test", "prompt")), ["[{", "}]"])
+
+    @override_settings(LLM_DEADLINE=0.2)
+    def test_calls_past_the_deadline_are_abandoned(self):
+        """
+        Test that a blocking call still running at LLM_DEADLINE raises instead of holding the caller.
+        """
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.assertEqual(llm.call_with_deadline(lambda x: x * 2, 21), 42)
+
+        start = time.monotonic()
+        with self.assertRaises(llm.LLMDeadlineExceeded):
+            llm.call_with_deadline(release.wait, 5)
+        self.assertLess(time.monotonic() - start, 2)
+
+    @override_settings(GEMINI_API_KEY="test-key", LLM_DEADLINE=0.2)
+    @patch('pants_backend.llm.genai')
+    def test_streams_stop_at_the_deadline(self, mock_genai):
+        """
+        Test that a stream that keeps trickling chunks is cut off once LLM_DEADLINE has passed.
+        """
+        def trickle():
+            while True:
+                time.sleep(0.05)
+                yield MagicMock(text="x")
+
+        mock_genai.Client.return_value.models.generate_content_stream.return_value = trickle()
+        chunks = []
+        with self.assertRaises(llm.LLMDeadlineExceeded):
+            for chunk in llm.gemini_stream("gemini-test", "prompt"):
+                chunks.append(chunk)
+        self.assertTrue(1 <= len(chunks) <= 5)
+
+
+class LoopClientsTest(SimpleTestCase):
+    def test_clients_are_reused_per_loop_and_closed_with_it(self):
+        """
+        Test that a client is shared within one event loop and closed when that loop shuts down.
+        """
+        clients = LoopClients(lambda: httpx.AsyncClient())
+
+        async def get_twice():
+            return await clients.get(), await clients.get()
+
+        first, again = asyncio.run(get_twice())
+        self.assertIs(first, again)
+        self.assertTrue(first.is_closed)
+
+        second, _ = asyncio.run(get_twice())
+        self.assertIsNot(second, first)